@@ -0,0 +1,51 @@
+# Libraries
+import contextvars, time, openai
+from colorama import Fore
+from tqdm import tqdm
+from modules import backoff, config, metrics, mock, ratelimit
+
+# Every translateText goes through here so shared limits apply to all modules and threads.
+# Requests also get a deadline (timeout in .env) that's handed to the client, so a stuck request is closed
+# and sent again instead of freezing a file thread for minutes. Failed requests are retried here, see
+# backoff.py. LABEL is the file and page the current request is for, for the log.
+DEADLINE = float(config.getenv('timeout') or 120)
+LABEL = contextvars.ContextVar('label', default='')
+
+def chatCompletion(**kwargs):
+    estimate = ratelimit.estimateTokens(kwargs['messages'])
+    kwargs.setdefault('timeout', DEADLINE)
+    attempt = 0
+    while True:
+        while (wait := backoff.getWait()) > 0:
+            time.sleep(wait)
+        ratelimit.acquire(estimate)
+        start = time.perf_counter()
+        try:
+            chat = mock.CHAT if mock.enabled() else openai.chat
+            try:
+                response = chat.completions.create(**kwargs)
+            except openai.APITimeoutError:
+                raise getStuckError() from None
+            break
+        except Exception as e:
+            # Nothing came back, give the tokens back so retries aren't throttled for requests that never counted
+            ratelimit.settle(estimate, 0)
+            metrics.increment('api_errors')
+            delay = backoff.fail(e, attempt)
+            if delay is None:
+                raise
+            metrics.increment('retries')
+            time.sleep(delay)
+            attempt += 1
+    backoff.succeed()
+    metrics.recordResponse(response, time.perf_counter() - start)
+    ratelimit.settle(estimate, response.usage.prompt_tokens + response.usage.completion_tokens)
+    return response
+
+def getStuckError():
+    # Logged here, backoff only sees the exception
+    metrics.increment('api_timeouts')
+    label = LABEL.get()
+    tqdm.write(Fore.YELLOW + f'Request stuck for {DEADLINE:g}s, cancelled and sent again' + \
+               (f' ({label})' if label != '' else '') + Fore.RESET)
+    return TimeoutError(f'No response after {DEADLINE:g}s' + (f' ({label})' if label != '' else ''))
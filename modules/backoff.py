@@ -0,0 +1,128 @@
+# Libraries
+import email.utils, random, threading, time, openai
+from colorama import Fore
+from tqdm import tqdm
+from modules import config, metrics
+
+# Retry Policy
+# Shared by api.py (Threads) and engine.py (Async) so every request in the run retries the same way.
+# Errors are sorted first: 429s, 5xx and timeouts are sent again, refusals, bad requests and bugs in our own
+# code are raised right away since sending them again gives the same result. Waits grow exponentially with
+# random jitter so threads that failed together don't all come back together, and a Retry-After from the
+# server holds every request in the run, not just the one that got it. If too many requests fail in a row
+# the breaker opens and nothing goes out until one test request gets through.
+TRIES = int(config.getenv('retries') or 5)
+BASEDELAY = float(config.getenv('retryDelay') or 2)         # First wait, doubles each try
+MAXDELAY = float(config.getenv('retryMaxDelay') or 60)
+BREAKERERRORS = int(config.getenv('breakerErrors') or 10)   # Failures in a row (Whole run) that open the breaker
+BREAKERSECONDS = float(config.getenv('breakerSeconds') or 30)
+MAXCOOLDOWN = 300
+RETRYKINDS = ['rateLimit', 'server', 'timeout']
+LOCK = threading.Lock()
+FAILURES = 0        # Retryable failures in a row
+PAUSEUNTIL = 0      # Nothing goes out before this (Retry-After, open breaker)
+OPEN = False
+PROBING = False     # A test request is out while the breaker is open
+COOLDOWN = BREAKERSECONDS
+
+def classify(e):
+    # rateLimit, server, timeout, refusal, fatal (Our request or account is the problem) or bug
+    if isinstance(e, openai.RateLimitError):
+        # Out of credits is a 429 too but waiting won't fix it
+        return 'fatal' if getattr(e, 'code', None) == 'insufficient_quota' else 'rateLimit'
+    if isinstance(e, (TimeoutError, openai.APITimeoutError)):
+        return 'timeout'
+    if isinstance(e, openai.BadRequestError) and getattr(e, 'code', None) in ['content_filter', 'content_policy_violation']:
+        return 'refusal'
+    if isinstance(e, openai.APIStatusError):
+        return 'server' if e.status_code >= 500 or e.status_code in [408, 409] else 'fatal'
+    if isinstance(e, openai.APIError):
+        # Dropped connections, broken response bodies
+        return 'server'
+    return 'bug'
+
+def getRetryAfter(e):
+    # Seconds the server asked us to wait, None if it didn't say
+    response = getattr(e, 'response', None)
+    if response is None:
+        return None
+    headers = response.headers
+    seconds = None
+    try:
+        seconds = float(headers.get('retry-after-ms')) / 1000
+    except (TypeError, ValueError):
+        try:
+            seconds = float(headers.get('retry-after'))
+        except (TypeError, ValueError):
+            # HTTP date, anything else we can't read is ignored
+            try:
+                seconds = email.utils.parsedate_to_datetime(headers.get('retry-after')).timestamp() - time.time()
+            except (TypeError, ValueError, OverflowError):
+                return None
+
+    # nan, inf or a date years away shouldn't stop the run
+    if seconds != seconds:
+        return None
+    return min(max(0, seconds), MAXCOOLDOWN)
+
+def getWait():
+    # Seconds to hold off before sending, call until it returns 0
+    global PROBING
+    with LOCK:
+        now = time.monotonic()
+        if now < PAUSEUNTIL:
+            return PAUSEUNTIL - now + random.uniform(0, BASEDELAY)
+        if OPEN:
+            if PROBING:
+                return random.uniform(BASEDELAY / 2, BASEDELAY)
+            PROBING = True
+        return 0
+
+def succeed():
+    global FAILURES, OPEN, PROBING, COOLDOWN
+    with LOCK:
+        FAILURES = 0
+        if OPEN:
+            OPEN = False
+            COOLDOWN = BREAKERSECONDS
+            tqdm.write(Fore.YELLOW + 'API is responding again, resuming requests' + Fore.RESET)
+        PROBING = False
+
+def fail(e, attempt):
+    # Records the failure and returns how long to wait before trying again, None if it shouldn't be retried
+    global FAILURES, PAUSEUNTIL, OPEN, PROBING, COOLDOWN
+    kind = classify(e)
+    metrics.increment('api_failures', kind=kind)
+    retryAfter = getRetryAfter(e)
+    with LOCK:
+        probe = PROBING
+        PROBING = False
+        if kind not in RETRYKINDS:
+            return None
+        now = time.monotonic()
+        FAILURES += 1
+
+        # The whole run waits out a Retry-After
+        if retryAfter is not None:
+            PAUSEUNTIL = max(PAUSEUNTIL, now + retryAfter)
+
+        # Too many in a row or the test request failed, stop sending for a while. Requests that were already
+        # out when it opened don't count.
+        if (OPEN and probe) or (not OPEN and FAILURES >= BREAKERERRORS):
+            if OPEN:
+                COOLDOWN = min(COOLDOWN * 2, MAXCOOLDOWN)
+            else:
+                OPEN = True
+                metrics.increment('breaker_opens')
+            PAUSEUNTIL = max(PAUSEUNTIL, now + COOLDOWN)
+            tqdm.write(Fore.YELLOW + f'{FAILURES} requests failed in a row ({kind}), pausing requests for {COOLDOWN:g}s' \
+                       + Fore.RESET)
+
+    if attempt >= TRIES - 1:
+        return None
+
+    # Stuck requests go again right away, getWait() still holds them if the breaker is open
+    if kind == 'timeout':
+        return 0
+    delay = random.uniform(0, min(MAXDELAY, BASEDELAY * 2 ** attempt))
+    return max(delay, retryAfter or 0)
@@ -0,0 +1,92 @@
+# Libraries
+import re, threading
+from modules import config, metrics, ratelimit
+
+# Batch Targets - [Max tokens per request, Max lines per request]
+# Lines get packed into a request until either one is reached, so a batch of short choices and a batch of
+# long paragraphs cost about the same. Models are matched by name, the longest match wins.
+# batchTokens and batchLines in .env override these for every model.
+BATCHTARGETS = {
+    'gpt-3.5': [500, 15],
+    'gpt-4': [1000, 40],
+    'gpt-4o': [1500, 50],
+}
+DEFAULTTARGET = [1000, 50]
+TAGTOKENS = 8   # `<LineN></LineN>` around every line
+
+# Adaptive Batch Size (AIMD)
+# Every file type (Map, CommonEvents, Troops...) keeps a scale on top of the targets above. A clean batch
+# grows it a little, a mismatch or a response that got cut off halves it and a slow request shrinks it.
+# This keeps batches near the biggest size the model (or local server) can handle without babysitting.
+ADAPTIVE = config.getenv('adaptiveBatch', 'True').lower() not in ['false', '0', '']
+SLOWREQUEST = float(config.getenv('batchLatency') or 60)   # Seconds
+INCREASE = 0.1
+DECREASE = 0.5
+SLOWDECREASE = 0.75
+MINSCALE = 0.1
+MAXSCALE = 2.0
+SCALES = {}
+LOCK = threading.Lock()
+
+def getKind(filename):
+    # Map001.json -> Map
+    if filename is None:
+        return None
+    return re.sub(r'[\d_]+$', '', filename.split('.')[0]) or filename
+
+def getScale(kind):
+    if not ADAPTIVE or kind is None:
+        return 1
+    with LOCK:
+        return SCALES.get(kind, 1)
+
+def recordBatch(kind, mismatch, latency, truncated):
+    if not ADAPTIVE or kind is None:
+        return
+    with LOCK:
+        scale = SCALES.get(kind, 1)
+        if mismatch or truncated:
+            scale *= DECREASE
+        elif latency > SLOWREQUEST:
+            scale *= SLOWDECREASE
+        else:
+            scale += INCREASE
+        SCALES[kind] = min(MAXSCALE, max(MINSCALE, scale))
+
+def getTarget(model, batchSize, kind=None):
+    target = DEFAULTTARGET
+    matchList = [key for key in BATCHTARGETS if key in model]
+    if len(matchList) > 0:
+        target = BATCHTARGETS[max(matchList, key=len)]
+    maxTokens = int(config.getenv('batchTokens') or target[0])
+    maxLines = int(config.getenv('batchLines') or min(target[1], batchSize))
+
+    # Adaptive
+    scale = getScale(kind)
+    return [max(int(maxTokens * scale), TAGTOKENS), max(int(maxLines * scale), 1)]
+
+def countLine(line, subVars):
+    if not isinstance(line, str):
+        return TAGTOKENS
+    return len(ratelimit.getEncoding().encode(subVars(line)[0])) + TAGTOKENS
+
+def packBatches(lines, model, batchSize, subVars, kind=None):
+    maxTokens, maxLines = getTarget(model, batchSize, kind)
+    batchList = []
+    batch = []
+    batchTokens = 0
+    for line in lines:
+        lineTokens = countLine(line, subVars)
+
+        # A single line over the budget still goes on its own
+        if len(batch) > 0 and (len(batch) >= maxLines or batchTokens + lineTokens > maxTokens):
+            batchList.append(batch)
+            batch = []
+            batchTokens = 0
+        batch.append(line)
+        batchTokens += lineTokens
+    if len(batch) > 0:
+        batchList.append(batch)
+    for batch in batchList:
+        metrics.observe('batch_lines', len(batch))
+    return batchList
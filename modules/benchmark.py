@@ -0,0 +1,282 @@
+# Libraries
+import argparse, json, os, random, subprocess, sys, time
+from modules import mock
+
+# Benchmark
+# Generates fake game projects (RPGMaker MV/MZ, RPGMaker ACE, Tyrano, Translator++ CSV) and runs each one through
+# start.py against the mock API (modules/mock.py), one process per engine so nothing is shared between them.
+# Reports lines/sec, requests/sec, peak memory, CPU time and the time spent in each stage, so a change can be
+# checked against numbers instead of a feeling. Run from the folder with prompt.txt:
+#   python -m modules.benchmark --files 10 --events 20 --latency 0.5 --output benchmark.json
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORDS = ['今日', 'は', 'いい', '天気', 'ですね', '村', 'の', '外', 'に', '魔物', 'が', '出る', 'らしい', '勇者', '様', \
+         '剣', 'を', '持って', '行け', 'ありがとう', 'ございます', '宿屋', 'で', '休んで', 'いって', 'ください', 'お金', \
+         '足りない', 'また', '来て', 'ね', '王様', '呼んで', 'いる', '森', '奥']
+CODES = ['\\C[2]', '\\C[0]', '\\N[1]', '\\V[3]', '\\I[12]', '\\{', '\\.']
+NAMES = ['アリス', '村人', '王様', '兵士', '商人']
+
+def getArgs():
+    parser = argparse.ArgumentParser(description='Benchmark the translation engines against the mock API.')
+    parser.add_argument('--engine', action='append', help='Engine to run, can be repeated (Default: all of them)')
+    parser.add_argument('--files', type=int, default=5, help='Maps/scenario files per project')
+    parser.add_argument('--events', type=int, default=10, help='Events per file')
+    parser.add_argument('--pages', type=int, default=2, help='Pages per event')
+    parser.add_argument('--runs', type=int, default=3, help='Text boxes (401 runs) per page')
+    parser.add_argument('--run-lines', type=int, default=3, help='Lines per text box')
+    parser.add_argument('--codes', type=float, default=0.3, help='Chance a line has a control code in it (0 to 1)')
+    parser.add_argument('--latency', type=float, default=0, help='Mock API seconds per request')
+    parser.add_argument('--seed', default='0', help='Same seed gives the same projects and responses')
+    parser.add_argument('--http', type=int, help='Serve the mock on this port and go through the real client')
+    parser.add_argument('--flag', action='append', default=[], help='Extra flag for start.py, can be repeated (e.g. --flag=--project)')
+    parser.add_argument('--dir', default='benchmark', help='Where the projects and logs go')
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    return parser.parse_args()
+
+def makeLine(rng, density):
+    line = ''.join(rng.choice(WORDS) for i in range(rng.randint(4, 10))) + rng.choice(['。', '！', '？', '…'])
+    while rng.random() < density:
+        position = rng.randrange(len(line))
+        line = line[:position] + rng.choice(CODES) + line[position:]
+        density /= 2
+    return line
+
+def makeCommands(rng, args, codeKey, parameterKey):
+    # [Command list, Translatable lines]
+    commandList = []
+    for run in range(args.runs):
+        commandList.append({codeKey: 101, 'indent': 0, parameterKey: ['', 0, 0, 2]})
+        for i in range(args.run_lines):
+            commandList.append({codeKey: 401, 'indent': 0, parameterKey: [makeLine(rng, args.codes)]})
+    commandList.append({codeKey: 102, 'indent': 0, parameterKey: [[makeLine(rng, 0)[:6], makeLine(rng, 0)[:6]], 1, 0, 2, 0]})
+    commandList.append({codeKey: 0, 'indent': 0, parameterKey: []})
+    return [commandList, args.runs * args.run_lines + 2]
+
+def makeMVMZ(path, rng, args):
+    lines = 0
+    for number in range(1, args.files + 1):
+        eventList = [None]
+        for eventId in range(1, args.events + 1):
+            pageList = []
+            for page in range(args.pages):
+                commandList, count = makeCommands(rng, args, 'code', 'parameters')
+                pageList.append({'list': commandList})
+                lines += count
+            eventList.append({'id': eventId, 'name': f'EV{eventId:03d}', 'note': '', 'pages': pageList})
+        writeJSON(os.path.join(path, f'Map{number:03d}.json'), {'displayName': makeLine(rng, 0)[:4], 'events': eventList})
+        lines += 1
+
+    commonList = [None]
+    for eventId in range(1, args.events + 1):
+        commandList, count = makeCommands(rng, args, 'code', 'parameters')
+        commonList.append({'id': eventId, 'name': f'CE{eventId:03d}', 'list': commandList})
+        lines += count
+    writeJSON(os.path.join(path, 'CommonEvents.json'), commonList)
+    return lines
+
+def makeACE(path, rng, args):
+    # JSON is valid YAML so there's no need for a YAML writer
+    lines = 0
+    for number in range(1, args.files + 1):
+        eventDict = {}
+        for eventId in range(1, args.events + 1):
+            pageList = []
+            for page in range(args.pages):
+                commandList, count = makeCommands(rng, args, 'c', 'p')
+                pageList.append({'list': commandList})
+                lines += count
+            eventDict[eventId] = {'id': eventId, 'name': f'EV{eventId:03d}', 'pages': pageList}
+        writeJSON(os.path.join(path, f'Map{number:03d}.yaml'), {'display_name': makeLine(rng, 0)[:4], 'events': eventDict})
+        lines += 1
+
+    commonList = [None]
+    for eventId in range(1, args.events + 1):
+        commandList, count = makeCommands(rng, args, 'c', 'p')
+        commonList.append({'id': eventId, 'name': f'CE{eventId:03d}', 'list': commandList})
+        lines += count
+    writeJSON(os.path.join(path, 'CommonEvents.yaml'), commonList)
+    return lines
+
+def makeTyrano(path, rng, args):
+    lines = 0
+    for number in range(1, args.files + 1):
+        lineList = ['*start\n', '[cm]\n']
+        for block in range(args.events * args.pages * args.runs):
+            lineList.append(f'[{rng.choice(NAMES)}] [@]\n')
+            for i in range(args.run_lines):
+                lineList.append(f'[ns]{makeLine(rng, args.codes)}[p]\n')
+            lines += args.run_lines
+        for choice in range(2):
+            lineList.append(f'[button status={choice}]{makeLine(rng, 0)[:6]}\n')
+            lines += 1
+        lineList.append('[s]\n')
+        with open(os.path.join(path, f'scene{number:03d}.ks'), 'w', encoding='utf-8') as outFile:
+            outFile.writelines(lineList)
+    return lines
+
+def makeCSV(path, rng, args):
+    lines = 0
+    for number in range(1, args.files + 1):
+        rowList = ['"Original Text","Initial","Machine translation","Better translation","Best translation"\n']
+        for row in range(args.events * args.pages * args.runs * args.run_lines):
+            rowList.append('"' + makeLine(rng, args.codes).replace('"', '""') + '",,,,\n')
+            lines += 1
+        with open(os.path.join(path, f'Map{number:03d}.csv'), 'w', encoding='utf-8') as outFile:
+            outFile.writelines(rowList)
+    return lines
+
+def writeJSON(path, data):
+    with open(path, 'w', encoding='utf-8') as outFile:
+        json.dump(data, outFile, ensure_ascii=False)
+
+# [Engine, Project generator, Extra start.py flags]
+BENCHMARKS = [
+    ['rpgmakermvmz', makeMVMZ, []],
+    ['rpgmakerace', makeACE, []],
+    ['tyrano', makeTyrano, []],
+    ['csv', makeCSV, ['--csv-format', '1']],
+]
+
+def getEnv(args, path):
+    # Only what's being measured, nothing carried over between runs
+    env = dict(os.environ)
+    env.update({
+        'mock': 'False' if args.http else 'True',
+        'mockLatency': str(args.latency),
+        'mockSeed': str(args.seed),
+        'cache': '',
+        'journal': '',
+        'dedup': 'False',
+        'previousFiles': '',
+        'previousTranslated': '',
+        'speakers': os.path.join(path, 'speakers.json'),
+        'metrics': os.path.join(path, 'metrics'),
+        'metricsInterval': '3600',
+        'PYTHONIOENCODING': 'utf-8',
+    })
+    if args.http:
+        env.update({'api': f'http://127.0.0.1:{args.http}/', 'key': 'mock', 'organization': 'mock'})
+
+    # Needed by start.py even without a .env
+    for name, value in [['api', ''], ['key', 'mock'], ['organization', 'mock'], ['model', 'gpt-4o'], \
+                        ['language', 'English'], ['timeout', '120'], ['fileThreads', '1'], ['threads', '1'], \
+                        ['width', '60'], ['listWidth', '100'], ['noteWidth', '75']]:
+        env.setdefault(name, value)
+    return env
+
+def runEngine(engine, flagList, args, path):
+    os.makedirs(os.path.join(path, 'translated'), exist_ok=True)
+    command = [sys.executable, os.path.join(ROOT, 'start.py'), '--engine', engine, '--mode', 'translate', \
+               '--input', os.path.join(path, 'files'), '--output', os.path.join(path, 'translated'), \
+               '--keep-files', '--summary', os.path.join(path, 'summary.json')] + flagList + args.flag
+
+    # wait4 gives the peak memory and CPU of just this process (Not on Windows)
+    start = time.perf_counter()
+    with open(os.path.join(path, 'run.log'), 'w', encoding='utf-8') as logFile:
+        process = subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=logFile, stderr=subprocess.STDOUT, \
+                                   env=getEnv(args, path))
+        if hasattr(os, 'wait4'):
+            status, usage = os.wait4(process.pid, 0)[1:]
+            process.returncode = os.waitstatus_to_exitcode(status)
+        else:
+            process.wait()
+            usage = None
+    return [process.returncode, time.perf_counter() - start, usage]
+
+def getResult(engine, lines, returnCode, seconds, usage, path):
+    summaryDict = readJSON(os.path.join(path, 'summary.json')) or {}
+    metricsDict = readJSON(os.path.join(path, 'metrics.json')) or {'counters': [], 'histograms': []}
+    requests = sum(counter['value'] for counter in metricsDict['counters'] if counter['name'] == 'requests')
+
+    # Sum up every stage timer, plus the API calls (Wall time across all requests in flight)
+    stageDict = {}
+    for histogram in metricsDict['histograms']:
+        if histogram['name'] in ['stage_seconds', 'stage_cpu_seconds']:
+            stage = stageDict.setdefault(histogram['labels']['stage'], {'count': 0, 'seconds': 0, 'cpuSeconds': 0})
+            if histogram['name'] == 'stage_seconds':
+                stage['count'] = histogram['count']
+                stage['seconds'] = histogram['sum']
+            else:
+                stage['cpuSeconds'] = histogram['sum']
+        elif histogram['name'] == 'api_latency_seconds':
+            stageDict['api'] = {'count': histogram['count'], 'seconds': histogram['sum'], 'cpuSeconds': None}
+
+    # ru_maxrss is KB on Linux and bytes on macOS
+    peakMB = None
+    cpuSeconds = None
+    if usage is not None:
+        peakMB = round(usage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+        cpuSeconds = round(usage.ru_utime + usage.ru_stime, 3)
+    # A run that failed didn't do the work, its speed means nothing
+    valid = returnCode == 0 and seconds > 0
+    return {
+        'engine': engine,
+        'exitCode': returnCode,
+        'failed': summaryDict.get('failed'),
+        'mismatch': summaryDict.get('mismatch'),
+        'lines': lines,
+        'requests': requests,
+        'seconds': round(seconds, 3),
+        'log': os.path.join(path, 'run.log'),
+        'linesPerSecond': round(lines / seconds, 1) if valid else None,
+        'requestsPerSecond': round(requests / seconds, 1) if valid else None,
+        'peakMB': peakMB,
+        'cpuSeconds': cpuSeconds,
+        'stages': {name: {key: round(value, 4) if isinstance(value, float) else value for key, value in stage.items()} \
+                   for name, stage in sorted(stageDict.items())},
+    }
+
+def readJSON(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as inFile:
+        return json.load(inFile)
+
+def printResult(result):
+    if result['exitCode'] != 0:
+        print(f"{result['engine']}: FAILED [Exit: {result['exitCode']}], see {result['log']}")
+        return
+    print(f"{result['engine']}: {result['lines']} lines, {result['requests']} requests in {result['seconds']}s "
+          f"[{result['linesPerSecond']} lines/s][{result['requestsPerSecond']} requests/s]"
+          f"[Peak: {result['peakMB']} MB][CPU: {result['cpuSeconds']}s][Exit: {result['exitCode']}]")
+    for name, stage in result['stages'].items():
+        cpuString = '-' if stage['cpuSeconds'] is None else f"{stage['cpuSeconds']}s"
+        print(f"    {name.ljust(10)} {str(stage['count']).rjust(8)} calls {str(stage['seconds']).rjust(10)}s "
+              f"{cpuString.rjust(10)} CPU")
+
+def main():
+    args = getArgs()
+    engineList = args.engine or [benchmark[0] for benchmark in BENCHMARKS]
+    server = None
+    if args.http:
+        mock.LATENCY = args.latency
+        mock.SEED = str(args.seed)
+        server = mock.serve(args.http)
+
+    resultList = []
+    for engine, generator, flagList in BENCHMARKS:
+        if engine not in engineList:
+            continue
+        path = os.path.join(args.dir, engine)
+        os.makedirs(os.path.join(path, 'files'), exist_ok=True)
+        for filename in os.listdir(os.path.join(path, 'files')):
+            os.remove(os.path.join(path, 'files', filename))
+        for filename in ['summary.json', 'metrics.json', 'speakers.json']:
+            if os.path.exists(os.path.join(path, filename)):
+                os.remove(os.path.join(path, filename))
+
+        # Same seed, same project
+        lines = generator(os.path.join(path, 'files'), random.Random(f'{args.seed}:{engine}'), args)
+        returnCode, seconds, usage = runEngine(engine, flagList, args, path)
+        result = getResult(engine, lines, returnCode, seconds, usage, path)
+        printResult(result)
+        resultList.append(result)
+
+    if server is not None:
+        server.shutdown()
+    if args.output is not None:
+        with open(args.output, 'w', encoding='utf-8') as outFile:
+            json.dump(resultList, outFile, indent=4)
+    return 1 if any(result['exitCode'] != 0 for result in resultList) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,96 @@
+# Libraries
+import hashlib, re, sqlite3, threading
+from modules import config, metrics
+
+# Translation Memory
+# Every line that comes back from the API is stored on disk so that re-running a file (or a file that
+# crashed halfway through) doesn't pay for the same lines twice. Lines are keyed on the model, a hash of
+# the prompt that was used to translate them and the subVars normalized source line.
+CACHEFILE = config.getenv('cache', 'cache.db')
+LOCK = threading.Lock()
+CONNECTION = None
+
+# Matches RPGMaker style codes (\C[1], \N[\V[2]], \I[5], etc) so cached lines can be reused with different codes
+CODEREGEX = re.compile(r'[\\]+[A-Za-z]+\[(?:[^\[\]]|\[[^\[\]]*\])*\]')
+
+def getConnection():
+    global CONNECTION
+    if CONNECTION is None:
+        CONNECTION = sqlite3.connect(CACHEFILE, check_same_thread=False)
+        CONNECTION.execute('PRAGMA journal_mode=WAL')
+        CONNECTION.execute('CREATE TABLE IF NOT EXISTS translations (key TEXT PRIMARY KEY, source TEXT, translation TEXT)')
+        CONNECTION.commit()
+    return CONNECTION
+
+def enabled():
+    return CACHEFILE.replace(' ', '') != ''
+
+def getContext(model, system, characters, history):
+    # List history is just previous dialogue, only an instruction string changes the meaning of a line
+    instruction = history if isinstance(history, str) else ''
+    promptHash = hashlib.sha256((system + characters + instruction).encode('utf-8')).hexdigest()
+    return f'{model}:{promptHash}'
+
+def getKey(context, normalized):
+    return hashlib.sha256(f'{context}:{normalized}'.encode('utf-8')).hexdigest()
+
+def remapCodes(source, translation, line):
+    # Same line with different codes (e.g \N[1] instead of \N[2]). Swap the codes over in the translation.
+    oldCodes = CODEREGEX.findall(source)
+    newCodes = CODEREGEX.findall(line)
+    if len(oldCodes) != len(newCodes):
+        return None
+    codeMap = {}
+    for oldCode, newCode in zip(oldCodes, newCodes):
+        if codeMap.setdefault(oldCode, newCode) != newCode:
+            return None
+
+    # Make sure the codes were the only difference
+    if CODEREGEX.sub(lambda m: codeMap[m.group(0)], source) != line:
+        return None
+    return CODEREGEX.sub(lambda m: codeMap.get(m.group(0), m.group(0)), translation)
+
+def lookup(context, line, subVars):
+    if not enabled() or not isinstance(line, str) or line == '':
+        return None
+    key = getKey(context, subVars(line)[0])
+    with LOCK:
+        row = getConnection().execute('SELECT source, translation FROM translations WHERE key = ?', (key,)).fetchone()
+    translation = None
+    if row is not None:
+        translation = row[1] if row[0] == line else remapCodes(row[0], row[1], line)
+    metrics.increment('cache', result='hit' if translation is not None else 'miss')
+    return translation
+
+def store(context, line, translation, subVars):
+    storeList(context, [line], [translation], subVars)
+
+def lookupList(context, lines, subVars):
+    return [lookup(context, line, subVars) for line in lines]
+
+def storeList(context, lines, translations, subVars):
+    if not enabled() or len(lines) != len(translations):
+        return
+    rows = []
+    for line, translation in zip(lines, translations):
+        # Skip anything the API just echoed back untranslated
+        if isinstance(line, str) and isinstance(translation, str) and translation not in ['', line]:
+            rows.append((getKey(context, subVars(line)[0]), line, translation))
+    if len(rows) == 0:
+        return
+    with LOCK:
+        connection = getConnection()
+        connection.executemany('INSERT OR REPLACE INTO translations VALUES (?, ?, ?)', rows)
+        connection.commit()
+
+def getMisses(lines, cachedList):
+    return [line for line, cached in zip(lines, cachedList) if cached is None]
+
+def mergeList(cachedList, translatedList):
+    # Translated list is in the same order as the misses. If the counts don't line up it's a
+    # mismatch, hand back the translated list as is so the caller can see that.
+    missCount = sum(1 for cached in cachedList if cached is None)
+    if missCount != len(translatedList):
+        return translatedList
+    translatedIter = iter(translatedList)
+    return [next(translatedIter) if cached is None else cached for cached in cachedList]
@@ -0,0 +1,87 @@
+# Libraries
+import re
+from colorama import Fore
+from tqdm import tqdm
+from modules import metrics
+
+# Control Code Placeholders
+# Swaps every control code (\C[1], \N[\V[2]], \I[5], etc) for a numbered placeholder like [Color_0] before a
+# line is sent and swaps them back after. Everything is done with one compiled regex each way, so a big
+# <LineN> payload is only scanned once instead of once per code type.
+# [Tag, Regex] In order of priority, first match wins
+NESTED = r'[\\]+[\w]+\[[\\]+[\w]+\[[0-9]+\]\]'
+ICON = r'[\\]+[iIkKwWaA]+\[[0-9]+\]'
+COLOR = r'[\\]+[cC]\[[0-9]+\]'
+NAME = r'[\\]+[nN]\[.+?\]+'
+VAR = r'[\\]+[vV]\[[0-9]+\]'
+FORMATSTRICT = r'[\\]+[\w]+\[[a-zA-Z0-9\\\[\]\_,\s-]+\]'
+FORMATLOOSE = r'[\\]+[\w]+\[.+?\]'
+
+def compileStyle(brackets, formatRegex, nameTag='Noun'):
+    codeList = [['Nested', NESTED], ['Ascii', ICON], ['Color', COLOR], [nameTag, NAME], ['Var', VAR], ['FCode', formatRegex]]
+    tags = [code[0] for code in codeList]
+    regex = re.compile('|'.join(f'({code[1]})' for code in codeList))
+
+    # Allow for spaces GPT likes to add inside the brackets
+    reverseRegex = re.compile(re.escape(brackets[0]) + r'\s?(' + '|'.join(tags) + r')_(\d+)\s?' + re.escape(brackets[1]))
+    return [regex, reverseRegex, tags, brackets]
+
+# Placeholder Styles
+SQUARE = compileStyle('[]', FORMATSTRICT)                # [Color_0]
+CURLY = compileStyle('{}', FORMATLOOSE)                  # {Color_0}
+CURLYSHORT = compileStyle('{}', FORMATLOOSE, 'N')        # {N_0}
+
+def subVars(jaString, style):
+    with metrics.timer('subVars'):
+        return subVarsTimed(jaString, style)
+
+def subVarsTimed(jaString, style):
+    regex, reverseRegex, tags, brackets = style
+    jaString = jaString.replace('\u3000', ' ')
+
+    # Same code gets the same placeholder every time
+    codeDicts = [{} for tag in tags]
+    def repl(match):
+        index = match.lastindex - 1
+        position = codeDicts[index].setdefault(match.group(0), len(codeDicts[index]))
+        return f'{brackets[0]}{tags[index]}_{position}{brackets[1]}'
+    jaString = regex.sub(repl, jaString)
+
+    # Same shape as before, one list per tag
+    allList = [list(codeDict) for codeDict in codeDicts]
+    return [jaString, allList]
+
+def resubVars(translatedText, allList, style):
+    with metrics.timer('resubVars'):
+        return resubVarsTimed(translatedText, allList, style)
+
+def resubVarsTimed(translatedText, allList, style):
+    regex, reverseRegex, tags, brackets = style
+
+    # Put the codes back
+    foundSet = set()
+    def repl(match):
+        index = tags.index(match.group(1))
+        position = int(match.group(2))
+        if position >= len(allList[index]):
+            return match.group(0)
+        foundSet.add((index, position))
+        return allList[index][position]
+    translatedText = reverseRegex.sub(repl, translatedText)
+
+    # Report anything GPT dropped, translations with codes missing and how many codes
+    missingList = getMissing(allList, foundSet, style)
+    if len(missingList) > 0:
+        metrics.increment('placeholders_missing')
+        metrics.increment('missing_codes', len(missingList))
+        tqdm.write(Fore.YELLOW + f'Missing Codes: {missingList}' + Fore.RESET)
+    return translatedText
+
+def getMissing(allList, foundSet, style):
+    regex, reverseRegex, tags, brackets = style
+    missingList = []
+    for index, codeList in enumerate(allList):
+        for position, code in enumerate(codeList):
+            if (index, position) not in foundSet:
+                missingList.append(code)
+    return missingList
@@ -0,0 +1,25 @@
+# Libraries
+import os, openai
+from pathlib import Path
+from dotenv import load_dotenv
+
+# Shared Config
+# Loaded once per run, the engine modules and main.py all read the .env and prompt files through here.
+load_dotenv()
+if (os.getenv('api') or '').replace(' ', '') != '':
+    openai.base_url = os.getenv('api')
+openai.organization = os.getenv('org')
+openai.api_key = os.getenv('key')
+openai.max_retries = 0     # Retries are done by backoff.py
+
+PROMPT = Path('prompt.txt').read_text(encoding='utf-8')
+VOCAB = Path('vocab.txt').read_text(encoding='utf-8')
+
+def getenv(name, default=None):
+    # Shared modules read their settings through here so the .env above is loaded first, whichever of them
+    # gets imported first
+    return os.getenv(name, default)
+
+# Folders, can be changed from the command line (See main.py)
+FILES = os.getenv('files') or 'files'
+TRANSLATED = os.getenv('translated') or 'translated'
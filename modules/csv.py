@@ -1,25 +1,16 @@
 # Libraries
-import json, os, re, textwrap, threading, time, traceback, tiktoken, openai, csv
+import json, os, re, textwrap, threading, time, traceback, tiktoken, csv
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from pathlib import Path
 from colorama import Fore
-from dotenv import load_dotenv
-from retry import retry
 from tqdm import tqdm
-
-# Open AI
-load_dotenv()
-if os.getenv('api').replace(' ', '') != '':
-    openai.base_url = os.getenv('api')
-openai.organization = os.getenv('org')
-openai.api_key = os.getenv('key')
+from modules import api, batching, cache, codes, config, metrics, summary
 
 #Globals
 MODEL = os.getenv('model')
 TIMEOUT = int(os.getenv('timeout'))
 LANGUAGE = os.getenv('language').capitalize()
-PROMPT = Path('prompt.txt').read_text(encoding='utf-8')
-VOCAB = Path('vocab.txt').read_text(encoding='utf-8')
+PROMPT = config.PROMPT
+VOCAB = config.VOCAB
 THREADS = int(os.getenv('threads'))
 LOCK = threading.Lock()
 WIDTH = int(os.getenv('width'))
@@ -34,6 +25,7 @@ BRFLAG = False   # If the game uses <br> instead
 FIXTEXTWRAP = True  # Overwrites textwrap
 IGNORETLTEXT = True    # Ignores all translated text.
 MISMATCH = []   # Lists files that thdata a mismatch error (Length of GPT list response is wrong)
+CSVFORMAT = os.getenv('csvFormat') or ''  # 1. Translator++ 2. Translate All (Depreciated)
 BRACKETNAMES = False
 
 # Pricing - Depends on the model https://openai.com/pricing
@@ -60,7 +52,7 @@ def handleCSV(filename, estimate):
     ESTIMATE = estimate
 
     if not ESTIMATE:
-        with open('translated/' + filename, 'w+t', newline='', encoding='utf-8') as writeFile:
+        with open(os.path.join(config.TRANSLATED, filename), 'w+t', newline='', encoding='utf-8') as writeFile:
             # Translate
             start = time.time()
             translatedData = openFiles(filename, writeFile)
@@ -94,13 +86,13 @@ def handleCSV(filename, estimate):
         return totalString
 
 def openFiles(filename, writeFile):
-    with open('files/' + filename, 'r', encoding='utf-8') as readFile, writeFile:
+    with open(os.path.join(config.FILES, filename), 'r', encoding='utf-8') as readFile, writeFile:
         translatedData = parseCSV(readFile, writeFile, filename)
 
     return translatedData
 
 def openFilesEstimate(filename):
-    with open('files/' + filename, 'r', encoding='utf-8') as readFile:
+    with open(os.path.join(config.FILES, filename), 'r', encoding='utf-8') as readFile:
         translatedData = parseCSV(readFile, '', filename)
 
     return translatedData
@@ -124,24 +116,26 @@ def getResultString(translatedData, translationTime, filename):
             raise translatedData[2]
         except Exception as e:
             traceback.print_exc()
+            summary.recordError(filename, e)
             errorString = str(e) + Fore.RED
             return filename + ': ' + totalTokenstring + timeString + Fore.RED + u' \u2717 ' +\
                 errorString + Fore.RESET
         
+def getFormat():
+    # Asked once per run (Not once per file) unless set with csvFormat in .env or --csv-format
+    global CSVFORMAT
+    with LOCK:
+        while CSVFORMAT not in ['1', '2']:
+            CSVFORMAT = input('\n\nSelect the CSV Format:\n\n1. Translator++\n2. Translate All (Depreciated)\n')
+    return CSVFORMAT
+
 def parseCSV(readFile, writeFile, filename):
     totalTokens = [0,0]
     totalLines = 0
     textHistory = []
     global LOCK
 
-    format = ''
-    while format == '':
-        format = input('\n\nSelect the CSV Format:\n\n1. Translator++\n2. Translate All (Depreciated)\n')
-        match format:
-            case '1':
-                format = '1'
-            case '2':
-                format = '2'
+    format = getFormat()
 
     # Get total for progress bar
     totalLines = len(readFile.readlines())
@@ -161,7 +155,7 @@ def parseCSV(readFile, writeFile, filename):
             totalTokens[0] = response[0]
             totalTokens[1] = response[1]
         except Exception as e:
-            traceback.print_exc()
+            return [reader, totalTokens, e]
     return [reader, totalTokens, None]
 
 def translateCSV(reader, pbar, writer, textHistory, format):
@@ -320,130 +314,19 @@ def translateCSV(reader, pbar, writer, textHistory, format):
                 for row in data:
                     writer.writerow(row)
 
-    except Exception as e:
+    except Exception:
+        # Printed with the row it failed on, parseCSV hands it to the summary
         traceback.print_exc()
+        raise
     
     return totalTokens
     
 
 def subVars(jaString):
-    jaString = jaString.replace('\u3000', ' ')
-
-    # Nested
-    count = 0
-    nestedList = re.findall(r'[\\]+[\w]+\[[\\]+[\w]+\[[0-9]+\]\]', jaString)
-    nestedList = set(nestedList)
-    if len(nestedList) != 0:
-        for icon in nestedList:
-            jaString = jaString.replace(icon, '{Nested_' + str(count) + '}')
-            count += 1
-
-    # Icons
-    count = 0
-    iconList = re.findall(r'[\\]+[iIkKwWaA]+\[[0-9]+\]', jaString)
-    iconList = set(iconList)
-    if len(iconList) != 0:
-        for icon in iconList:
-            jaString = jaString.replace(icon, '{Ascii_' + str(count) + '}')
-            count += 1
-
-    # Colors
-    count = 0
-    colorList = re.findall(r'[\\]+[cC]\[[0-9]+\]', jaString)
-    colorList = set(colorList)
-    if len(colorList) != 0:
-        for color in colorList:
-            jaString = jaString.replace(color, '{Color_' + str(count) + '}')
-            count += 1
-
-    # Names
-    count = 0
-    nameList = re.findall(r'[\\]+[nN]\[.+?\]+', jaString)
-    nameList = set(nameList)
-    if len(nameList) != 0:
-        for name in nameList:
-            jaString = jaString.replace(name, '{Noun_' + str(count) + '}')
-            count += 1
-
-    # Variables
-    count = 0
-    varList = re.findall(r'[\\]+[vV]\[[0-9]+\]', jaString)
-    varList = set(varList)
-    if len(varList) != 0:
-        for var in varList:
-            jaString = jaString.replace(var, '{Var_' + str(count) + '}')
-            count += 1
-
-    # Formatting
-    count = 0
-    formatList = re.findall(r'[\\]+[\w]+\[.+?\]', jaString)
-    formatList = set(formatList)
-    if len(formatList) != 0:
-        for var in formatList:
-            jaString = jaString.replace(var, '{FCode_' + str(count) + '}')
-            count += 1
-
-    # Put all lists in list and return
-    allList = [nestedList, iconList, colorList, nameList, varList, formatList]
-    return [jaString, allList]
+    return codes.subVars(jaString, codes.CURLY)
 
 def resubVars(translatedText, allList):
-    # Fix Spacing and ChatGPT Nonsense
-    matchList = re.findall(r'\[\s?.+?\s?\]', translatedText)
-    if len(matchList) > 0:
-        for match in matchList:
-            text = match.strip()
-            translatedText = translatedText.replace(match, text)
-
-    # Nested
-    count = 0
-    if len(allList[0]) != 0:
-        for var in allList[0]:
-            translatedText = translatedText.replace('{Nested_' + str(count) + '}', var)
-            count += 1
-
-    # Icons
-    count = 0
-    if len(allList[1]) != 0:
-        for var in allList[1]:
-            translatedText = translatedText.replace('{Ascii_' + str(count) + '}', var)
-            count += 1
-
-    # Colors
-    count = 0
-    if len(allList[2]) != 0:
-        for var in allList[2]:
-            translatedText = translatedText.replace('{Color_' + str(count) + '}', var)
-            count += 1
-
-    # Names
-    count = 0
-    if len(allList[3]) != 0:
-        for var in allList[3]:
-            translatedText = translatedText.replace('{Noun_' + str(count) + '}', var)
-            count += 1
-
-    # Vars
-    count = 0
-    if len(allList[4]) != 0:
-        for var in allList[4]:
-            translatedText = translatedText.replace('{Var_' + str(count) + '}', var)
-            count += 1
-    
-    # Formatting
-    count = 0
-    if len(allList[5]) != 0:
-        for var in allList[5]:
-            translatedText = translatedText.replace('{FCode_' + str(count) + '}', var)
-            count += 1
-
-    return translatedText
-
-def batchList(input_list, batch_size):
-    if not isinstance(batch_size, int) or batch_size <= 0:
-        raise ValueError("batch_size must be a positive integer")
-        
-    return [input_list[i:i + batch_size] for i in range(0, len(input_list), batch_size)]
+    return codes.resubVars(translatedText, allList, codes.CURLY)
 
 def createContext(fullPromptFlag, subbedT):
     characters = 'Game Characters:\n\
@@ -486,7 +369,7 @@ def translateText(characters, system, user, history):
     
     # Content to TL
     msg.append({"role": "user", "content": f'{user}'})
-    response = openai.chat.completions.create(
+    response = api.chatCompletion(
         temperature=0.1,
         frequency_penalty=0.1,
         presence_penalty=0.1,
@@ -546,12 +429,19 @@ def combineList(tlist, text):
         return [t for sublist in tlist for t in sublist]
     return tlist[0]
 
-@retry(exceptions=Exception, tries=5, delay=5)
 def translateGPT(text, history, fullPromptFlag):
     totalTokens = [0, 0]
+
+    # Translation Memory
+    characters, system, user = createContext(fullPromptFlag, '')
+    cacheContext = cache.getContext(MODEL, system, characters, history)
     if isinstance(text, list):
-        tList = batchList(text, BATCHSIZE)
+        cachedList = cache.lookupList(cacheContext, text, subVars)
+        tList = batching.packBatches(cache.getMisses(text, cachedList), MODEL, BATCHSIZE, subVars)
     else:
+        cachedText = cache.lookup(cacheContext, text, subVars)
+        if cachedText is not None:
+            return [cachedText, totalTokens]
         tList = [text]
 
     for index, tItem in enumerate(tList):
@@ -593,10 +483,19 @@ def translateGPT(text, history, fullPromptFlag):
             if len(tItem) != len(translatedTextList):
                 mismatch = True     # Just here so breakpoint can be set
             history = extractedTranslations[-10:]  # Update history if we have a list
+
+            # Translation Memory
+            if len(tItem) == len(extractedTranslations):
+                cache.storeList(cacheContext, tItem, extractedTranslations, subVars)
+            else:
+                metrics.increment('mismatches')
         else:
             # Ensure we're passing a single string to extractTranslation
             extractedTranslations = extractTranslation('\n'.join(translatedTextList), False)
             tList[index] = extractedTranslations
+            cache.store(cacheContext, tItem, extractedTranslations, subVars)
 
     finalList = combineList(tList, text)
+    if isinstance(text, list):
+        finalList = cache.mergeList(cachedList, finalList)
     return [finalList, totalTokens]
\ No newline at end of file
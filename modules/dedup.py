@@ -0,0 +1,53 @@
+# Libraries
+import threading
+from modules import cache, config, metrics
+
+# Run Level Dedup
+# Stock lines (system messages, NPC barks) show up on hundreds of pages across a project
+# and every page used to pay for them separately. Modules that support it pull the lines out of every
+# selected file before the run starts, translate anything that shows up more than once in a single request
+# and hand the result back to every page that has the line through lookupList(), cache on or not.
+DEDUP = config.getenv('dedup', 'True').lower() not in ['false', '0', '']
+LOCK = threading.Lock()
+TRANSLATIONS = {}   # (Context, Normalized Line) -> [Source, Translation]
+
+def enabled():
+    return DEDUP
+
+def findRepeats(lineLists, subVars):
+    # Lines are compared after subVars so the same line with different codes still counts as a repeat
+    countDict = {}
+    lineDict = {}
+    for lineList in lineLists:
+        for line in lineList:
+            if not isinstance(line, str) or line == '':
+                continue
+            normalized = subVars(line)[0]
+            countDict[normalized] = countDict.get(normalized, 0) + 1
+            lineDict.setdefault(normalized, line)
+    return [lineDict[normalized] for normalized in countDict if countDict[normalized] > 1]
+
+def remember(context, lines, translations, subVars):
+    # Context is cache.getContext() of the request, a line only counts as the same in the same prompt
+    if len(lines) != len(translations):
+        return
+    with LOCK:
+        for line, translation in zip(lines, translations):
+            if isinstance(line, str) and isinstance(translation, str) and translation not in ['', line]:
+                TRANSLATIONS[(context, subVars(line)[0])] = [line, translation]
+
+def lookupList(context, lines, cachedList, subVars):
+    # Fills in the repeats anything before it missed
+    if len(TRANSLATIONS) == 0:
+        return cachedList
+    filledList = []
+    for line, cached in zip(lines, cachedList):
+        if cached is None and isinstance(line, str) and line != '':
+            with LOCK:
+                entry = TRANSLATIONS.get((context, subVars(line)[0]))
+            if entry is not None:
+                cached = entry[1] if entry[0] == line else cache.remapCodes(entry[0], entry[1], line)
+                if cached is not None:
+                    metrics.increment('dedup_hits')
+        filledList.append(cached)
+    return filledList
@@ -0,0 +1,69 @@
+# Libraries
+import asyncio, threading, time, openai
+from modules import api, backoff, config, metrics, mock, ratelimit
+
+# Async Engine
+# A single event loop running in the background with one async client. Pages hand their batches to it
+# and wait for the results instead of every page blocking its own OS thread on a request. REQUESTS is
+# how many requests can be in flight at once across the whole run. A request that isn't back by the deadline
+# (timeout in .env, see api.py) is cancelled and sent again straight away, other failures follow backoff.py.
+REQUESTS = int(config.getenv('requests') or int(config.getenv('fileThreads') or 1) * int(config.getenv('threads') or 1))
+LOCK = threading.Lock()
+LOOP = None
+CLIENT = None
+SEMAPHORE = None
+
+def getLoop():
+    global LOOP, CLIENT, SEMAPHORE
+    with LOCK:
+        if LOOP is None:
+            LOOP = asyncio.new_event_loop()
+            threading.Thread(target=LOOP.run_forever, daemon=True).start()
+
+            # Set by config.py on import
+            if mock.enabled():
+                CLIENT = mock.ASYNCCLIENT
+            else:
+                CLIENT = openai.AsyncOpenAI(
+                    api_key=openai.api_key,
+                    organization=openai.organization,
+                    base_url=openai.base_url,
+                    max_retries=0,
+                )
+            SEMAPHORE = asyncio.Semaphore(REQUESTS)
+    return LOOP
+
+def run(coroutine):
+    # Blocking call for normal code. Never call this from inside a coroutine running on the engine.
+    return asyncio.run_coroutine_threadsafe(coroutine, getLoop()).result()
+
+async def chatCompletion(**kwargs):
+    estimate = ratelimit.estimateTokens(kwargs['messages'])
+    kwargs.setdefault('timeout', api.DEADLINE)
+    attempt = 0
+    while True:
+        while (wait := backoff.getWait()) > 0:
+            await asyncio.sleep(wait)
+        await asyncio.sleep(ratelimit.reserve(estimate))
+        try:
+            async with SEMAPHORE:
+                start = time.perf_counter()
+                try:
+                    response = await asyncio.wait_for(CLIENT.chat.completions.create(**kwargs), api.DEADLINE)
+                except asyncio.TimeoutError:
+                    raise api.getStuckError() from None
+            break
+        except Exception as e:
+            # Nothing came back, give the tokens back so retries aren't throttled for requests that never counted
+            ratelimit.settle(estimate, 0)
+            metrics.increment('api_errors')
+            delay = backoff.fail(e, attempt)
+            if delay is None:
+                raise
+            metrics.increment('retries')
+            await asyncio.sleep(delay)
+            attempt += 1
+    backoff.succeed()
+    metrics.recordResponse(response, time.perf_counter() - start)
+    ratelimit.settle(estimate, response.usage.prompt_tokens + response.usage.completion_tokens)
+    return response
@@ -0,0 +1,56 @@
+# Libraries
+import copy, hashlib, json, os, threading
+from modules import config
+
+# Incremental Re-translation
+# When a game gets patched, point previousFiles at the old untranslated files and previousTranslated at what
+# came out of the tool last time. Files that didn't change are copied over as is and pages that hash the same
+# as the old version reuse their old translation, so only new or edited pages go to the API.
+PREVIOUSFILES = config.getenv('previousFiles') or ''
+PREVIOUSTRANSLATED = config.getenv('previousTranslated') or ''
+LOCK = threading.Lock()
+REUSED = {}     # filename -> ids of pages that were filled in from the old translation
+
+def enabled():
+    return PREVIOUSFILES != '' and PREVIOUSTRANSLATED != ''
+
+def getHash(item):
+    return hashlib.sha256(json.dumps(item, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+
+def loadPrevious(filename):
+    # [Old Source, Old Translation] or None if either is missing
+    if not enabled():
+        return None
+    pathList = [os.path.join(PREVIOUSFILES, filename), os.path.join(PREVIOUSTRANSLATED, filename)]
+    if not all(os.path.exists(path) for path in pathList):
+        return None
+    previous = []
+    for path in pathList:
+        with open(path, 'r', encoding='utf-8-sig') as f:
+            previous.append(json.load(f))
+    return previous
+
+def reusePages(pageDict, oldPageDict, oldTranslatedDict, filename):
+    # Pages are lined up by key (Event ID, Page Number, etc). Same hash as the old source means same text.
+    reusedSet = set()
+    for key, page in pageDict.items():
+        if key not in oldPageDict or key not in oldTranslatedDict:
+            continue
+        if getHash(page) != getHash(oldPageDict[key]):
+            continue
+
+        # Swap the contents in place so the parent event still points at it
+        translatedPage = copy.deepcopy(oldTranslatedDict[key])
+        if isinstance(page, dict):
+            page.clear()
+            page.update(translatedPage)
+        else:
+            page[:] = translatedPage
+        reusedSet.add(id(page))
+    with LOCK:
+        REUSED[filename] = reusedSet
+    return len(reusedSet)
+
+def isReused(filename, page):
+    with LOCK:
+        return id(page) in REUSED.get(filename, set())
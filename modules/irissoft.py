@@ -1,24 +1,15 @@
 # Libraries
-import os, re, textwrap, threading, time, traceback, tiktoken, openai
-from pathlib import Path
+import os, re, textwrap, threading, time, traceback, tiktoken
 from colorama import Fore
-from dotenv import load_dotenv
-from retry import retry
 from tqdm import tqdm
-
-# Open AI
-load_dotenv()
-if os.getenv('api').replace(' ', '') != '':
-    openai.base_url = os.getenv('api')
-openai.organization = os.getenv('org')
-openai.api_key = os.getenv('key')
+from modules import api, batching, cache, codes, config, metrics, speakers, summary
 
 #Globals
 MODEL = os.getenv('model')
 TIMEOUT = int(os.getenv('timeout'))
 LANGUAGE = os.getenv('language').capitalize()
-PROMPT = Path('prompt.txt').read_text(encoding='utf-8')
-VOCAB = Path('vocab.txt').read_text(encoding='utf-8')
+PROMPT = config.PROMPT
+VOCAB = config.VOCAB
 THREADS = int(os.getenv('threads'))
 LOCK = threading.Lock()
 WIDTH = int(os.getenv('width'))
@@ -27,7 +18,6 @@ NOTEWIDTH = 70
 MAXHISTORY = 10
 ESTIMATE = ''
 TOKENS = [0, 0]
-NAMESLIST = []
 NAMES = False    # Output a list of all the character names found
 BRFLAG = False   # If the game uses <br> instead
 FIXTEXTWRAP = True  # Overwrites textwrap
@@ -77,7 +67,7 @@ def handleIris(filename, estimate):
     
     else:
         try:
-            with open('translated/' + filename, 'w', encoding='cp932', errors='ignore') as outFile:
+            with open(os.path.join(config.TRANSLATED, filename), 'w', encoding='cp932', errors='ignore') as outFile:
                 start = time.time()
                 translatedData = openFiles(filename)
 
@@ -114,12 +104,13 @@ def getResultString(translatedData, translationTime, filename):
             raise translatedData[2]
         except Exception as e:
             traceback.print_exc()
+            summary.recordError(filename, e)
             errorString = str(e) + Fore.RED
             return filename + ': ' + totalTokenstring + timeString + Fore.RED + u' \u2717 ' +\
                 errorString + Fore.RESET
 
 def openFiles(filename):
-    with open('files/' + filename, 'r', encoding='shift_jis') as readFile:
+    with open(os.path.join(config.FILES, filename), 'r', encoding='shift_jis') as readFile:
         translatedData = parseIris(readFile, filename)
 
         # Delete lines marked for deletion
@@ -376,140 +367,20 @@ def getSpeaker(speaker, pbar, filename):
         case '':
             return ['', [0,0]]
         case _:
-            # Store Speaker
-            if speaker not in str(NAMESLIST):
-                response = translateGPT(speaker, 'Reply with only the '+ LANGUAGE +' translation of the NPC name.', False, pbar, filename)
-                response[0] = response[0].replace("'S", "'s")
-                speakerList = [speaker, response[0]]
-                NAMESLIST.append(speakerList)
-                return response
-            
-            # Find Speaker
-            else:
-                for i in range(len(NAMESLIST)):
-                    if speaker == NAMESLIST[i][0]:
-                        return [NAMESLIST[i][1],[0,0]]
+            return speakers.getSpeaker(speaker, lambda name: translateSpeaker(name, pbar, filename), ESTIMATE)
                                
     return [speaker,[0,0]]
 
+def translateSpeaker(speaker, pbar, filename):
+    response = translateGPT(speaker, 'Reply with only the '+ LANGUAGE +' translation of the NPC name.', False, pbar, filename)
+    response[0] = response[0].replace("'S", "'s")
+    return response
+
 def subVars(jaString):
-    jaString = jaString.replace('\u3000', ' ')
-
-    # Nested
-    count = 0
-    nestedList = re.findall(r'[\\]+[\w]+\[[\\]+[\w]+\[[0-9]+\]\]', jaString)
-    nestedList = set(nestedList)
-    if len(nestedList) != 0:
-        for icon in nestedList:
-            jaString = jaString.replace(icon, '[Nested_' + str(count) + ']')
-            count += 1
-
-    # Icons
-    count = 0
-    iconList = re.findall(r'[\\]+[iIkKwWaA]+\[[0-9]+\]', jaString)
-    iconList = set(iconList)
-    if len(iconList) != 0:
-        for icon in iconList:
-            jaString = jaString.replace(icon, '[Ascii_' + str(count) + ']')
-            count += 1
-
-    # Colors
-    count = 0
-    colorList = re.findall(r'[\\]+[cC]\[[0-9]+\]', jaString)
-    colorList = set(colorList)
-    if len(colorList) != 0:
-        for color in colorList:
-            jaString = jaString.replace(color, '[Color_' + str(count) + ']')
-            count += 1
-
-    # Names
-    count = 0
-    nameList = re.findall(r'[\\]+[nN]\[.+?\]+', jaString)
-    nameList = set(nameList)
-    if len(nameList) != 0:
-        for name in nameList:
-            jaString = jaString.replace(name, '[Noun_' + str(count) + ']')
-            count += 1
-
-    # Variables
-    count = 0
-    varList = re.findall(r'[\\]+[vV]\[[0-9]+\]', jaString)
-    varList = set(varList)
-    if len(varList) != 0:
-        for var in varList:
-            jaString = jaString.replace(var, '[Var_' + str(count) + ']')
-            count += 1
-
-    # Formatting
-    count = 0
-    formatList = re.findall(r'[\\]+[\w]+\[[a-zA-Z0-9\\\[\]\_,\s-]+\]', jaString)
-    formatList = set(formatList)
-    if len(formatList) != 0:
-        for var in formatList:
-            jaString = jaString.replace(var, '[FCode_' + str(count) + ']')
-            count += 1
-
-    # Put all lists in list and return
-    allList = [nestedList, iconList, colorList, nameList, varList, formatList]
-    return [jaString, allList]
+    return codes.subVars(jaString, codes.SQUARE)
 
 def resubVars(translatedText, allList):
-    # Fix Spacing and ChatGPT Nonsense
-    matchList = re.findall(r'\[\s?.+?\s?\]', translatedText)
-    if len(matchList) > 0:
-        for match in matchList:
-            text = match.strip()
-            translatedText = translatedText.replace(match, text)
-
-    # Nested
-    count = 0
-    if len(allList[0]) != 0:
-        for var in allList[0]:
-            translatedText = translatedText.replace('[Nested_' + str(count) + ']', var)
-            count += 1
-
-    # Icons
-    count = 0
-    if len(allList[1]) != 0:
-        for var in allList[1]:
-            translatedText = translatedText.replace('[Ascii_' + str(count) + ']', var)
-            count += 1
-
-    # Colors
-    count = 0
-    if len(allList[2]) != 0:
-        for var in allList[2]:
-            translatedText = translatedText.replace('[Color_' + str(count) + ']', var)
-            count += 1
-
-    # Names
-    count = 0
-    if len(allList[3]) != 0:
-        for var in allList[3]:
-            translatedText = translatedText.replace('[Noun_' + str(count) + ']', var)
-            count += 1
-
-    # Vars
-    count = 0
-    if len(allList[4]) != 0:
-        for var in allList[4]:
-            translatedText = translatedText.replace('[Var_' + str(count) + ']', var)
-            count += 1
-    
-    # Formatting
-    count = 0
-    if len(allList[5]) != 0:
-        for var in allList[5]:
-            translatedText = translatedText.replace('[FCode_' + str(count) + ']', var)
-            count += 1
-
-    return translatedText
-
-def batchList(input_list, batch_size):
-    if not isinstance(batch_size, int) or batch_size <= 0:
-        raise ValueError("batch_size must be a positive integer")
-        
-    return [input_list[i:i + batch_size] for i in range(0, len(input_list), batch_size)]
+    return codes.resubVars(translatedText, allList, codes.SQUARE)
 
 def createContext(fullPromptFlag, subbedT):
     characters = 'Game Characters:\n\
@@ -555,7 +426,7 @@ def translateText(characters, system, user, history):
     
     # Content to TL
     msg.append({"role": "user", "content": f'{user}'})
-    response = openai.chat.completions.create(
+    response = api.chatCompletion(
         temperature=0.1,
         frequency_penalty=0.1,
         model=MODEL,
@@ -631,13 +502,20 @@ def combineList(tlist, text):
         return [t for sublist in tlist for t in sublist]
     return tlist[0]
 
-@retry(exceptions=Exception, tries=5, delay=5)
 def translateGPT(text, history, fullPromptFlag, pbar, filename):
     mismatch = False
     totalTokens = [0, 0]
+
+    # Translation Memory
+    characters, system, user = createContext(fullPromptFlag, '')
+    cacheContext = cache.getContext(MODEL, system, characters, history)
     if isinstance(text, list):
-        tList = batchList(text, BATCHSIZE)
+        cachedList = cache.lookupList(cacheContext, text, subVars)
+        tList = batching.packBatches(cache.getMisses(text, cachedList), MODEL, BATCHSIZE, subVars)
     else:
+        cachedText = cache.lookup(cacheContext, text, subVars)
+        if cachedText is not None:
+            return [cachedText, totalTokens]
         tList = [text]
 
     for index, tItem in enumerate(tList):
@@ -697,10 +575,19 @@ def translateGPT(text, history, fullPromptFlag, pbar, filename):
             history = tList[index]  # Update history if we have a list
             pbar.update(len(tList[index]))
 
+
+            # Translation Memory
+            if len(tItem) == len(extractedTranslations):
+                cache.storeList(cacheContext, tItem, extractedTranslations, subVars)
+            else:
+                metrics.increment('mismatches')
         else:
             # Ensure we're passing a single string to extractTranslation
             extractedTranslations = extractTranslation(translatedText, False)
             tList[index] = extractedTranslations
+            cache.store(cacheContext, tItem, extractedTranslations, subVars)
 
     finalList = combineList(tList, text)
+    if isinstance(text, list):
+        finalList = cache.mergeList(cachedList, finalList)
     return [finalList, totalTokens]
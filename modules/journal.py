@@ -0,0 +1,79 @@
+# Libraries
+import hashlib, json, os, threading
+from modules import config
+
+# Write-Ahead Journal
+# Every batch that comes back is appended to journal/<file>.jsonl and fsync'd before moving on. If the run
+# dies halfway through a file, the next run replays the journal and only sends the lines that are missing.
+# Lines are keyed on a hash of the list they came from and their index in it, so it works without the
+# translation memory and with any prompt. The journal is deleted once the file is written out.
+JOURNALDIR = config.getenv('journal', 'journal')
+LOCK = threading.Lock()
+JOURNALS = {}   # filename -> {(key, index): [source, translation]}
+
+def enabled():
+    return JOURNALDIR.replace(' ', '') != ''
+
+def getPath(filename):
+    return os.path.join(JOURNALDIR, filename + '.jsonl')
+
+def getKey(lines):
+    return hashlib.sha256('\n'.join(lines).encode('utf-8')).hexdigest()[:16]
+
+def load(filename):
+    # Call with LOCK held
+    if filename not in JOURNALS:
+        entryDict = {}
+        if os.path.exists(getPath(filename)):
+            with open(getPath(filename), 'r', encoding='utf-8') as f:
+                for line in f:
+                    # Last line may be cut off if we died while writing it
+                    try:
+                        key, index, source, translation = json.loads(line)
+                    except ValueError:
+                        continue
+                    entryDict[(key, index)] = [source, translation]
+        JOURNALS[filename] = entryDict
+    return JOURNALS[filename]
+
+def lookupList(filename, lines, cachedList):
+    # Fills in anything the translation memory missed
+    if not enabled() or filename is None:
+        return cachedList
+    key = getKey(lines)
+    with LOCK:
+        entryDict = load(filename)
+        filledList = []
+        for index, (line, cached) in enumerate(zip(lines, cachedList)):
+            entry = entryDict.get((key, index))
+            if cached is None and entry is not None and entry[0] == line:
+                cached = entry[1]
+            filledList.append(cached)
+    return filledList
+
+def appendList(filename, lines, indexList, translations):
+    if not enabled() or filename is None or len(indexList) != len(translations):
+        return
+    key = getKey(lines)
+    rows = []
+    for index, translation in zip(indexList, translations):
+        # Skip anything that came back untranslated
+        if isinstance(translation, str) and translation not in ['', lines[index]]:
+            rows.append([key, index, lines[index], translation])
+    if len(rows) == 0:
+        return
+    with LOCK:
+        entryDict = load(filename)
+        os.makedirs(JOURNALDIR, exist_ok=True)
+        with open(getPath(filename), 'a', encoding='utf-8') as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False) + '\n')
+                entryDict[(row[0], row[1])] = [row[2], row[3]]
+            f.flush()
+            os.fsync(f.fileno())
+
+def clear(filename):
+    with LOCK:
+        JOURNALS.pop(filename, None)
+        if os.path.exists(getPath(filename)):
+            os.remove(getPath(filename))
@@ -1,13 +1,12 @@
-import sys, os, traceback
+import argparse, fnmatch, importlib, sys, os, time, traceback
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from colorama import Fore
 from tqdm import tqdm
-from dotenv import load_dotenv
+from modules import api, config, metrics, summary
 
-# This needs to be before the module imports as some of them currently try to read and use some of these values
+# This needs to be before the engine is imported as they currently try to read and use some of these values
 # upon import, in which case if they are unset the script will crash before we can output these messages.
 envMissing = False
-load_dotenv()
 for env in ['api','key','organization','model','language','timeout','fileThreads','threads','width','listWidth']:
     if os.getenv(env) is None or str(os.getenv(env))[:1] == '<':
         tqdm.write(Fore.RED + f'Environment variable {env} is not set!')
@@ -16,45 +15,30 @@ if envMissing:
     tqdm.write(Fore.RED + f'Some of the required environment values may not be set correctly. You can set \
 these values using an .env file, for an example see .env.example')
 
-from modules.rpgmakermvmz import handleMVMZ
-from modules.rpgmakerace import handleACE
-from modules.csv import handleCSV
-from modules.alice import handleAlice
-from modules.tyrano import handleTyrano
-from modules.json import handleJSON
-from modules.kansen import handleKansen
-from modules.lune import handleLune
-from modules.atelier import handleAtelier
-from modules.anim import handleAnim
-from modules.nscript import handleNScript
-from modules.wolf import handleWOLF
-from modules.wolf2 import handleWOLF2
-from modules.javascript import handleJavascript
-from modules.irissoft import handleIris
-from modules.regex import handleRegex
-
 # For GPT4 rate limit will be hit if you have more than 1 thread.
 # 1 Thread for each file. Controls how many files are worked on at once.
 THREADS = int(os.getenv('fileThreads'))
 
-# [Display name, file extension, handle function]
+# [Display name, file extension, module, handle function, pre-pass functions run before the files (Optional),
+# project function that takes every file it supports at once for --project (Optional)]
+# Engines are only imported once picked, see loadModule()
 MODULES = [
-    ["RPGMaker MV/MZ", "json", handleMVMZ],
-    ["RPGMaker ACE", "yaml", handleACE],
-    ["CSV (From Translator++)", "csv", handleCSV],
-    ["Alice", "txt", handleAlice],
-    ["Tyrano", "ks", handleTyrano],
-    ["JSON", "json", handleJSON],
-    ["Kansen", "ks", handleKansen],
-    ["Lune", "json", handleLune],
-    ["Atelier", "txt", handleAtelier],
-    ["Anim", "json", handleAnim],
-    ["NScript", "txt", handleNScript],
-    ["Wolf", "json", handleWOLF],
-    ["Wolf", "txt", handleWOLF2],
-    ["Javascript", "js", handleJavascript],
-    ["Iris", "txt", handleIris],
-    ["Regex", "txt", handleRegex],
+    ["RPGMaker MV/MZ", "json", "modules.rpgmakermvmz", "handleMVMZ", ["speakersMVMZ", "dedupMVMZ"], "handleProjectMVMZ"],
+    ["RPGMaker ACE", "yaml", "modules.rpgmakerace", "handleACE"],
+    ["CSV (From Translator++)", "csv", "modules.csv", "handleCSV"],
+    ["Alice", "txt", "modules.alice", "handleAlice"],
+    ["Tyrano", "ks", "modules.tyrano", "handleTyrano", ["speakersTyrano"]],
+    ["JSON", "json", "modules.json", "handleJSON"],
+    ["Kansen", "ks", "modules.kansen", "handleKansen"],
+    ["Lune", "json", "modules.lune", "handleLune"],
+    ["Atelier", "txt", "modules.atelier", "handleAtelier"],
+    ["Anim", "json", "modules.anim", "handleAnim"],
+    ["NScript", "txt", "modules.nscript", "handleNScript", ["speakersNScript"]],
+    ["Wolf", "json", "modules.wolf", "handleWOLF", ["speakersWOLF"]],
+    ["Wolf", "txt", "modules.wolf2", "handleWOLF2"],
+    ["Javascript", "js", "modules.javascript", "handleJavascript"],
+    ["Iris", "txt", "modules.irissoft", "handleIris"],
+    ["Regex", "txt", "modules.regex", "handleRegex"],
 ]
 
 # Info Message
@@ -63,8 +47,67 @@ translated data. If a file fails or gets stuck, translated lines will remain tra
 to worry about being charged twice. You can simply copy the file generated in /translations back over to \
 /files and start the script again. It will skip over any translated text." + Fore.RESET, end='\n\n')
 
+def getArgs():
+    # Everything can be passed as flags for headless runs, anything left out is asked for like before
+    parser = argparse.ArgumentParser(description='Translate game files with the OpenAI API.')
+    parser.add_argument('--engine', help='Engine number from the menu or module name (e.g. rpgmakermvmz, csv, wolf2)')
+    parser.add_argument('--mode', choices=['translate', 'estimate'])
+    parser.add_argument('--input', help='Folder with the files to translate (Default: files)')
+    parser.add_argument('--output', help='Folder to write translated files to (Default: translated)')
+    parser.add_argument('--glob', action='append', help='Only run files matching this pattern, can be repeated')
+    parser.add_argument('--file-threads', type=int, help='Files worked on at once (fileThreads)')
+    parser.add_argument('--threads', type=int, help='Threads per file (threads)')
+    parser.add_argument('--requests', type=int, help='Requests in flight at once for async engines (requests)')
+    parser.add_argument('--batch-tokens', type=int, help='Token budget per request (batchTokens)')
+    parser.add_argument('--batch-lines', type=int, help='Max lines per request (batchLines)')
+    parser.add_argument('--fixed-batch', action='store_true', help='Turn off the adaptive batch size (adaptiveBatch)')
+    parser.add_argument('--previous-files', help='Untranslated files from the last version, only changes get translated (previousFiles)')
+    parser.add_argument('--previous-translated', help='Translated files from the last version (previousTranslated)')
+    parser.add_argument('--csv-format', choices=['1', '2'], help='CSV format, 1. Translator++ 2. Translate All')
+    parser.add_argument('--project', action='store_true', help='Translate the whole project as one corpus instead of file by file (project)')
+    parser.add_argument('--keep-files', action='store_true', help="Don't clear the input folder after translating")
+    parser.add_argument('--summary', help="Write a JSON summary of the run to this path ('-' for stdout)")
+    return parser.parse_args()
+
+def getEngine(engine):
+    # Menu number or module name
+    if engine.isdigit() and int(engine) - 1 in range(len(MODULES)):
+        return int(engine) - 1
+    for position, module in enumerate(MODULES):
+        if module[2].split('.')[-1] == engine.lower():
+            return position
+    raise SystemExit(f'Unknown engine {engine}')
+
+def setOptions(args):
+    # Engine modules read these on import so this has to happen before loadModule()
+    global THREADS
+    optionList = [
+        ['fileThreads', args.file_threads],
+        ['threads', args.threads],
+        ['requests', args.requests],
+        ['batchTokens', args.batch_tokens],
+        ['batchLines', args.batch_lines],
+        ['csvFormat', args.csv_format],
+        ['previousFiles', args.previous_files],
+        ['previousTranslated', args.previous_translated],
+        ['adaptiveBatch', 'False' if args.fixed_batch else None],
+        ['project', 'True' if args.project else None],
+    ]
+    for env, value in optionList:
+        if value is not None:
+            os.environ[env] = str(value)
+    THREADS = int(os.getenv('fileThreads'))
+    if args.input is not None:
+        config.FILES = args.input
+    if args.output is not None:
+        config.TRANSLATED = args.output
+    os.makedirs(config.TRANSLATED, exist_ok=True)
+
 def main():
-    estimate = ''
+    args = getArgs()
+    setOptions(args)
+
+    estimate = {'translate': False, 'estimate': True}.get(args.mode, '')
     while estimate == '':
         estimate = input('Select Translation or Cost Estimation:\n\n 1. Translate\n 2. Estimate\n')
         match estimate:
@@ -75,8 +118,8 @@ def main():
             case _:
                 estimate = ''
     
-    version = ''
-    while True:
+    version = getEngine(args.engine) if args.engine is not None else ''
+    while version == '':
         tqdm.write("Select game engine:\n")
         for position, module in enumerate(MODULES):
             tqdm.write(f'{str(position + 1).rjust(2)}. {module[0]} (.{module[1]})')
@@ -84,32 +127,86 @@ def main():
         try:
             version = int(version) - 1
         except:
+            version = ''
             continue
-        if version in range(len(MODULES)):
-            break    
+        if version not in range(len(MODULES)):
+            version = ''
 
     totalCost = Fore.RED + 'Translation module didn\'t return the total cost. Make sure the \
 files to translate are in the /files folder and that you picked the right game engine.'
 
+    start = time.time()
+    globList = args.glob or ['*']
+    filenameList = [filename for filename in os.listdir(config.FILES) if filename.endswith(MODULES[version][1]) \
+                    and any(fnmatch.fnmatch(filename, pattern) for pattern in globList)]
+    handleFunction, prepassList, projectFunction = loadModule(MODULES[version])
+
+    # Whole project passes (Speaker names, repeated lines) before the files start
+    for prepassFunction in prepassList:
+        try:
+            prepassFunction(filenameList, estimate)
+        except Exception as e:
+            tracebackLineNo = str(traceback.extract_tb(sys.exc_info()[2])[-1].lineno)
+            tqdm.write(Fore.RED + str(e) + '|' + tracebackLineNo + Fore.RESET)
+
+    # Project mode, the engine takes every file it can in one go and the rest are opened like normal
+    resultDict = {}
+    if os.getenv('project', 'False').lower() not in ['false', '0', '']:
+        if projectFunction is None:
+            tqdm.write(Fore.YELLOW + f'{MODULES[version][0]} has no project mode, translating file by file.' + Fore.RESET)
+        else:
+            try:
+                resultDict = projectFunction(filenameList, estimate)
+                for result in resultDict.values():
+                    if isinstance(result, str):
+                        totalCost = result
+            except Exception as e:
+                tracebackLineNo = str(traceback.extract_tb(sys.exc_info()[2])[-1].lineno)
+                tqdm.write(Fore.RED + str(e) + '|' + tracebackLineNo + Fore.RESET)
+
     # Open File (Threads)
     with ThreadPoolExecutor(max_workers=THREADS) as executor:
-        futures = [executor.submit(MODULES[version][2], filename, estimate) \
-                    for filename in os.listdir("files") if filename.endswith(MODULES[version][1])]
+        futures = {executor.submit(runFile, handleFunction, filename, estimate): filename for filename in filenameList \
+                   if filename not in resultDict}
                     
         for future in as_completed(futures):
             try:
                 totalCost = future.result()
+                resultDict[futures[future]] = totalCost
             except Exception as e:
+                resultDict[futures[future]] = e
                 tracebackLineNo = str(traceback.extract_tb(sys.exc_info()[2])[-1].lineno)
                 tqdm.write(Fore.RED + str(e) + '|' + tracebackLineNo + Fore.RESET)
 
     if totalCost != 'Fail':
-        if estimate is False:
+        if estimate is False and not args.keep_files:
             # This is to encourage people to grab what's in /translated instead
-            deleteFolderFiles('files')
+            deleteFolderFiles(config.FILES)
 
         tqdm.write(str(totalCost))
 
+    # Final metrics snapshot
+    metrics.write()
+
+    # Machine readable summary
+    summaryDict = summary.build(MODULES[version][2].split('.')[-1], 'estimate' if estimate else 'translate', \
+                                resultDict, time.time() - start, sys.modules[MODULES[version][2]])
+    if args.summary is not None:
+        summary.write(summaryDict, args.summary)
+    return 1 if summaryDict['failed'] > 0 else 0
+
+def runFile(handleFunction, filename, estimate):
+    # Requests that get stuck outside of a page still say which file they were for
+    api.LABEL.set(filename)
+    return handleFunction(filename, estimate)
+
+def loadModule(module):
+    # Returns [handle function, pre-pass functions, project function (None if there isn't one)]
+    engineModule = importlib.import_module(module[2])
+    prepassList = [getattr(engineModule, name) for name in module[4]] if len(module) > 4 else []
+    projectFunction = getattr(engineModule, module[5]) if len(module) > 5 else None
+    return [getattr(engineModule, module[3]), prepassList, projectFunction]
+
 def deleteFolderFiles(folderPath):
     for filename in os.listdir(folderPath):
         file_path = os.path.join(folderPath, filename)
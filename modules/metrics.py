@@ -0,0 +1,140 @@
+# Libraries
+import json, os, threading, time
+from collections import deque
+from contextlib import contextmanager
+from modules import config
+
+# Metrics
+# One registry for the whole run. Modules count things (requests, tokens, cache hits, mismatches) and time
+# stages (API calls, subVars, JSON dump...) here and a snapshot is written to metrics.json/metrics.prom every
+# few seconds and at the end of the run, so a slow run shows where the time actually went.
+METRICS = config.getenv('metrics', 'metrics')     # File prefix, "" to not write anything
+INTERVAL = float(config.getenv('metricsInterval') or 15)
+SAMPLES = 10000     # Latest samples kept per histogram for percentiles
+QUANTILES = [0.5, 0.9, 0.99]
+LOCK = threading.Lock()
+COUNTERS = {}   # (name, labels) -> value
+HISTOGRAMS = {} # (name, labels) -> [count, sum, deque of samples]
+WRITER = None
+
+def getKey(name, labels):
+    return (name, tuple(sorted(labels.items())))
+
+def increment(name, value=1, **labels):
+    with LOCK:
+        key = getKey(name, labels)
+        COUNTERS[key] = COUNTERS.get(key, 0) + value
+    startWriter()
+
+def observe(name, value, **labels):
+    with LOCK:
+        key = getKey(name, labels)
+        histogram = HISTOGRAMS.setdefault(key, [0, 0.0, deque(maxlen=SAMPLES)])
+        histogram[0] += 1
+        histogram[1] += value
+        histogram[2].append(value)
+    startWriter()
+
+def recordResponse(response, latency):
+    increment('requests')
+    increment('tokens', response.usage.prompt_tokens, direction='input')
+    increment('tokens', response.usage.completion_tokens, direction='output')
+    observe('api_latency_seconds', latency)
+
+def startTimer(stage):
+    # Wall time and CPU time of the calling thread, call what it returns when the stage is done. For stages
+    # too long to put in a with block.
+    start = time.perf_counter()
+    cpuStart = time.thread_time()
+    def stop():
+        observe('stage_seconds', time.perf_counter() - start, stage=stage)
+        observe('stage_cpu_seconds', time.thread_time() - cpuStart, stage=stage)
+    return stop
+
+@contextmanager
+def timer(stage):
+    stop = startTimer(stage)
+    try:
+        yield
+    finally:
+        stop()
+
+def getQuantile(sortedList, quantile):
+    if len(sortedList) == 0:
+        return 0
+    return sortedList[min(int(quantile * len(sortedList)), len(sortedList) - 1)]
+
+def snapshot():
+    with LOCK:
+        counterList = [[name, dict(labels), value] for (name, labels), value in COUNTERS.items()]
+        histogramList = [[name, dict(labels), histogram[0], histogram[1], sorted(histogram[2])] \
+                         for (name, labels), histogram in HISTOGRAMS.items()]
+    snapshotDict = {'time': time.time(), 'counters': [], 'histograms': []}
+    for name, labels, value in counterList:
+        snapshotDict['counters'].append({'name': name, 'labels': labels, 'value': value})
+    for name, labels, count, total, sampleList in histogramList:
+        snapshotDict['histograms'].append({
+            'name': name,
+            'labels': labels,
+            'count': count,
+            'sum': round(total, 6),
+            'quantiles': {str(quantile): round(getQuantile(sampleList, quantile), 6) for quantile in QUANTILES},
+            'max': round(sampleList[-1], 6) if len(sampleList) > 0 else 0,
+        })
+    return snapshotDict
+
+def getPrometheus(snapshotDict):
+    def labelString(labels, extra={}):
+        labels = {**labels, **extra}
+        if len(labels) == 0:
+            return ''
+        return '{' + ','.join(f'{key}="{value}"' for key, value in sorted(labels.items())) + '}'
+
+    lineList = []
+    typeSet = set()
+    # Everything with the same name has to be grouped under its TYPE line
+    for counter in sorted(snapshotDict['counters'], key=lambda item: item['name']):
+        name = 'dazedmtl_' + counter['name']
+        if name not in typeSet:
+            lineList.append(f'# TYPE {name} counter')
+            typeSet.add(name)
+        lineList.append(f'{name}{labelString(counter["labels"])} {counter["value"]}')
+    for histogram in sorted(snapshotDict['histograms'], key=lambda item: item['name']):
+        name = 'dazedmtl_' + histogram['name']
+        if name not in typeSet:
+            lineList.append(f'# TYPE {name} summary')
+            typeSet.add(name)
+        for quantile, value in histogram['quantiles'].items():
+            lineList.append(f'{name}{labelString(histogram["labels"], {"quantile": quantile})} {value}')
+        lineList.append(f'{name}_sum{labelString(histogram["labels"])} {histogram["sum"]}')
+        lineList.append(f'{name}_count{labelString(histogram["labels"])} {histogram["count"]}')
+    return '\n'.join(lineList) + '\n'
+
+def write():
+    if METRICS.replace(' ', '') == '':
+        return
+    snapshotDict = snapshot()
+
+    # Write to a temp file and swap so whatever is reading never sees half a file
+    for extension, text in [['json', json.dumps(snapshotDict, indent=4)], ['prom', getPrometheus(snapshotDict)]]:
+        path = f'{METRICS}.{extension}'
+        with open(path + '.tmp', 'w', encoding='utf-8') as outFile:
+            outFile.write(text)
+        os.replace(path + '.tmp', path)
+
+def startWriter():
+    global WRITER
+    if WRITER is not None or METRICS.replace(' ', '') == '':
+        return
+    with LOCK:
+        if WRITER is None:
+            WRITER = threading.Thread(target=writeLoop, daemon=True)
+            WRITER.start()
+
+def writeLoop():
+    while True:
+        time.sleep(INTERVAL)
+        try:
+            write()
+        except Exception:
+            pass
@@ -0,0 +1,155 @@
+# Libraries
+import asyncio, json, math, random, re, sys, threading, time, types, httpx, openai
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from modules import config
+
+# Mock API
+# A fake chat completions backend for testing and benchmarking without paying for (or waiting on) OpenAI.
+# Set mock="True" to use it in-process, or run `python -m modules.mock --port 8000` and point api at
+# http://localhost:8000/ to test the real client. Lines come back "translated" with their <LineN> tags, and
+# latency, errors, 429s, hung requests, dropped lines and cut off responses can all be turned on below. Every result is
+# seeded from the request so the same run gives the same output.
+MOCK = config.getenv('mock', 'False').lower() in ['true', '1']
+LATENCY = float(config.getenv('mockLatency') or 0)         # Seconds per request
+JITTER = float(config.getenv('mockJitter') or 0)           # Extra random seconds on top of LATENCY
+ERRORRATE = float(config.getenv('mockErrorRate') or 0)     # Chance of a 500
+LIMITRATE = float(config.getenv('mock429Rate') or 0)       # Chance of a 429
+RETRYAFTER = float(config.getenv('mockRetryAfter') or 1)   # Retry-After sent with a 429
+DROPRATE = float(config.getenv('mockDropRate') or 0)       # Chance a list response is missing a line
+TRUNCATERATE = float(config.getenv('mockTruncateRate') or 0)   # Chance a list response gets cut off (finish_reason length)
+CHARSPERTOKEN = float(config.getenv('mockCharsPerToken') or 2)  # Used for the usage numbers
+HANGRATE = float(config.getenv('mockHangRate') or 0)       # Chance a request hangs for HANGSECONDS (Tests the deadline)
+HANGSECONDS = float(config.getenv('mockHangSeconds') or 3600)
+SEED = config.getenv('mockSeed') or '0'
+LOCK = threading.Lock()
+COUNTS = {}     # Request content -> times seen, so a retry of the same request can come out differently
+JAREGEX = re.compile(r'[一-龠ぁ-ゔァ-ヴーｦ-ﾟ]+')
+
+def enabled():
+    return MOCK
+
+def getRandom(messages):
+    content = json.dumps(messages, ensure_ascii=False, sort_keys=True)
+    with LOCK:
+        COUNTS[content] = COUNTS.get(content, 0) + 1
+        count = COUNTS[content]
+    return random.Random(f'{SEED}:{count}:{content}')
+
+def translateLine(line):
+    # Japanese runs become "Mock", everything else (Placeholders, punctuation) stays so resubVars still works
+    return JAREGEX.sub('Mock', line)
+
+def countTokens(text):
+    return max(1, math.ceil(len(text) / CHARSPERTOKEN))
+
+def getResult(messages):
+    # [Status, Retry-After, Content, Finish Reason, Prompt Tokens, Completion Tokens, Delay]
+    rng = getRandom(messages)
+    delay = LATENCY + rng.random() * JITTER
+    if HANGRATE > 0 and rng.random() < HANGRATE:
+        delay += HANGSECONDS
+    roll = rng.random()
+    if roll < LIMITRATE:
+        return [429, RETRYAFTER, 'Rate limit reached (mock)', None, 0, 0, delay]
+    if roll < LIMITRATE + ERRORRATE:
+        return [500, None, 'Server error (mock)', None, 0, 0, delay]
+
+    user = messages[-1]['content']
+    lineList = re.findall(r'<Line(\d+)>(.*?)</Line\d+>', user)
+    finishReason = 'stop'
+    if len(lineList) > 0:
+        lineList = [[index, translateLine(line)] for index, line in lineList]
+
+        # Break the response on purpose
+        if len(lineList) > 1 and rng.random() < DROPRATE:
+            lineList.pop(rng.randrange(len(lineList)))
+        if len(lineList) > 1 and rng.random() < TRUNCATERATE:
+            lineList = lineList[:len(lineList) // 2]
+            finishReason = 'length'
+        content = '\n'.join(f'`<Line{index}>{line}</Line{index}>`' for index, line in lineList)
+    else:
+        content = translateLine(re.sub(r'^Line to Translate = ', '', user))
+    promptTokens = sum(countTokens(str(message['content'])) for message in messages)
+    return [200, None, content, finishReason, promptTokens, countTokens(content), delay]
+
+def getResponse(result, model):
+    status, retryAfter, content, finishReason, promptTokens, completionTokens, delay = result
+    message = types.SimpleNamespace(role='assistant', content=content)
+    return types.SimpleNamespace(
+        id='mock',
+        model=model,
+        choices=[types.SimpleNamespace(index=0, message=message, finish_reason=finishReason)],
+        usage=types.SimpleNamespace(prompt_tokens=promptTokens, completion_tokens=completionTokens, \
+                                    total_tokens=promptTokens + completionTokens),
+    )
+
+def getError(result):
+    # Same exceptions the real client raises
+    status, retryAfter, content = result[:3]
+    headers = {'retry-after': str(retryAfter)} if retryAfter is not None else {}
+    response = httpx.Response(status, headers=headers, request=httpx.Request('POST', 'http://mock/chat/completions'))
+    if status == 429:
+        return openai.RateLimitError(content, response=response, body=None)
+    return openai.InternalServerError(content, response=response, body=None)
+
+def create(**kwargs):
+    # Gives up after timeout= like the real client
+    result = getResult(kwargs['messages'])
+    if kwargs.get('timeout') is not None and result[6] > kwargs['timeout']:
+        time.sleep(kwargs['timeout'])
+        raise openai.APITimeoutError(request=httpx.Request('POST', 'http://mock/chat/completions'))
+    time.sleep(result[6])
+    if result[0] != 200:
+        raise getError(result)
+    return getResponse(result, kwargs.get('model'))
+
+async def createAsync(**kwargs):
+    result = getResult(kwargs['messages'])
+    await asyncio.sleep(result[6])
+    if result[0] != 200:
+        raise getError(result)
+    return getResponse(result, kwargs.get('model'))
+
+# Drop in replacements for openai.chat and openai.AsyncOpenAI().chat
+CHAT = types.SimpleNamespace(completions=types.SimpleNamespace(create=create))
+ASYNCCLIENT = types.SimpleNamespace(chat=types.SimpleNamespace(completions=types.SimpleNamespace(create=createAsync)))
+
+class MockHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)) or '{}')
+        result = getResult(body.get('messages', []))
+        time.sleep(result[6])
+        if result[0] != 200:
+            payload = {'error': {'message': result[2], 'type': 'mock_error', 'code': result[0]}}
+        else:
+            response = getResponse(result, body.get('model'))
+            payload = {
+                'id': response.id,
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': response.model,
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': result[2]}, 'finish_reason': result[3]}],
+                'usage': vars(response.usage),
+            }
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(result[0])
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        if result[1] is not None:
+            self.send_header('Retry-After', str(result[1]))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+def serve(port):
+    # Runs in the background, returns the server so it can be shut down
+    server = ThreadingHTTPServer(('127.0.0.1', port), MockHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == '__main__':
+    port = int(sys.argv[sys.argv.index('--port') + 1]) if '--port' in sys.argv else 8000
+    print(f'Mock API running on http://127.0.0.1:{port}/')
+    ThreadingHTTPServer(('127.0.0.1', port), MockHandler).serve_forever()
@@ -0,0 +1,64 @@
+# Libraries
+import threading, time, tiktoken
+from modules import config
+
+# Rate Limits
+# Every file thread and page thread shares these buckets so the total number of requests going out
+# never goes past what the API allows, no matter what fileThreads and threads are set to. 0 = No limit
+RPM = int(config.getenv('rpm') or 0)
+TPM = int(config.getenv('tpm') or 0)
+LOCK = threading.Lock()
+ENCODING = None
+
+# Buckets start full. [Available, Capacity (per minute)]
+REQUESTBUCKET = [RPM, RPM]
+TOKENBUCKET = [TPM, TPM]
+LASTREFILL = time.monotonic()
+
+def getEncoding():
+    global ENCODING
+    if ENCODING is None:
+        ENCODING = tiktoken.encoding_for_model('gpt-4')
+    return ENCODING
+
+def estimateTokens(messages):
+    enc = getEncoding()
+    inputTokens = sum(len(enc.encode(message['content'])) for message in messages)
+
+    # Output is roughly the size of the text being translated, give it some room
+    outputTokens = len(enc.encode(messages[-1]['content'])) * 2
+    return inputTokens + outputTokens
+
+def refill():
+    global LASTREFILL
+    now = time.monotonic()
+    elapsed = now - LASTREFILL
+    LASTREFILL = now
+    for bucket in [REQUESTBUCKET, TOKENBUCKET]:
+        bucket[0] = min(bucket[1], bucket[0] + elapsed * bucket[1] / 60)
+
+def reserve(tokens):
+    # Takes what the request needs right away (buckets can go negative) and returns how long to
+    # wait until that would have been available. Requests go out in the order they asked.
+    with LOCK:
+        refill()
+        wait = 0
+        if RPM > 0:
+            REQUESTBUCKET[0] -= 1
+            wait = max(wait, -REQUESTBUCKET[0] * 60 / RPM)
+        if TPM > 0:
+            TOKENBUCKET[0] -= min(tokens, TPM)
+            wait = max(wait, -TOKENBUCKET[0] * 60 / TPM)
+        return wait
+
+def acquire(tokens):
+    wait = reserve(tokens)
+    if wait > 0:
+        time.sleep(wait)
+
+def settle(estimate, actual):
+    # Give back (or take) the difference once we know what the request actually cost, 0 if it failed.
+    # reserve() only took up to TPM.
+    if TPM > 0:
+        with LOCK:
+            TOKENBUCKET[0] = min(TPM, TOKENBUCKET[0] + min(estimate, TPM) - actual)
@@ -1,27 +1,17 @@
 # Libraries
-import json, os, re, textwrap, threading, time, traceback, tiktoken, openai
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from pathlib import Path
+import json, os, re, textwrap, threading, time, traceback, tiktoken
 from colorama import Fore
-from dotenv import load_dotenv
-from retry import retry
 from tqdm import tqdm
+from modules import api, batching, cache, codes, config, journal, metrics, scheduler, speakers, summary
 from ruamel.yaml import YAML
 
 
-# Open AI
-load_dotenv()
-if os.getenv('api').replace(' ', '') != '':
-    openai.base_url = os.getenv('api')
-openai.organization = os.getenv('org')
-openai.api_key = os.getenv('key')
-
 #Globals
 MODEL = os.getenv('model')
 TIMEOUT = int(os.getenv('timeout'))
 LANGUAGE = os.getenv('language').capitalize()
-PROMPT = Path('prompt.txt').read_text(encoding='utf-8')
-VOCAB = Path('vocab.txt').read_text(encoding='utf-8')
+PROMPT = config.PROMPT
+VOCAB = config.VOCAB
 THREADS = int(os.getenv('threads'))
 LOCK = threading.Lock()
 WIDTH = int(os.getenv('width'))
@@ -30,7 +20,6 @@ NOTEWIDTH = int(os.getenv('noteWidth'))
 MAXHISTORY = 10
 ESTIMATE = ''
 TOKENS = [0, 0]
-NAMESLIST = []
 NAMES = False    # Output a list of all the character names found
 BRFLAG = False   # If the game uses <br> instead
 FIXTEXTWRAP = True  # Overwrites textwrap
@@ -39,6 +28,19 @@ MISMATCH = []   # Lists files that throw a mismatch error (Length of GPT list re
 BRACKETNAMES = False
 PBAR = None
 
+# Note tags translated on Armors, Weapons and Items. [Marker, Regex], the first group is the text.
+NOTETAGS = [
+    ['<hint:', r'<hint:(.*?)>'],
+    ['<SGDescription:', r'<SGDescription:(.*?)>'],
+    ['<SG説明:', r'<SG説明:(.*?)>'],
+    ['<SG説明2:', r'<SG説明2:(.*?)>'],
+    ['<SG説明3:', r'<SG説明3:(.*?)>'],
+    ['<SG説明4:', r'<SG説明4:(.*?)>'],
+    ['<SGカテゴリ:', r'<SGカテゴリ:(.*?)>'],
+    ['Switch Shop Description', r'<Switch Shop Description>\n(.*)\n'],
+    ['<MapText:', r'<MapText:(.*?)>'],
+]
+
 # Pricing - Depends on the model https://openai.com/pricing
 # Batch Size - GPT 3.5 Struggles past 15 lines per request. GPT4 struggles past 50 lines per request
 # If you are getting a MISMATCH LENGTH error, lower the batch size.
@@ -93,11 +95,16 @@ def handleACE(filename, estimate):
     # Translate
     if not estimate:
         try:
-            with open('translated/' + filename, 'w', encoding='utf-8') as outFile:
+            with open(os.path.join(config.TRANSLATED, filename), 'w', encoding='utf-8') as outFile:
                 yaml=YAML(pure=True)
                 yaml.width = 4096
                 yaml.default_style = "'"
-                yaml.dump(translatedData[0], outFile)
+                with metrics.timer('yamlDump'):
+                    yaml.dump(translatedData[0], outFile)
+
+            # Everything made it to disk, journal isn't needed anymore
+            if translatedData[2] is None:
+                journal.clear(filename)
         except Exception:
             traceback.print_exc()
             return 'Fail'
@@ -123,75 +130,89 @@ def openFiles(filename):
     yaml.width = 4096
     yaml.default_style = "'"
 
-    with open('files/' + filename, 'r', encoding='UTF-8') as f:
+    with open(os.path.join(config.FILES, filename), 'r', encoding='UTF-8') as f:
         # Map Files
         if 'Map' in filename and filename != 'MapInfos.json':
-            data = yaml.load(f)
+            with metrics.timer('yamlLoad'):
+                data = yaml.load(f)
             translatedData = parseMap(data, filename)
 
         # CommonEvents Files
         elif 'CommonEvents' in filename:
-            data = yaml.load(f)
+            with metrics.timer('yamlLoad'):
+                data = yaml.load(f)
             translatedData = parseCommonEvents(data, filename)
 
         # Actor File
         elif 'Actors' in filename:
-            data = yaml.load(f)
+            with metrics.timer('yamlLoad'):
+                data = yaml.load(f)
             translatedData = parseNames(data, filename, 'Actors')
 
         # Armor File
         elif 'Armors' in filename:
-            data = yaml.load(f)
+            with metrics.timer('yamlLoad'):
+                data = yaml.load(f)
             translatedData = parseNames(data, filename, 'Armors')
 
         # Weapons File
         elif 'Weapons' in filename:
-            data = yaml.load(f)
+            with metrics.timer('yamlLoad'):
+                data = yaml.load(f)
             translatedData = parseNames(data, filename, 'Weapons')
         
         # Classes File
         elif 'Classes' in filename:
-            data = yaml.load(f)
+            with metrics.timer('yamlLoad'):
+                data = yaml.load(f)
             translatedData = parseNames(data, filename, 'Classes')
 
         # Enemies File
         elif 'Enemies' in filename:
-            data = yaml.load(f)
+            with metrics.timer('yamlLoad'):
+                data = yaml.load(f)
             translatedData = parseNames(data, filename, 'Enemies')
 
         # Items File
         elif 'Items' in filename:
-            data = yaml.load(f)
+            with metrics.timer('yamlLoad'):
+                data = yaml.load(f)
             translatedData = parseNames(data, filename, 'Items')
 
         # MapInfo File
         elif 'MapInfos' in filename:
-            data = yaml.load(f)
+            with metrics.timer('yamlLoad'):
+                data = yaml.load(f)
             translatedData = parseNames(data, filename, 'MapInfos')
 
         # Skills File
         elif 'Skills' in filename:
-            data = yaml.load(f)
+            with metrics.timer('yamlLoad'):
+                data = yaml.load(f)
             translatedData = parseNames(data, filename, 'Skills')
 
         # Troops File
         elif 'Troops' in filename:
-            data = yaml.load(f)
+            with metrics.timer('yamlLoad'):
+                data = yaml.load(f)
             translatedData = parseTroops(data, filename)
 
         # States File
         elif 'States' in filename:
-            data = yaml.load(f)
+            with metrics.timer('yamlLoad'):
+                data = yaml.load(f)
             translatedData = parseSS(data, filename)
 
         # System File
         elif 'System' in filename:
-            data = yaml.load(f)
+            with metrics.timer('yamlLoad'):
+                data = yaml.load(f)
             translatedData = parseSystem(data, filename)
 
         # Scenario File
         elif 'Scenario' in filename:
-            data = yaml.load(f)
+            with metrics.timer('yamlLoad'):
+                data = yaml.load(f)
             translatedData = parseScenario(data, filename)
 
         else:
@@ -218,6 +239,7 @@ def getResultString(translatedData, translationTime, filename):
             raise translatedData[2]
         except Exception as e:
             traceback.print_exc()
+            summary.recordError(filename, e)
             errorString = str(e) + Fore.RED
             return filename + ': ' + totalTokenstring + timeString + Fore.RED + u' \u2717 ' +\
                 errorString + Fore.RESET
@@ -235,21 +257,18 @@ def parseMap(data, filename):
         totalTokens[1] += response[1][1]
         data['display_name'] = response[0].replace('\"', '')
     
-    # Thread for each page in file
+    # Every page in the file goes on the run queue at once, see scheduler.py
     with tqdm(bar_format=BAR_FORMAT, position=POSITION, leave=LEAVE) as pbar:
         pbar.desc=filename
-        with ThreadPoolExecutor(max_workers=THREADS) as executor:
-            for key in events:
-                if key is not None:
-                    futures = [executor.submit(searchCodes, page, pbar, [], filename) for page in events[key]['pages'] if page is not None]
-                    for future in as_completed(futures):
-                        try:
-                            totalTokensFuture = future.result()
-                            totalTokens[0] += totalTokensFuture[0]
-                            totalTokens[1] += totalTokensFuture[1]
-                        except Exception as e:
-                            traceback.print_exc()
-                            return [data, totalTokens, e]
+        pageDict = {f'{filename} [{key}:{i}]': page for key in events if key is not None \
+                    for i, page in enumerate(events[key]['pages']) if page is not None}
+        try:
+            response = scheduler.runPages(searchCodes, pageDict, pbar, filename)
+            totalTokens[0] += response[0]
+            totalTokens[1] += response[1]
+        except Exception as e:
+            traceback.print_exc()
+            return [data, totalTokens, e]
     return [data, totalTokens, None]
 
 def translateNote(event, regex):
@@ -279,6 +298,43 @@ def translateNote(event, regex):
         return tokens
     return [0,0]
 
+def translateNotes(recordList):
+    # Every NOTETAGS match in the file as one list. Matches are found on the original note and put back
+    # by position, so a tag that shows up twice (or the same text in two tags) is still set correctly.
+    totalTokens = [0, 0]
+    matchList = []  # [Record, Tag, Match Index, Start, End]
+    for record in recordList:
+        if record is None or not isinstance(record.get('note'), str):
+            continue
+        for tag, (marker, regex) in enumerate(NOTETAGS):
+            if marker in record['note']:
+                for index, match in enumerate(re.finditer(regex, record['note'], re.DOTALL)):
+                    matchList.append([record, tag, index, match.start(1), match.end(1)])
+    if len(matchList) == 0:
+        return totalTokens
+
+    # Translate
+    textList = [record['note'][start:end].replace('\n', ' ') for record, tag, index, start, end in matchList]
+    response = translateLists([[textList, 'Reply with only the '+ LANGUAGE +' translation.']])[0]
+    totalTokens[0] += response[1][0]
+    totalTokens[1] += response[1][1]
+
+    # Set Data, back to front so earlier positions stay valid. Overlapping tags keep the first one.
+    spanDict = {}   # id(Record) -> [Record, [[Start, End, Text], ...]]
+    for (record, tag, index, start, end), translatedText in zip(matchList, response[0]):
+        translatedText = textwrap.fill(translatedText, width=NOTEWIDTH).replace('\"', '')
+        spanDict.setdefault(id(record), [record, []])[1].append([start, end, translatedText])
+    for record, spanList in spanDict.values():
+        note = record['note']
+        lastStart = len(note) + 1
+        for start, end, translatedText in sorted(spanList, reverse=True):
+            if end > lastStart:
+                continue
+            note = note[:start] + translatedText + note[end:]
+            lastStart = start
+        record['note'] = note
+    return totalTokens
+
 # For notes that can't have spaces.
 def translateNoteOmitSpace(event, regex):
     # Regex that only matches text inside LB.
@@ -312,16 +368,14 @@ def parseCommonEvents(data, filename):
 
     with tqdm(bar_format=BAR_FORMAT, position=POSITION, leave=LEAVE) as pbar:
         pbar.desc=filename
-        with ThreadPoolExecutor(max_workers=THREADS) as executor:
-            futures = [executor.submit(searchCodes, page, pbar, [], filename) for page in data if page is not None]
-            for future in as_completed(futures):
-                try:
-                    totalTokensFuture = future.result()
-                    totalTokens[0] += totalTokensFuture[0]
-                    totalTokens[1] += totalTokensFuture[1]
-                except Exception as e:
-                    traceback.print_exc()
-                    return [data, totalTokens, e]
+        try:
+            pageDict = {f'{filename} [{i}]': page for i, page in enumerate(data) if page is not None}
+            response = scheduler.runPages(searchCodes, pageDict, pbar, filename)
+            totalTokens[0] += response[0]
+            totalTokens[1] += response[1]
+        except Exception as e:
+            traceback.print_exc()
+            return [data, totalTokens, e]
     return [data, totalTokens, None]
 
 def parseTroops(data, filename):
@@ -337,18 +391,15 @@ def parseTroops(data, filename):
 
     with tqdm(bar_format=BAR_FORMAT, position=POSITION, leave=LEAVE) as pbar:
         pbar.desc=filename
-        for troop in data:
-            if troop is not None:
-                with ThreadPoolExecutor(max_workers=THREADS) as executor:
-                    futures = [executor.submit(searchCodes, page, pbar, [], filename) for page in troop['pages'] if page is not None]
-                    for future in as_completed(futures):
-                        try:
-                            totalTokensFuture = future.result()
-                            totalTokens[0] += totalTokensFuture[0]
-                            totalTokens[1] += totalTokensFuture[1]
-                        except Exception as e:
-                            traceback.print_exc()
-                            return [data, totalTokens, e]
+        pageDict = {f'{filename} [{t}:{i}]': page for t, troop in enumerate(data) if troop is not None \
+                    for i, page in enumerate(troop['pages']) if page is not None}
+        try:
+            response = scheduler.runPages(searchCodes, pageDict, pbar, filename)
+            totalTokens[0] += response[0]
+            totalTokens[1] += response[1]
+        except Exception as e:
+            traceback.print_exc()
+            return [data, totalTokens, e]
     return [data, totalTokens, None]
     
 def parseNames(data, filename, context):
@@ -374,15 +425,13 @@ def parseSS(data, filename):
                 
     with tqdm(bar_format=BAR_FORMAT, position=POSITION, leave=LEAVE) as pbar:
             pbar.desc=filename
-            for ss in data:
-                if ss is not None:
-                    try:
-                        result = searchSS(ss, pbar)       
-                        totalTokens[0] += result[0]
-                        totalTokens[1] += result[1]
-                    except Exception as e:
-                        traceback.print_exc()
-                        return [data, totalTokens, e]
+            try:
+                result = searchSS(data, pbar)
+                totalTokens[0] += result[0]
+                totalTokens[1] += result[1]
+            except Exception as e:
+                traceback.print_exc()
+                return [data, totalTokens, e]
     return [data, totalTokens, None]
 
 def parseSystem(data, filename):
@@ -422,16 +471,14 @@ def parseScenario(data, filename):
 
     with tqdm(bar_format=BAR_FORMAT, position=POSITION, leave=LEAVE) as pbar:
         pbar.desc=filename
-        with ThreadPoolExecutor(max_workers=THREADS) as executor:
-            futures = [executor.submit(searchCodes, page[1], pbar, [], filename) for page in data.items() if page[1] is not None]
-            for future in as_completed(futures):
-                try:
-                    totalTokensFuture = future.result()
-                    totalTokens[0] += totalTokensFuture[0]
-                    totalTokens[1] += totalTokensFuture[1]
-                except Exception as e:
-                    traceback.print_exc()
-                    return [data, totalTokens, e]
+        try:
+            pageDict = {f'{filename} [{key}]': page for key, page in data.items() if page is not None}
+            response = scheduler.runPages(searchCodes, pageDict, pbar, filename)
+            totalTokens[0] += response[0]
+            totalTokens[1] += response[1]
+        except Exception as e:
+            traceback.print_exc()
+            return [data, totalTokens, e]
     return [data, totalTokens, None]
 
 def searchNames(data, pbar, context):
@@ -465,6 +512,18 @@ def searchNames(data, pbar, context):
     if 'Skills' in context:
         newContext = 'Reply with only the '+ LANGUAGE +' translation of the RPG skill name'
 
+    # Note tags of every item at once
+    if context in ['Armors', 'Weapons', 'Items']:
+        response = translateNotes(data)
+        totalTokens[0] += response[0]
+        totalTokens[1] += response[1]
+
+    # Action logs of every skill at once
+    if context in ['Skills']:
+        response = translateMessages(data)
+        totalTokens[0] += response[0]
+        totalTokens[1] += response[1]
+
     # Names
     while i < len(data) or filling == True:
         if i < len(data):
@@ -489,42 +548,6 @@ def searchNames(data, pbar, context):
                 if len(nameList) < BATCHSIZE:
                     nameList.append(data[i]['name'])
                     descriptionList.append(data[i]['description'].replace('\n', ' '))
-                    if '<hint:' in data[i]['note']:
-                        tokensResponse = translateNote(data[i], r'<hint:(.*?)>')
-                        totalTokens[0] += tokensResponse[0]
-                        totalTokens[1] += tokensResponse[1]
-                    if '<SGDescription:' in data[i]['note']:
-                        tokensResponse = translateNote(data[i], r'<SGDescription:(.*?)>')
-                        totalTokens[0] += tokensResponse[0]
-                        totalTokens[1] += tokensResponse[1]
-                    if '<SG説明:' in data[i]['note']:
-                        tokensResponse = translateNote(data[i], r'<SG説明:(.*?)>')
-                        totalTokens[0] += tokensResponse[0]
-                        totalTokens[1] += tokensResponse[1]
-                    if '<SG説明2:' in data[i]['note']:
-                        tokensResponse = translateNote(data[i], r'<SG説明2:(.*?)>')
-                        totalTokens[0] += tokensResponse[0]
-                        totalTokens[1] += tokensResponse[1]
-                    if '<SG説明3:' in data[i]['note']:
-                        tokensResponse = translateNote(data[i], r'<SG説明3:(.*?)>')
-                        totalTokens[0] += tokensResponse[0]
-                        totalTokens[1] += tokensResponse[1]
-                    if '<SG説明4:' in data[i]['note']:
-                        tokensResponse = translateNote(data[i], r'<SG説明4:(.*?)>')
-                        totalTokens[0] += tokensResponse[0]
-                        totalTokens[1] += tokensResponse[1]
-                    if '<SGカテゴリ:' in data[i]['note']:
-                        tokensResponse = translateNote(data[i], r'<SGカテゴリ:(.*?)>')
-                        totalTokens[0] += tokensResponse[0]
-                        totalTokens[1] += tokensResponse[1]
-                    if 'Switch Shop Description' in data[i]['note']:
-                        tokensResponse = translateNote(data[i], r'<Switch Shop Description>\n(.*)\n')
-                        totalTokens[0] += tokensResponse[0]
-                        totalTokens[1] += tokensResponse[1]
-                    if '<MapText:' in data[i]['note']:
-                        tokensResponse = translateNote(data[i], r'<MapText:(.*?)>')
-                        totalTokens[0] += tokensResponse[0]
-                        totalTokens[1] += tokensResponse[1]
                     
                     i += 1
                 else:
@@ -534,26 +557,6 @@ def searchNames(data, pbar, context):
                     nameList.append(data[i]['name'])
                     descriptionList.append(data[i]['description'].replace('\n', ' '))
                     
-                    # Messages
-                    number = 1
-                    while number < 5:
-                        if f'message{number}' in data[i]:
-                            if len(data[i][f'message{number}']) > 0 and data[i][f'message{number}'][0] in ['は', 'を', 'の', 'に', 'が']:
-                                msgResponse = translateGPT('Taro' + data[i][f'message{number}'], 'reply with only the gender neutral '+ LANGUAGE +' translation of the action log. Always start the sentence with Taro. For example, Translate \'Taroを倒した！\' as \'Taro was defeated!\'', False)
-                                data[i][f'message{number}'] = msgResponse[0].replace('Taro', '')
-                                totalTokens[0] += msgResponse[1][0]
-                                totalTokens[1] += msgResponse[1][1]
-                                number += 1
-
-                            else:
-                                msgResponse = translateGPT(data[i][f'message{number}'], 'reply with only the gender neutral '+ LANGUAGE +' translation', False)
-                                data[i][f'message{number}'] = msgResponse[0]
-                                totalTokens[0] += msgResponse[1][0]
-                                totalTokens[1] += msgResponse[1][1]
-                                number += 1
-                        else:
-                            number += 1
-                    
                     i += 1
                 else:
                     batchFull = True
@@ -690,28 +693,22 @@ def searchNames(data, pbar, context):
 
     return totalTokens
 
-def searchCodes(page, pbar, jobList, filename):
-    if len(jobList) > 0:
-        docList = jobList[0]
-        scriptList = jobList[1]
-        setData = True
-    else:
-        docList = []
-        scriptList = []
-        setData = False
+def searchCodes(page, pbar, filename):
+    docList = []
+    scriptList = []
+    docSetList = []     # [Command Index, Code, nCase, Nametag, Speaker, CLFlag, varString] for every docList line
+    scriptSetList = []  # Command Index for every scriptList line
     currentGroup = []
     textHistory = []
     match = []
     totalTokens = [0, 0]
     translatedText = ''
     speaker = ''
-    speakerID = None
     nametag = ''
     syncIndex = 0
     CLFlag = False
     maxHistory = MAXHISTORY
     global LOCK
-    global NAMESLIST
     global MISMATCH
     global PBAR
     with LOCK:
@@ -719,6 +716,7 @@ def searchCodes(page, pbar, jobList, filename):
 
 
     # Begin Parsing File
+    stopExtract = metrics.startTimer('extract')
     try:
         # Normal Format
         if 'list' in page:
@@ -743,7 +741,6 @@ def searchCodes(page, pbar, jobList, filename):
                 # Save Code and starting index (j)
                 code = codeList[i]['c']
                 j = i
-                endtag = ''
 
                 # Grab String
                 if len(codeList[i]['p']) > 0:
@@ -806,6 +803,7 @@ def searchCodes(page, pbar, jobList, filename):
 
                     # Set Back
                     codeList[i]['p'] = [finalJAString]
+                    textIndex = i
 
                     ### \\n<Speaker>
                     nCase = None
@@ -855,7 +853,6 @@ def searchCodes(page, pbar, jobList, filename):
                             match1 = matchList[0][3]
 
                         # Translate Speaker
-                        speakerID = j
                         response = getSpeaker(match1)
                         speaker = response[0]
                         totalTokens[0] += response[1][0]
@@ -873,6 +870,12 @@ def searchCodes(page, pbar, jobList, filename):
                             j += 1
                             codeList[j]['p'] = [finalJAString]
                             codeList[j]['c'] = code
+
+                            # The dialogue lives on the line after the name now, drop the joined copy
+                            if textIndex != j:
+                                codeList[textIndex]['p'] = []
+                                codeList[textIndex]['c'] = -1
+                                textIndex = j
                         else:
                             # Set nametag in string
                             codeList[j]['p'] = [fullSpeaker + finalJAString]
@@ -936,72 +939,20 @@ def searchCodes(page, pbar, jobList, filename):
                             i += 1
                             continue
 
-                    # 1st Passthrough (Grabbing Data)
-                    if setData == False:
-                        if speaker == '' and finalJAString != '':
-                            docList.append(finalJAString)
-                        elif finalJAString != '':
-                            docList.append(f'[{speaker}]: {finalJAString}')
-                        else:
-                            docList.append(speaker)
-                        speaker = ''
-                        match = []
-                        currentGroup = []
-                        syncIndex = i + 1                          
-
-                    # 2nd Passthrough (Setting Data) 
+                    # Grab Data, setText puts the translation straight back at textIndex
+                    if speaker == '' and finalJAString != '':
+                        docList.append(finalJAString)
+                    elif finalJAString != '':
+                        docList.append(f'[{speaker}]: {finalJAString}')
                     else:
-                        # Grab Translated String
-                        if len(docList) > 0:
-                            translatedText = docList[0]
-                            
-                            # Remove speaker
-                            if speaker != '':
-                                matchSpeakerList = re.findall(r'^\[?(.+?)\]?\s?[|:]\s?', translatedText)
-                                if len(matchSpeakerList) > 0:
-                                    newSpeaker = matchSpeakerList[0]
-                                    nametag = nametag.replace(speaker, newSpeaker)
-                                translatedText = re.sub(r'^\[?(.+?)\]?\s?[|:]\s?', '', translatedText)
-
-                            # Textwrap
-                            if FIXTEXTWRAP is True:
-                                translatedText = textwrap.fill(translatedText, width=WIDTH)
-                                if BRFLAG is True:
-                                    translatedText = translatedText.replace('\n', '<br>')   
-
-                            ### Add Var Strings
-                            # CL Flag
-                            if CLFlag:
-                                translatedText = '\\ac ' + translatedText
-                                translatedText = translatedText.replace('\n', '\n\\ac ')
-                                translatedText = re.sub(r'[\\]+?ac\s+', r'\\ac ', translatedText)
-                                CLFlag = False
-
-                            # Nametag
-                            if nCase == 0:
-                                translatedText = translatedText + nametag
-                            else:
-                                translatedText = nametag + translatedText
-                            nametag = ''
-
-                            # Endtag
-                            if endtag != '':
-                                translatedText = translatedText + endtag
-                                endtag = ''
-
-                            # //SE[#]
-                            translatedText = varString + translatedText
-
-                            # Set Data
-                            if speakerID != None:
-                                codeList[speakerID]['p'] = [fullSpeaker]
-                            codeList[j]['p'] = [translatedText]
-                            codeList[j]['c'] = code
-                            speaker = ''
-                            match = []
-                            currentGroup = []
-                            syncIndex = i + 1
-                            docList.pop(0)                                
+                        docList.append(speaker)
+                    docSetList.append([textIndex, codeList[textIndex]['c'], nCase, nametag, speaker, CLFlag, varString])
+                    speaker = ''
+                    nametag = ''
+                    CLFlag = False
+                    match = []
+                    currentGroup = []
+                    syncIndex = i + 1
 
             ## Event Code: 122 [Set Variables]
             if 'c' in codeList[i] and codeList[i]['c'] == 122 and CODE122 is True:
@@ -1027,30 +978,8 @@ def searchCodes(page, pbar, jobList, filename):
                     # Remove Textwrap
                     finalJAString = matchedText.group(1).replace('\\n', ' ')
 
-                    # Pass 1
-                    if setData == False:
-                        scriptList.append(finalJAString)
-
-                    # Pass 2
-                    else:  
-                        if len(scriptList) > 0:            
-                            # Grab and Replace
-                            translatedText = scriptList[0]
-                            translatedText = jaString.replace(jaString, translatedText)
-
-                            # Remove characters that may break scripts
-                            charList = ['\"', '\\n']
-                            for char in charList:
-                                translatedText = translatedText.replace(char, '')
-                        
-                            # Textwrap
-                            translatedText = textwrap.fill(translatedText, width=80)
-                            translatedText = translatedText.replace('\n', '\\n')
-                            translatedText = '\"' + translatedText + '\"'
-
-                            # Set
-                            codeList[i]['p'][4] = translatedText
-                            scriptList.pop(0)
+                    scriptList.append(finalJAString)
+                    scriptSetList.append(i)
 
             ## Event Code: 357 [Picture Text] [Optional]
             if 'c' in codeList[i] and codeList[i]['c'] == 357 and CODE357 is True:
@@ -1688,14 +1617,14 @@ def searchCodes(page, pbar, jobList, filename):
                 i += 1
 
         # End of the line
+        stopExtract()
         docListTL = []
         scriptListTL = []
-        setData = False
         PBAR = pbar
         
         # 401
         if len(docList) > 0:
-            response = translateGPT(docList, textHistory, True)
+            response = translateGPT(docList, textHistory, True, filename)
             docListTL = response[0]
             totalTokens[0] += response[1][0]
             totalTokens[1] += response[1][1]
@@ -1703,12 +1632,10 @@ def searchCodes(page, pbar, jobList, filename):
                 with LOCK:
                     if filename not in MISMATCH:
                         MISMATCH.append(filename)
-            else:
-                setData = True
 
         # 122
         if len(scriptList) > 0:
-            response = translateGPT(scriptList, textHistory, True)
+            response = translateGPT(scriptList, textHistory, True, filename)
             scriptListTL = response[0]
             totalTokens[0] += response[1][0]
             totalTokens[1] += response[1][1]
@@ -1716,12 +1643,10 @@ def searchCodes(page, pbar, jobList, filename):
                 with LOCK:
                     if filename not in MISMATCH:
                         MISMATCH.append(filename)
-            else:
-                setData = True
 
         # Start Pass 2
-        if setData:
-            searchCodes(page, pbar, [docListTL, scriptListTL], filename)
+        with metrics.timer('setData'):
+            setText(codeList, [docSetList, scriptSetList], docListTL, scriptListTL)
 
         # Delete all -1 codes
         codeListFinal = []
@@ -1746,86 +1671,133 @@ def searchCodes(page, pbar, jobList, filename):
 
     return totalTokens
 
-def searchSS(state, pbar):
-    totalTokens = [0, 0]
-
-    # Name
-    nameResponse = translateGPT(state['name'], 'Reply with only the '+ LANGUAGE +' translation of the RPG Skill name.', False) if 'name' in state else ''
+def setText(codeList, setList, docListTL, scriptListTL):
+    # 2nd Pass, every translation goes straight back to the command searchCodes found it on. A list that
+    # came back the wrong length is left alone.
+    docSetList, scriptSetList = setList
+
+    # 401
+    if len(docListTL) == len(docSetList):
+        for translatedText, (index, code, nCase, nametag, speaker, CLFlag, varString) in zip(docListTL, docSetList):
+            # Remove speaker
+            if speaker != '':
+                matchSpeakerList = re.findall(r'^\[?(.+?)\]?\s?[|:]\s?', translatedText)
+                if len(matchSpeakerList) > 0:
+                    newSpeaker = matchSpeakerList[0]
+                    nametag = nametag.replace(speaker, newSpeaker)
+                translatedText = re.sub(r'^\[?(.+?)\]?\s?[|:]\s?', '', translatedText)
 
-    # Description
-    descriptionResponse = translateGPT(state['description'], 'Reply with only the '+ LANGUAGE +' translation of the description.', False) if 'description' in state else ''
-
-    # Messages
-    message1Response = ''
-    message4Response = ''
-    message2Response = ''
-    message3Response = ''
-    
-    if 'message1' in state:
-        if len(state['message1']) > 0 and state['message1'][0] in ['は', 'を', 'の', 'に', 'が']:
-            message1Response = translateGPT('Taro' + state['message1'], 'reply with only the gender neutral '+ LANGUAGE +' translation of the action log. Always start the sentence with Taro. For example,\
-Translate \'Taroを倒した！\' as \'Taro was defeated!\'', False)
-        else:
-            message1Response = translateGPT(state['message1'], 'reply with only the gender neutral '+ LANGUAGE +' translation', False)
+            # Textwrap
+            if FIXTEXTWRAP is True:
+                with metrics.timer('textwrap'):
+                    translatedText = textwrap.fill(translatedText, width=WIDTH)
+                if BRFLAG is True:
+                    translatedText = translatedText.replace('\n', '<br>')
+
+            ### Add Var Strings
+            # CL Flag
+            if CLFlag:
+                translatedText = '\\ac ' + translatedText
+                translatedText = translatedText.replace('\n', '\n\\ac ')
+                translatedText = re.sub(r'[\\]+?ac\s+', r'\\ac ', translatedText)
+
+            # Nametag
+            if nCase == 0:
+                translatedText = translatedText + nametag
+            else:
+                translatedText = nametag + translatedText
+
+            # //SE[#]
+            translatedText = varString + translatedText
+
+            # Set Data
+            codeList[index]['p'] = [translatedText]
+            codeList[index]['c'] = code
+
+    # 122
+    if len(scriptListTL) == len(scriptSetList):
+        for translatedText, index in zip(scriptListTL, scriptSetList):
+            # Remove characters that may break scripts
+            charList = ['\"', '\\n']
+            for char in charList:
+                translatedText = translatedText.replace(char, '')
+        
+            # Textwrap
+            translatedText = textwrap.fill(translatedText, width=80)
+            translatedText = translatedText.replace('\n', '\\n')
+            translatedText = '\"' + translatedText + '\"'
 
-    if 'message2' in state:
-        if len(state['message2']) > 0 and state['message2'][0] in ['は', 'を', 'の', 'に', 'が']:
-            message2Response = translateGPT('Taro' + state['message2'], 'reply with only the gender neutral '+ LANGUAGE +' translation of the action log. Always start the sentence with Taro. For example,\
-Translate \'Taroを倒した！\' as \'Taro was defeated!\'', False)
-        else:
-            message2Response = translateGPT(state['message2'], 'reply with only the gender neutral '+ LANGUAGE +' translation', False)
+            # Set
+            codeList[index]['p'][4] = translatedText
 
-    if 'message3' in state:
-        if len(state['message3']) > 0 and state['message3'][0] in ['は', 'を', 'の', 'に', 'が']:
-            message3Response = translateGPT('Taro' + state['message3'], 'reply with only the gender neutral '+ LANGUAGE +' translation of the action log. Always start the sentence with Taro. For example,\
-Translate \'Taroを倒した！\' as \'Taro was defeated!\'', False)
-        else:
-            message3Response = translateGPT(state['message3'], 'reply with only the gender neutral '+ LANGUAGE +' translation', False)
+def searchSS(data, pbar):
+    totalTokens = [0, 0]
+    stateList = [state for state in data if state is not None]
+
+    # Names and descriptions of every state, one list each
+    requestList = [
+        [[state.get('name') for state in stateList], 'Reply with only the '+ LANGUAGE +' translation of the RPG Skill names.'],
+        [[state['description'].replace('\n', ' ') if isinstance(state.get('description'), str) else None for state in stateList], \
+         'Reply with only the '+ LANGUAGE +' translation of the descriptions.'],
+    ]
+    responseList = translateLists(requestList)
+    for response in responseList:
+        totalTokens[0] += response[1][0]
+        totalTokens[1] += response[1][1]
 
-    if 'message4' in state:
-        if len(state['message4']) > 0 and state['message4'][0] in ['は', 'を', 'の', 'に', 'が']:
-            message4Response = translateGPT('Taro' + state['message4'], 'reply with only the gender neutral '+ LANGUAGE +' translation of the action log. Always start the sentence with Taro. For example,\
-Translate \'Taroを倒した！\' as \'Taro was defeated!\'', False)
-        else:
-            message4Response = translateGPT(state['message4'], 'reply with only the gender neutral '+ LANGUAGE +' translation', False)
+    # Set Data
+    for state, name, description in zip(stateList, responseList[0][0], responseList[1][0]):
+        if 'name' in state and isinstance(name, str):
+            state['name'] = name.replace('\"', '')
+        if 'description' in state and isinstance(description, str):
+            # Textwrap
+            state['description'] = textwrap.fill(description, width=LISTWIDTH).replace('\"', '')
 
-    # if 'note' in state:
-    if 'help' in state['note']:
-        totalTokens[0] += translateNote(state, r'<help:([^>]*)>')[0]
-        totalTokens[1] += translateNote(state, r'<help:([^>]*)>')[1]
+    # Messages
+    response = translateMessages(stateList)
+    totalTokens[0] += response[0]
+    totalTokens[1] += response[1]
+
+    # Notes
+    for state in stateList:
+        if 'help' in state.get('note', ''):
+            response = translateNote(state, r'<help:([^>]*)>')
+            totalTokens[0] += response[0]
+            totalTokens[1] += response[1]
     
-    # Count totalTokens
-    totalTokens[0] += nameResponse[1][0] if nameResponse != '' else 0
-    totalTokens[1] += nameResponse[1][1] if nameResponse != '' else 0
-    totalTokens[0] += descriptionResponse[1][0] if descriptionResponse != '' else 0
-    totalTokens[1] += descriptionResponse[1][1] if descriptionResponse != '' else 0
-    totalTokens[0] += message1Response[1][0] if message1Response != '' else 0
-    totalTokens[1] += message1Response[1][1] if message1Response != '' else 0
-    totalTokens[0] += message2Response[1][0] if message2Response != '' else 0
-    totalTokens[1] += message2Response[1][1] if message2Response != '' else 0
-    totalTokens[0] += message3Response[1][0] if message3Response != '' else 0
-    totalTokens[1] += message3Response[1][1] if message3Response != '' else 0
-    totalTokens[0] += message4Response[1][0] if message4Response != '' else 0
-    totalTokens[1] += message4Response[1][1] if message4Response != '' else 0
+    return totalTokens
 
-    # Set Data
-    if 'name' in state:
-        state['name'] = nameResponse[0].replace('\"', '')
-    if 'description' in state:
-        # Textwrap
-        translatedText = descriptionResponse[0]
-        translatedText = textwrap.fill(translatedText, width=LISTWIDTH)
-        state['description'] = translatedText.replace('\"', '')
-    if 'message1' in state:
-        state['message1'] = message1Response[0].replace('\"', '').replace('Taro', '')
-    if 'message2' in state:
-        state['message2'] = message2Response[0].replace('\"', '').replace('Taro', '')
-    if 'message3' in state:
-        state['message3'] = message3Response[0].replace('\"', '').replace('Taro', '')
-    if 'message4' in state:
-        state['message4'] = message4Response[0].replace('\"', '').replace('Taro', '')
+def translateMessages(recordList):
+    # Action logs (message1-4) of every record, one list for each kind. Lines that start with a particle get
+    # "Taro" in front so GPT has a subject to work with, it's taken back out after.
+    totalTokens = [0, 0]
+    taroList = []
+    plainList = []
+    for record in recordList:
+        if record is None:
+            continue
+        for number in range(1, 5):
+            key = f'message{number}'
+            if isinstance(record.get(key), str) and len(record[key]) > 0:
+                if record[key][0] in ['は', 'を', 'の', 'に', 'が']:
+                    taroList.append([record, key])
+                else:
+                    plainList.append([record, key])
+
+    requestList = [
+        [['Taro' + record[key] for record, key in taroList], 'reply with only the gender neutral '+ LANGUAGE +' translation of the action logs. Always start the sentence with Taro. For example, Translate \'Taroを倒した！\' as \'Taro was defeated!\''],
+        [[record[key] for record, key in plainList], 'reply with only the gender neutral '+ LANGUAGE +' translation'],
+    ]
+    responseList = translateLists(requestList)
+    for response in responseList:
+        totalTokens[0] += response[1][0]
+        totalTokens[1] += response[1][1]
 
-    
+    # Set Data
+    for (record, key), translatedText in zip(taroList, responseList[0][0]):
+        record[key] = translatedText.replace('\"', '').replace('Taro', '')
+    for (record, key), translatedText in zip(plainList, responseList[1][0]):
+        record[key] = translatedText.replace('\"', '')
     return totalTokens
 
 def searchSystem(data, pbar):
@@ -1839,68 +1811,48 @@ def searchSystem(data, pbar):
     data['game_title'] = response[0].strip('.')
     
     
-    # Terms
-    for term in data['terms']:
-        if term != 'messages':
-            termList = data['terms'][term]
-            for i in range(len(termList)):  # Last item is a messages object
-                if termList[i] is not None:
-                    response = translateGPT(termList[i], context, False)
-                    totalTokens[0] += response[1][0]
-                    totalTokens[1] += response[1][1]
-                    termList[i] = response[0].replace('\"', '').strip()
-                    
-
-    # Armor Types
-    for i in range(len(data['armor_types'])):
-        response = translateGPT(data['armor_types'][i], 'Reply with only the '+ LANGUAGE +' translation of the armor type', False)
+    # Everything else goes out as one list per category instead of one request per string
+    termList = [term for term in data['terms'] if term != 'messages']
+    messages = data['terms']['messages']
+    requestList = [[data['terms'][term], context] for term in termList]
+    requestList.append([data['armor_types'], 'Reply with only the '+ LANGUAGE +' translation of the armor types'])
+    requestList.append([data['skill_types'], 'Reply with only the '+ LANGUAGE +' translation of the skill types'])
+    requestList.append([data['weapon_types'], 'Reply with only the '+ LANGUAGE +' translation of the equipment types. No disclaimers.'])
+    requestList.append([list(messages.values()), 'Reply with only the '+ LANGUAGE +' translation of the battle text.\nTranslate "常時ダッシュ" as "Always Dash"\nTranslate "次の%1まで" as Next %1.'])
+    responseList = translateLists(requestList)
+    for response in responseList:
         totalTokens[0] += response[1][0]
         totalTokens[1] += response[1][1]
-        data['armor_types'][i] = response[0].replace('\"', '').strip()
-        
 
-    # Skill Types
-    for i in range(len(data['skill_types'])):
-        response = translateGPT(data['skill_types'][i], 'Reply with only the '+ LANGUAGE +' translation', False)
-        totalTokens[0] += response[1][0]
-        totalTokens[1] += response[1][1]
-        data['skill_types'][i] = response[0].replace('\"', '').strip()
-        
-
-    # Equip Types
-    for i in range(len(data['weapon_types'])):
-        response = translateGPT(data['weapon_types'][i], 'Reply with only the '+ LANGUAGE +' translation of the equipment type. No disclaimers.', False)
-        totalTokens[0] += response[1][0]
-        totalTokens[1] += response[1][1]
-        data['weapon_types'][i] = response[0].replace('\"', '').strip()
-        
-
-    # Variables (Optional ususally)
-    # for i in range(len(data['variables'])):
-    #     response = translateGPT(data['variables'][i], 'Reply with only the '+ LANGUAGE +' translation of the title', False)
-    #     totalTokens[0] += response[1][0]
-    #     totalTokens[1] += response[1][1]
-    #     data['variables'][i] = response[0].replace('\"', '').strip()
-    #     
+    # Terms, Armor Types, Skill Types, Equip Types
+    for textList, response in zip([data['terms'][term] for term in termList] + [data['armor_types'], data['skill_types'], data['weapon_types']], responseList):
+        textList[:] = [text.replace('\"', '').strip() if isinstance(text, str) else text for text in response[0]]
 
     # Messages
-    messages = (data['terms']['messages'])
-    for key, value in messages.items():
-        response = translateGPT(value, 'Reply with only the '+ LANGUAGE +' translation of the battle text.\nTranslate "常時ダッシュ" as "Always Dash"\nTranslate "次の%1まで" as Next %1.', False)
-        translatedText = response[0]
-
+    for key, translatedText in zip(list(messages.keys()), responseList[-1][0]):
         # Remove characters that may break scripts
         charList = ['.', '\"', '\\n']
         for char in charList:
             translatedText = translatedText.replace(char, '')
-
-        totalTokens[0] += response[1][0]
-        totalTokens[1] += response[1][1]
         messages[key] = translatedText
-        
     
     return totalTokens
 
+def translateLists(requestList):
+    # [[Strings, Context], ...] Comes back as [Translations, Tokens] for each list in the same order
+    return [translateList(textList, context) for textList, context in requestList]
+
+def translateList(textList, context):
+    # None and empty strings are left alone
+    indexList = [i for i, text in enumerate(textList) if isinstance(text, str) and text.strip() != '']
+    translatedList = list(textList)
+    if len(indexList) == 0:
+        return [translatedList, [0,0]]
+    response = translateGPT([textList[i] for i in indexList], context, True)
+    for i, translatedText in zip(indexList, response[0]):
+        translatedList[i] = translatedText
+    return [translatedList, response[1]]
+
 # Save some money and enter the character before translation
 def getSpeaker(speaker):
     match speaker:
@@ -1909,147 +1861,28 @@ def getSpeaker(speaker):
         case '':
             return ['', [0,0]]
         case _:
-            # Store Speaker
-            if speaker not in str(NAMESLIST):
-                response = translateGPT(speaker, 'Reply with the '+ LANGUAGE +' translation of the NPC name.', False)
-                response[0] = response[0].title()
-                response[0] = response[0].replace("'S", "'s")
-
-                # Retry if name doesn't translate for some reason
-                if re.search(r'([a-zA-Z？?])', response[0]) == None:
-                    response = translateGPT(speaker, 'Reply with the '+ LANGUAGE +' translation of the NPC name.', False)
-                    response[0] = response[0].title()
-                    response[0] = response[0].replace("'S", "'s")
-
-                speakerList = [speaker, response[0]]
-                NAMESLIST.append(speakerList)
-                return response
-            # Find Speaker
-            else:
-                for i in range(len(NAMESLIST)):
-                    if speaker == NAMESLIST[i][0]:
-                        return [NAMESLIST[i][1],[0,0]]
+            return speakers.getSpeaker(speaker, translateSpeaker, ESTIMATE)
                                
     return [speaker,[0,0]]
 
-def subVars(jaString):
-    jaString = jaString.replace('\u3000', ' ')
-
-    # Nested
-    count = 0
-    nestedList = re.findall(r'[\\]+[\w]+\[[\\]+[\w]+\[[0-9]+\]\]', jaString)
-    nestedList = set(nestedList)
-    if len(nestedList) != 0:
-        for icon in nestedList:
-            jaString = jaString.replace(icon, '[Nested_' + str(count) + ']')
-            count += 1
-
-    # Icons
-    count = 0
-    iconList = re.findall(r'[\\]+[iIkKwWaA]+\[[0-9]+\]', jaString)
-    iconList = set(iconList)
-    if len(iconList) != 0:
-        for icon in iconList:
-            jaString = jaString.replace(icon, '[Ascii_' + str(count) + ']')
-            count += 1
-
-    # Colors
-    count = 0
-    colorList = re.findall(r'[\\]+[cC]\[[0-9]+\]', jaString)
-    colorList = set(colorList)
-    if len(colorList) != 0:
-        for color in colorList:
-            jaString = jaString.replace(color, '[Color_' + str(count) + ']')
-            count += 1
-
-    # Names
-    count = 0
-    nameList = re.findall(r'[\\]+[nN]\[.+?\]+', jaString)
-    nameList = set(nameList)
-    if len(nameList) != 0:
-        for name in nameList:
-            jaString = jaString.replace(name, '[Noun_' + str(count) + ']')
-            count += 1
-
-    # Variables
-    count = 0
-    varList = re.findall(r'[\\]+[vV]\[[0-9]+\]', jaString)
-    varList = set(varList)
-    if len(varList) != 0:
-        for var in varList:
-            jaString = jaString.replace(var, '[Var_' + str(count) + ']')
-            count += 1
-
-    # Formatting
-    count = 0
-    formatList = re.findall(r'[\\]+[\w]+\[[a-zA-Z0-9\\\[\]\_,\s-]+\]', jaString)
-    formatList = set(formatList)
-    if len(formatList) != 0:
-        for var in formatList:
-            jaString = jaString.replace(var, '[FCode_' + str(count) + ']')
-            count += 1
-
-    # Put all lists in list and return
-    allList = [nestedList, iconList, colorList, nameList, varList, formatList]
-    return [jaString, allList]
+def translateSpeaker(speaker):
+    response = translateGPT(speaker, 'Reply with the '+ LANGUAGE +' translation of the NPC name.', False)
+    response[0] = response[0].title()
+    response[0] = response[0].replace("'S", "'s")
 
-def resubVars(translatedText, allList):
-    # Fix Spacing and ChatGPT Nonsense
-    matchList = re.findall(r'\[\s?.+?\s?\]', translatedText)
-    if len(matchList) > 0:
-        for match in matchList:
-            text = match.strip()
-            translatedText = translatedText.replace(match, text)
-
-    # Nested
-    count = 0
-    if len(allList[0]) != 0:
-        for var in allList[0]:
-            translatedText = translatedText.replace('[Nested_' + str(count) + ']', var)
-            count += 1
-
-    # Icons
-    count = 0
-    if len(allList[1]) != 0:
-        for var in allList[1]:
-            translatedText = translatedText.replace('[Ascii_' + str(count) + ']', var)
-            count += 1
-
-    # Colors
-    count = 0
-    if len(allList[2]) != 0:
-        for var in allList[2]:
-            translatedText = translatedText.replace('[Color_' + str(count) + ']', var)
-            count += 1
+    # Retry if name doesn't translate for some reason
+    if re.search(r'([a-zA-Z？?])', response[0]) == None:
+        response = translateGPT(speaker, 'Reply with the '+ LANGUAGE +' translation of the NPC name.', False)
+        response[0] = response[0].title()
+        response[0] = response[0].replace("'S", "'s")
 
-    # Names
-    count = 0
-    if len(allList[3]) != 0:
-        for var in allList[3]:
-            translatedText = translatedText.replace('[Noun_' + str(count) + ']', var)
-            count += 1
-
-    # Vars
-    count = 0
-    if len(allList[4]) != 0:
-        for var in allList[4]:
-            translatedText = translatedText.replace('[Var_' + str(count) + ']', var)
-            count += 1
-    
-    # Formatting
-    count = 0
-    if len(allList[5]) != 0:
-        for var in allList[5]:
-            translatedText = translatedText.replace('[FCode_' + str(count) + ']', var)
-            count += 1
+    return response
 
-    return translatedText
+def subVars(jaString):
+    return codes.subVars(jaString, codes.SQUARE)
 
-def batchList(input_list, batch_size):
-    if not isinstance(batch_size, int) or batch_size <= 0:
-        raise ValueError("batch_size must be a positive integer")
-        
-    return [input_list[i:i + batch_size] for i in range(0, len(input_list), batch_size)]
+def resubVars(translatedText, allList):
+    return codes.resubVars(translatedText, allList, codes.SQUARE)
 
 def createContext(fullPromptFlag, subbedT):
     characters = 'Game Characters:\n\
@@ -2088,7 +1921,7 @@ def translateText(characters, system, user, history, penalty):
     
     # Content to TL
     msg.append({"role": "user", "content": f'{user}'})
-    response = openai.chat.completions.create(
+    response = api.chatCompletion(
         temperature=0,
         frequency_penalty=penalty,
         model=MODEL,
@@ -2170,20 +2003,34 @@ def combineList(tlist, text):
         return [t for sublist in tlist for t in sublist]
     return tlist[0]
 
-@retry(exceptions=Exception, tries=5, delay=5)
-def translateGPT(text, history, fullPromptFlag):
+def translateGPT(text, history, fullPromptFlag, filename=None):
     global PBAR
     
     mismatch = False
     totalTokens = [0, 0]
+
+    # Translation Memory
+    characters, system, user = createContext(fullPromptFlag, '')
+    cacheContext = cache.getContext(MODEL, system, characters, history)
     if isinstance(text, list):
-        tList = batchList(text, BATCHSIZE)
+        cachedList = cache.lookupList(cacheContext, text, subVars)
+        cachedList = journal.lookupList(filename, text, cachedList)
+        missIndexes = [i for i, cached in enumerate(cachedList) if cached is None]
+        tList = batching.packBatches(cache.getMisses(text, cachedList), MODEL, BATCHSIZE, subVars)
+        if PBAR is not None:
+            PBAR.update(len(text) - sum(len(tItem) for tItem in tList))
     else:
+        cachedText = cache.lookup(cacheContext, text, subVars)
+        if cachedText is not None:
+            return [cachedText, totalTokens]
         tList = [text]
 
+    offset = 0
     for index, tItem in enumerate(tList):
         # Before sending to translation, if we have a list of items, add the formatting
         if isinstance(tItem, list):
+            batchIndexes = missIndexes[offset:offset + len(tItem)]
+            offset += len(tItem)
             payload = '\n'.join([f'`<Line{i}>{item}</Line{i}>`' for i, item in enumerate(tItem)])
             payload = re.sub(r'(<Line\d+)(><)(\/Line\d+>)', r'\1>Placeholder Text<\3', payload)
             varResponse = subVars(payload)
@@ -2242,10 +2089,20 @@ def translateGPT(text, history, fullPromptFlag):
                 history = extractedTranslations[-10:]  # Update history if we have a list
             else:
                 history = text[-10:]
+
+            # Translation Memory
+            if len(tItem) == len(extractedTranslations):
+                cache.storeList(cacheContext, tItem, extractedTranslations, subVars)
+                journal.appendList(filename, text, batchIndexes, extractedTranslations)
+            else:
+                metrics.increment('mismatches')
         else:
             # Ensure we're passing a single string to extractTranslation
             extractedTranslations = extractTranslation(translatedText, False)
             tList[index] = extractedTranslations
+            cache.store(cacheContext, tItem, extractedTranslations, subVars)
 
     finalList = combineList(tList, text)
+    if isinstance(text, list):
+        finalList = cache.mergeList(cachedList, finalList)
     return [finalList, totalTokens]
@@ -1,26 +1,15 @@
 # Libraries
-import json, os, re, textwrap, threading, time, traceback, tiktoken, openai
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from pathlib import Path
+import asyncio, json, os, re, textwrap, threading, time, traceback, tiktoken
 from colorama import Fore
-from dotenv import load_dotenv
-from retry import retry
 from tqdm import tqdm
-
-# Open AI
-load_dotenv()
-if os.getenv('api').replace(' ', '') != '':
-    openai.base_url = os.getenv('api')
-openai.organization = os.getenv('org')
-openai.api_key = os.getenv('key')
+from modules import api, batching, cache, codes, config, dedup, engine, incremental, journal, metrics, scheduler, speakers, summary
 
 #Globals
 MODEL = os.getenv('model')
 TIMEOUT = int(os.getenv('timeout'))
 LANGUAGE = os.getenv('language').capitalize()
-PROMPT = Path('prompt.txt').read_text(encoding='utf-8')
-VOCAB = Path('vocab.txt').read_text(encoding='utf-8')
-THREADS = int(os.getenv('threads'))
+PROMPT = config.PROMPT
+VOCAB = config.VOCAB
 LOCK = threading.Lock()
 WIDTH = int(os.getenv('width'))
 LISTWIDTH = int(os.getenv('listWidth'))
@@ -28,7 +17,6 @@ NOTEWIDTH = int(os.getenv('noteWidth'))
 MAXHISTORY = 10
 ESTIMATE = ''
 TOKENS = [0, 0]
-NAMESLIST = []
 NAMES = False    # Output a list of all the character names found
 BRFLAG = False   # If the game uses <br> instead
 FIXTEXTWRAP = True  # Overwrites textwrap
@@ -36,10 +24,24 @@ IGNORETLTEXT = True    # Ignores all translated text.
 MISMATCH = []   # Lists files that throw a mismatch error (Length of GPT list response is wrong)
 BRACKETNAMES = False
 PBAR = None
+PARSED = {}     # Filename -> [Data, {Page Key: searchCodes 1st pass}] from dedupMVMZ, picked up by the file
+
+# Note tags translated on Armors, Weapons and Items. [Marker, Regex], the first group is the text.
+NOTETAGS = [
+    ['<hint:', r'<hint:(.*?)>'],
+    ['<SGDescription:', r'<SGDescription:(.*?)>'],
+    ['<SG説明:', r'<SG説明:(.*?)>'],
+    ['<SG説明2:', r'<SG説明2:(.*?)>'],
+    ['<SG説明3:', r'<SG説明3:(.*?)>'],
+    ['<SG説明4:', r'<SG説明4:(.*?)>'],
+    ['<SGカテゴリ:', r'<SGカテゴリ:(.*?)>'],
+    ['Switch Shop Description', r'<Switch Shop Description>\n(.*)\n'],
+    ['<MapText:', r'<MapText:(.*?)>'],
+]
 
 # Pricing - Depends on the model https://openai.com/pricing
 # Batch Size - GPT 3.5 Struggles past 15 lines per request. GPT4 struggles past 50 lines per request
-# If you are getting a MISMATCH LENGTH error, lower the batch size.
+# Batches shrink on their own after a MISMATCH LENGTH error (See batching.py), this is the starting size.
 if 'gpt-3.5' in MODEL:
     INPUTAPICOST = .002 
     OUTPUTAPICOST = .002
@@ -91,8 +93,13 @@ def handleMVMZ(filename, estimate):
     # Translate
     if not estimate:
         try:
-            with open('translated/' + filename, 'w', encoding='utf-8') as outFile:
-                json.dump(translatedData[0], outFile, ensure_ascii=False, indent=4)
+            with open(os.path.join(config.TRANSLATED, filename), 'w', encoding='utf-8') as outFile:
+                with metrics.timer('jsonDump'):
+                    json.dump(translatedData[0], outFile, ensure_ascii=False, indent=4)
+
+            # Everything made it to disk, journal isn't needed anymore
+            if translatedData[2] is None:
+                journal.clear(filename)
         except Exception:
             traceback.print_exc()
             return 'Fail'
@@ -113,68 +120,414 @@ def handleMVMZ(filename, estimate):
     else:
         return totalString
 
-def openFiles(filename):
-    with open('files/' + filename, 'r', encoding='utf-8-sig') as f:
-        data = json.load(f)
+def handleProjectMVMZ(filenameList, estimate):
+    global ESTIMATE
+    ESTIMATE = estimate
 
-        # Map Files
-        if 'Map' in filename and filename != 'MapInfos.json':
-            translatedData = parseMap(data, filename)
+    # Project mode (--project). Every event file goes into one corpus of [File, Path, Kind, Text] records that
+    # is packed into full batches no matter which file a line came from, so small maps and common events
+    # stop paying for half empty requests. Files are written once the whole corpus is back.
+    # Returns {Filename: Result} for the files it took, the database files go through handleMVMZ like normal.
+    filenameList = [filename for filename in filenameList if getPages({}, filename) is not None]
+    if len(filenameList) < 1:
+        return {}
 
-        # CommonEvents Files
-        elif 'CommonEvents' in filename:
-            translatedData = parseCommonEvents(data, filename)
+    start = time.time()
+    dataDict = {}   # Filename -> Data
+    pageDict = {}   # (Filename, Page Key) -> [Page, Set List]
+    corpus = []
+    totalTokens = [0, 0]
+    error = None
+    with tqdm(bar_format=BAR_FORMAT, position=POSITION, leave=LEAVE) as pbar:
+        pbar.desc = f'Project ({len(filenameList)} Files)'
+        try:
+            # Extraction
+            for filename in filenameList:
+                # Loaded and parsed by the dedup pass already
+                parsedDict = {}
+                if filename in PARSED:
+                    data, parsedDict = PARSED.pop(filename)
+                else:
+                    with open(os.path.join(config.FILES, filename), 'r', encoding='utf-8-sig') as f:
+                        with metrics.timer('jsonLoad'):
+                            data = json.load(f)
+
+                    # Unchanged since the last version
+                    previousData = applyPrevious(data, filename)
+                    if previousData is not None:
+                        dataDict[filename] = previousData
+                        continue
+                dataDict[filename] = data
+                response = extractProject(data, filename, pbar, corpus, pageDict, parsedDict)
+                totalTokens[0] += response[0]
+                totalTokens[1] += response[1]
+
+            # Translation
+            pbar.reset(total=len(corpus))
+            response = engine.run(translateCorpus(corpus))
+            totalTokens[0] += response[1][0]
+            totalTokens[1] += response[1][1]
 
-        # Actor File
-        elif 'Actors' in filename:
-            translatedData = parseNames(data, filename, 'Actors')
+            # Setting Data
+            setProject(corpus, response[0], pageDict, dataDict, pbar)
+        except Exception as e:
+            traceback.print_exc()
+            error = e
+
+    # Write every file, nothing is written if the corpus failed
+    resultDict = {filename: error for filename in filenameList} if error is not None else {}
+    for filename, data in dataDict.items():
+        if error is not None:
+            break
+        if not estimate:
+            try:
+                with open(os.path.join(config.TRANSLATED, filename), 'w', encoding='utf-8') as outFile:
+                    with metrics.timer('jsonDump'):
+                        json.dump(data, outFile, ensure_ascii=False, indent=4)
+            except Exception:
+                traceback.print_exc()
+                resultDict[filename] = 'Fail'
+                continue
+        resultDict[filename] = None
+    if error is None and 'Fail' not in resultDict.values():
+        journal.clear('Project')
 
-        # Armor File
-        elif 'Armors' in filename:
-            translatedData = parseNames(data, filename, 'Armors')
+    # Print Project
+    end = time.time()
+    tqdm.write(getResultString(['', totalTokens, error], end - start, f'Project ({len(filenameList)} Files)'))
+    with LOCK:
+        TOKENS[0] += totalTokens[0]
+        TOKENS[1] += totalTokens[1]
 
-        # Weapons File
-        elif 'Weapons' in filename:
-            translatedData = parseNames(data, filename, 'Weapons')
-        
-        # Classes File
-        elif 'Classes' in filename:
-            translatedData = parseNames(data, filename, 'Classes')
+    # Print Total
+    totalString = getResultString(['', TOKENS, None], end - start, 'TOTAL')
+    if len(MISMATCH) > 0:
+        totalString += Fore.RED + f'\nMismatch Errors: {MISMATCH}' + Fore.RESET
+    return {filename: totalString if result is None else result for filename, result in resultDict.items()}
 
-        # Enemies File
-        elif 'Enemies' in filename:
-            translatedData = parseNames(data, filename, 'Enemies')
+def extractProject(data, filename, pbar, corpus, pageDict, parsedDict):
+    # 1st Pass of every page in the file (parsedDict has the ones dedupMVMZ did), the lines go on the end of the
+    # corpus
+    totalTokens = [0, 0]
 
-        # Items File
-        elif 'Items' in filename:
-            translatedData = parseNames(data, filename, 'Items')
+    # Map Name
+    if 'Map' in filename and isinstance(data.get('displayName'), str):
+        corpus.append([filename, ['displayName'], 'mapName', data['displayName']])
+
+    # This translates ID of events. (May break the game)
+    for event in data.get('events', []) if isinstance(data, dict) else []:
+        if event is not None and '<namePop:' in event['note']:
+            response = translateNoteOmitSpace(event, r'<namePop:(.*?)\s?>.+')
+            totalTokens[0] += response[0]
+            totalTokens[1] += response[1]
+
+    # Pages
+    keyPageDict = {key: page for key, page in getPageDict(data, filename).items() if not incremental.isReused(filename, page)}
+    responseDict = extractPages({key: page for key, page in keyPageDict.items() if key not in parsedDict}, pbar, filename)
+    for response in responseDict.values():
+        totalTokens[0] += response[0][0]
+        totalTokens[1] += response[0][1]
+    for key, page in keyPageDict.items():
+        response = parsedDict.get(key) or responseDict[key]
+        pageDict[(filename, key)] = [page, response[2]]
+        docList, scriptList, textHistory = response[1]
+        corpus.extend([[filename, [key, i], 'dialogue', text] for i, text in enumerate(docList)])
+        corpus.extend([[filename, [key, i], 'script', text] for i, text in enumerate(scriptList)])
+    return totalTokens
 
-        # MapInfo File
-        elif 'MapInfos' in filename:
-            translatedData = parseNames(data, filename, 'MapInfos')
+async def translateCorpus(corpus):
+    # Every kind is translated at the same time. Returns [Translations in corpus order, Tokens], None where
+    # a batch couldn't be matched up.
+    totalTokens = [0, 0]
+    kindList = ['dialogue', 'script', 'mapName']
+    requestList = [
+        translateCorpusLines([record for record in corpus if record[2] == 'dialogue']),
+        translateCorpusLines([record for record in corpus if record[2] == 'script']),
+        translateListAsync([record[3] for record in corpus if record[2] == 'mapName'], \
+                           'Reply with only the '+ LANGUAGE +' translation of the RPG location name'),
+    ]
+    responseList = await asyncio.gather(*requestList)
+
+    # Back in corpus order
+    iterDict = {}
+    for kind, response in zip(kindList, responseList):
+        iterDict[kind] = iter(response[0])
+        totalTokens[0] += response[1][0]
+        totalTokens[1] += response[1][1]
+    return [[next(iterDict[record[2]]) for record in corpus], totalTokens]
 
-        # Skills File
-        elif 'Skills' in filename:
-            translatedData = parseNames(data, filename, 'Skills')
+async def translateCorpusLines(recordList):
+    # Lines the translation memory already has are taken out first so every batch is full. Batches don't
+    # depend on each other so they all go at once, the source lines before a batch are its history.
+    totalTokens = [0, 0]
+    textList = [record[3] for record in recordList]
+    characters, system, user = createContext(True, '')
+    cacheContext = cache.getContext(MODEL, system, characters, [])
+    cachedList = cache.lookupList(cacheContext, textList, subVars)
+    cachedList = dedup.lookupList(cacheContext, textList, cachedList, subVars)
+    missList = cache.getMisses(textList, cachedList)
+    missRecords = [record for record, cached in zip(recordList, cachedList) if cached is None]
+    if PBAR is not None:
+        PBAR.update(len(textList) - len(missList))
+
+    jobList = []
+    offset = 0
+    batchList = batching.packBatches(missList, MODEL, BATCHSIZE, subVars, 'Project')
+    for batch in batchList:
+        history = ['\"' + line + '\"' for line in missList[max(0, offset - MAXHISTORY):offset]]
+        label = f'Project, starts at {missRecords[offset][0]} [{missRecords[offset][1][0]}]'
+        jobList.append(translateCorpusBatch(batch, history, label))
+        offset += len(batch)
+    responseList = await asyncio.gather(*jobList)
+
+    # A batch that still came back the wrong length is left out (None) instead of shifting every line after it
+    translatedList = []
+    for batch, response in zip(batchList, responseList):
+        totalTokens[0] += response[1][0]
+        totalTokens[1] += response[1][1]
+        if len(response[0]) == len(batch):
+            translatedList.extend(response[0])
+        else:
+            translatedList.extend([None] * len(batch))
+            with LOCK:
+                if 'Project' not in MISMATCH:
+                    MISMATCH.append('Project')
+    return [cache.mergeList(cachedList, translatedList), totalTokens]
+
+async def translateCorpusBatch(batch, history, label):
+    api.LABEL.set(label)
+    return await translateGPTAsync(batch, history, True, 'Project')
+
+def setProject(corpus, translatedList, pageDict, dataDict, pbar):
+    # 2nd Pass, every translation goes back to the page (or map name) it came from
+    resultDict = {key: [[], [], True, [0, 0]] for key in pageDict}  # Same shape as translateJob
+    for (filename, path, kind, text), translatedText in zip(corpus, translatedList):
+        if kind == 'mapName':
+            if translatedText is not None:
+                dataDict[filename]['displayName'] = translatedText.replace('\"', '')
+            continue
+        result = resultDict[(filename, path[0])]
+        result[0 if kind == 'dialogue' else 1].append(translatedText)
+
+        # Pages with a missing line are left alone
+        if translatedText is None:
+            result[2] = False
+
+    for (filename, key), (page, setList) in pageDict.items():
+        result = resultDict[(filename, key)]
+        if len(result[0]) == 0 and len(result[1]) == 0:
+            result[2] = False
+        with metrics.timer('setData'):
+            setCodes(page, setList, result)
+
+def speakersMVMZ(filenameList, estimate):
+    global ESTIMATE
+    ESTIMATE = estimate
 
-        # Troops File
-        elif 'Troops' in filename:
-            translatedData = parseTroops(data, filename)
+    # Find every speaker in the event files and translate the new ones together, see speakers.py
+    speakerList = []
+    for filename in filenameList:
+        if getPages({}, filename) is None:
+            continue
+        with open(os.path.join(config.FILES, filename), 'r', encoding='utf-8-sig') as f:
+            data = json.load(f)
+        for page in getPages(data, filename):
+            speakerList.extend(findSpeakers(page['list'] if 'list' in page else page))
 
-        # States File
-        elif 'States' in filename:
-            translatedData = parseSS(data, filename)
+    start = time.time()
+    response = speakers.addSpeakers(speakerList, translateSpeakerList, estimate)
+    with LOCK:
+        TOKENS[0] += response[0]
+        TOKENS[1] += response[1]
+    if response != [0,0]:
+        tqdm.write(getResultString(['', response, None], time.time() - start, f'Speakers ({len(set(speakerList))} Names)'))
+
+def findSpeakers(codeList):
+    # Same patterns searchCodes looks for
+    speakerList = []
+    for i, command in enumerate(codeList):
+        if not isinstance(command, dict) or len(command.get('parameters', [])) == 0:
+            continue
 
-        # System File
-        elif 'System' in filename:
-            translatedData = parseSystem(data, filename)
+        # Name Box
+        if command['code'] == 101 and CODE101 is True:
+            parameter = command['parameters'][4] if len(command['parameters']) > 4 else command['parameters'][0]
+            if isinstance(parameter, str):
+                speakerList.append(parameter)
+
+        elif command['code'] in [401, 405] and (CODE401 or CODE405) and isinstance(command['parameters'][0], str):
+            jaString = command['parameters'][0]
+
+            # Colored name or 【Name】 on its own line
+            nextCode = codeList[i+1]['code'] if i+1 < len(codeList) else None
+            nameList = re.findall(r'^[\\]+[cC]\[[\d]+\](.+?)[\\]+[Cc]\[[\d]\]\\?\\?$', jaString)
+            if len(nameList) == 0:
+                nameList = re.findall(r'^【(.*?)】$', jaString)
+            if len(nameList) != 0 and nextCode in [401, 405, -1]:
+                speakerList.append(nameList[0])
+
+            # \\n<Name>
+            speakerList.extend(re.findall(r'[\\]+[kKnN][wWcC]?[<](.*?)[>]', jaString))
+
+            # Brackets
+            if BRACKETNAMES is True:
+                matchList = re.findall(r'^([\\]+[cC]\[[0-9]+\]【?(.+?)】?[\\]+[cC]\[[0-9]+\])|^(【(.+)】)', jaString)
+                if len(matchList) != 0:
+                    speakerList.append(matchList[0][1] or matchList[0][3])
+    return speakerList
+
+def dedupMVMZ(filenameList, estimate):
+    # Run level dedup, see dedup.py. Only the event files go through searchCodes, the loaded files and their
+    # 1st pass are kept in PARSED so they aren't loaded and parsed again when the file is translated.
+    if estimate or not dedup.enabled():
+        return
+    filenameList = [filename for filename in filenameList if getPages({}, filename) is not None]
+    if len(filenameList) < 1:
+        return
 
-        # Scenario File
-        elif 'Scenario' in filename:
-            translatedData = parseScenario(data, filename)
+    start = time.time()
+    totalTokens = [0, 0]
+    lineLists = []
+    repeatList = []
+    with tqdm(bar_format=BAR_FORMAT, position=POSITION, leave=LEAVE) as pbar:
+        pbar.desc='Dedup'
+        for filename in filenameList:
+            with open(os.path.join(config.FILES, filename), 'r', encoding='utf-8-sig') as f:
+                with metrics.timer('jsonLoad'):
+                    data = json.load(f)
+
+            # Nothing to do for pages carried over from the last version
+            if applyPrevious(data, filename) is not None:
+                continue
+
+            # 1st Pass, the 2nd is done by the file
+            responseDict = extractPages({key: page for key, page in getPageDict(data, filename).items() \
+                                         if not incremental.isReused(filename, page)}, pbar, filename)
+            for response in responseDict.values():
+                totalTokens[0] += response[0][0]
+                totalTokens[1] += response[0][1]
+                lineLists.extend([response[1][0], response[1][1]])
+            PARSED[filename] = [data, responseDict]
+
+        # Translate the repeats once, dedup.lookupList() hands them to every page
+        repeatList = dedup.findRepeats(lineLists, subVars)
+        if len(repeatList) > 0:
+            pbar.total = len(repeatList)
+            response = translateGPT(repeatList, [], True, 'Dedup')
+            totalTokens[0] += response[1][0]
+            totalTokens[1] += response[1][1]
+            characters, system, user = createContext(True, '')
+            dedup.remember(cache.getContext(MODEL, system, characters, []), repeatList, response[0], subVars)
+            journal.clear('Dedup')
+    with LOCK:
+        TOKENS[0] += totalTokens[0]
+        TOKENS[1] += totalTokens[1]
+    tqdm.write(getResultString(['', totalTokens, None], time.time() - start, f'Dedup ({len(repeatList)} Lines)'))
+
+def getPages(data, filename):
+    # Event pages of a file, None if the file doesn't have any
+    pageDict = getPageDict(data, filename)
+    return list(pageDict.values()) if pageDict is not None else None
+
+def getPageDict(data, filename):
+    # Same as getPages but keyed on where the page lives (Event ID:Page Number, etc)
+    if 'Map' in filename and filename != 'MapInfos.json':
+        return {f'{event["id"]}:{i}': page for event in data.get('events', []) if event is not None \
+                for i, page in enumerate(event['pages']) if page is not None}
+    elif 'CommonEvents' in filename:
+        return {str(page['id']): page for page in data if page is not None}
+    elif 'Troops' in filename:
+        return {f'{troop["id"]}:{i}': page for troop in data if troop is not None \
+                for i, page in enumerate(troop['pages']) if page is not None}
+    elif 'Scenario' in filename:
+        return {page[0]: page[1] for page in data.items() if page[1] is not None}
+    return None
+
+def applyPrevious(data, filename):
+    # Reuse the last version's translation (See incremental.py). Returns the old translation if the
+    # whole file is the same, otherwise fills in the pages that didn't change.
+    previous = incremental.loadPrevious(filename)
+    if previous is None:
+        return None
+    if incremental.getHash(data) == incremental.getHash(previous[0]):
+        return previous[1]
+    pageDict = getPageDict(data, filename)
+    if pageDict is not None:
+        incremental.reusePages(pageDict, getPageDict(previous[0], filename), getPageDict(previous[1], filename), filename)
+    return None
 
-        else:
-            raise NameError(filename + ' Not Supported')
+def openFiles(filename):
+    # Loaded and parsed by the dedup pass already
+    if filename in PARSED:
+        data = PARSED[filename][0]
+    else:
+        with open(os.path.join(config.FILES, filename), 'r', encoding='utf-8-sig') as f:
+            with metrics.timer('jsonLoad'):
+                data = json.load(f)
+
+        # Unchanged since the last version
+        previousData = applyPrevious(data, filename)
+        if previousData is not None:
+            return [previousData, [0, 0], None]
+
+    # Map Files
+    if 'Map' in filename and filename != 'MapInfos.json':
+        translatedData = parseMap(data, filename)
+
+    # CommonEvents Files
+    elif 'CommonEvents' in filename:
+        translatedData = parseCommonEvents(data, filename)
+
+    # Actor File
+    elif 'Actors' in filename:
+        translatedData = parseNames(data, filename, 'Actors')
+
+    # Armor File
+    elif 'Armors' in filename:
+        translatedData = parseNames(data, filename, 'Armors')
+
+    # Weapons File
+    elif 'Weapons' in filename:
+        translatedData = parseNames(data, filename, 'Weapons')
+    
+    # Classes File
+    elif 'Classes' in filename:
+        translatedData = parseNames(data, filename, 'Classes')
+
+    # Enemies File
+    elif 'Enemies' in filename:
+        translatedData = parseNames(data, filename, 'Enemies')
+
+    # Items File
+    elif 'Items' in filename:
+        translatedData = parseNames(data, filename, 'Items')
+
+    # MapInfo File
+    elif 'MapInfos' in filename:
+        translatedData = parseNames(data, filename, 'MapInfos')
+
+    # Skills File
+    elif 'Skills' in filename:
+        translatedData = parseNames(data, filename, 'Skills')
+
+    # Troops File
+    elif 'Troops' in filename:
+        translatedData = parseTroops(data, filename)
+
+    # States File
+    elif 'States' in filename:
+        translatedData = parseSS(data, filename)
+
+    # System File
+    elif 'System' in filename:
+        translatedData = parseSystem(data, filename)
+
+    # Scenario File
+    elif 'Scenario' in filename:
+        translatedData = parseScenario(data, filename)
+
+    else:
+        raise NameError(filename + ' Not Supported')
     
     return translatedData
 
@@ -197,6 +550,7 @@ def getResultString(translatedData, translationTime, filename):
             raise translatedData[2]
         except Exception as e:
             traceback.print_exc()
+            summary.recordError(filename, e)
             errorString = str(e) + Fore.RED
             return filename + ': ' + totalTokenstring + timeString + Fore.RED + u' \u2717 ' +\
                 errorString + Fore.RESET
@@ -220,27 +574,23 @@ def parseMap(data, filename):
             for page in event['pages']:
                 totalLines += len(page['list'])
     
-    # Thread for each page in file
+    # Every page in the file goes to the engine at once
     with tqdm(bar_format=BAR_FORMAT, position=POSITION, leave=LEAVE) as pbar:
         pbar.desc=filename
-        with ThreadPoolExecutor(max_workers=THREADS) as executor:
-            for event in events:
-                if event is not None:
-                    # This translates ID of events. (May break the game)
-                    if '<namePop:' in event['note']:
-                        response = translateNoteOmitSpace(event, r'<namePop:(.*?)\s?>.+')
-                        totalTokens[0] += response[0]
-                        totalTokens[1] += response[1]
-
-                    futures = [executor.submit(searchCodes, page, pbar, [], filename) for page in event['pages'] if page is not None]
-                    for future in as_completed(futures):
-                        try:
-                            totalTokensFuture = future.result()
-                            totalTokens[0] += totalTokensFuture[0]
-                            totalTokens[1] += totalTokensFuture[1]
-                        except Exception as e:
-                            traceback.print_exc()
-                            return [data, totalTokens, e]
+        for event in events:
+            if event is not None:
+                # This translates ID of events. (May break the game)
+                if '<namePop:' in event['note']:
+                    response = translateNoteOmitSpace(event, r'<namePop:(.*?)\s?>.+')
+                    totalTokens[0] += response[0]
+                    totalTokens[1] += response[1]
+        try:
+            response = translatePages(getPageDict(data, filename), pbar, filename)
+            totalTokens[0] += response[0]
+            totalTokens[1] += response[1]
+        except Exception as e:
+            traceback.print_exc()
+            return [data, totalTokens, e]
     return [data, totalTokens, None]
 
 def translateNote(event, regex):
@@ -270,6 +620,43 @@ def translateNote(event, regex):
         return tokens
     return [0,0]
 
+def translateNotes(recordList):
+    # Every NOTETAGS match in the file as one list. Matches are found on the original note and put back
+    # by position, so a tag that shows up twice (or the same text in two tags) is still set correctly.
+    totalTokens = [0, 0]
+    matchList = []  # [Record, Tag, Match Index, Start, End]
+    for record in recordList:
+        if record is None or not isinstance(record.get('note'), str):
+            continue
+        for tag, (marker, regex) in enumerate(NOTETAGS):
+            if marker in record['note']:
+                for index, match in enumerate(re.finditer(regex, record['note'], re.DOTALL)):
+                    matchList.append([record, tag, index, match.start(1), match.end(1)])
+    if len(matchList) == 0:
+        return totalTokens
+
+    # Translate
+    textList = [record['note'][start:end].replace('\n', ' ') for record, tag, index, start, end in matchList]
+    response = translateLists([[textList, 'Reply with only the '+ LANGUAGE +' translation.']])[0]
+    totalTokens[0] += response[1][0]
+    totalTokens[1] += response[1][1]
+
+    # Set Data, back to front so earlier positions stay valid. Overlapping tags keep the first one.
+    spanDict = {}   # id(Record) -> [Record, [[Start, End, Text], ...]]
+    for (record, tag, index, start, end), translatedText in zip(matchList, response[0]):
+        translatedText = textwrap.fill(translatedText, width=NOTEWIDTH).replace('\"', '')
+        spanDict.setdefault(id(record), [record, []])[1].append([start, end, translatedText])
+    for record, spanList in spanDict.values():
+        note = record['note']
+        lastStart = len(note) + 1
+        for start, end, translatedText in sorted(spanList, reverse=True):
+            if end > lastStart:
+                continue
+            note = note[:start] + translatedText + note[end:]
+            lastStart = start
+        record['note'] = note
+    return totalTokens
+
 # For notes that can't have spaces.
 def translateNoteOmitSpace(event, regex):
     # Regex that only matches text inside LB.
@@ -303,16 +690,13 @@ def parseCommonEvents(data, filename):
 
     with tqdm(bar_format=BAR_FORMAT, position=POSITION, leave=LEAVE) as pbar:
         pbar.desc=filename
-        with ThreadPoolExecutor(max_workers=THREADS) as executor:
-            futures = [executor.submit(searchCodes, page, pbar, [], filename) for page in data if page is not None]
-            for future in as_completed(futures):
-                try:
-                    totalTokensFuture = future.result()
-                    totalTokens[0] += totalTokensFuture[0]
-                    totalTokens[1] += totalTokensFuture[1]
-                except Exception as e:
-                    traceback.print_exc()
-                    return [data, totalTokens, e]
+        try:
+            response = translatePages(getPageDict(data, filename), pbar, filename)
+            totalTokens[0] += response[0]
+            totalTokens[1] += response[1]
+        except Exception as e:
+            traceback.print_exc()
+            return [data, totalTokens, e]
     return [data, totalTokens, None]
 
 def parseTroops(data, filename):
@@ -328,18 +712,13 @@ def parseTroops(data, filename):
 
     with tqdm(bar_format=BAR_FORMAT, position=POSITION, leave=LEAVE) as pbar:
         pbar.desc=filename
-        for troop in data:
-            if troop is not None:
-                with ThreadPoolExecutor(max_workers=THREADS) as executor:
-                    futures = [executor.submit(searchCodes, page, pbar, [], filename) for page in troop['pages'] if page is not None]
-                    for future in as_completed(futures):
-                        try:
-                            totalTokensFuture = future.result()
-                            totalTokens[0] += totalTokensFuture[0]
-                            totalTokens[1] += totalTokensFuture[1]
-                        except Exception as e:
-                            traceback.print_exc()
-                            return [data, totalTokens, e]
+        try:
+            response = translatePages(getPageDict(data, filename), pbar, filename)
+            totalTokens[0] += response[0]
+            totalTokens[1] += response[1]
+        except Exception as e:
+            traceback.print_exc()
+            return [data, totalTokens, e]
     return [data, totalTokens, None]
     
 def parseNames(data, filename, context):
@@ -365,15 +744,13 @@ def parseSS(data, filename):
                 
     with tqdm(bar_format=BAR_FORMAT, position=POSITION, leave=LEAVE) as pbar:
             pbar.desc=filename
-            for ss in data:
-                if ss is not None:
-                    try:
-                        result = searchSS(ss, pbar)       
-                        totalTokens[0] += result[0]
-                        totalTokens[1] += result[1]
-                    except Exception as e:
-                        traceback.print_exc()
-                        return [data, totalTokens, e]
+            try:
+                result = searchSS(data, pbar)
+                totalTokens[0] += result[0]
+                totalTokens[1] += result[1]
+            except Exception as e:
+                traceback.print_exc()
+                return [data, totalTokens, e]
     return [data, totalTokens, None]
 
 def parseSystem(data, filename):
@@ -413,18 +790,188 @@ def parseScenario(data, filename):
 
     with tqdm(bar_format=BAR_FORMAT, position=POSITION, leave=LEAVE) as pbar:
         pbar.desc=filename
-        with ThreadPoolExecutor(max_workers=THREADS) as executor:
-            futures = [executor.submit(searchCodes, page[1], pbar, [], filename) for page in data.items() if page[1] is not None]
-            for future in as_completed(futures):
-                try:
-                    totalTokensFuture = future.result()
-                    totalTokens[0] += totalTokensFuture[0]
-                    totalTokens[1] += totalTokensFuture[1]
-                except Exception as e:
-                    traceback.print_exc()
-                    return [data, totalTokens, e]
+        try:
+            response = translatePages(getPageDict(data, filename), pbar, filename)
+            totalTokens[0] += response[0]
+            totalTokens[1] += response[1]
+        except Exception as e:
+            traceback.print_exc()
+            return [data, totalTokens, e]
     return [data, totalTokens, None]
 
+def translatePages(pageDict, pbar, filename):
+    # pageDict is getPageDict(), the keys say which page a stuck request belonged to
+    global PBAR
+    totalTokens = [0, 0]
+    parsedDict = PARSED.pop(filename, [None, {}])[1]
+    with LOCK:
+        PBAR = pbar
+    # Biggest pages first so their requests get in before the small ones, see scheduler.py
+    keyList = [key for key, page in pageDict.items() if not incremental.isReused(filename, page)]
+    keyList.sort(key=lambda key: scheduler.getSize(pageDict[key]), reverse=True)
+    pageList = [pageDict[key] for key in keyList]
+
+    # 1st Pass (Grabbing Data), pages the dedup pass got to are already done and their tokens were counted there
+    responseDict = extractPages({key: pageDict[key] for key in keyList if key not in parsedDict}, pbar, filename)
+    for response in responseDict.values():
+        totalTokens[0] += response[0][0]
+        totalTokens[1] += response[0][1]
+    jobList = []
+    setLists = []
+    for key in keyList:
+        response = parsedDict.get(key) or responseDict[key]
+        jobList.append(response[1])
+        setLists.append(response[2])
+
+    # Translate every page at the same time
+    resultList = engine.run(translateJobs(jobList, [f'{filename} [{key}]' for key in keyList], filename))
+
+    # 2nd Pass (Setting Data)
+    for page, setList, result in zip(pageList, setLists, resultList):
+        if isinstance(result, Exception):
+            raise result
+        totalTokens[0] += result[3][0]
+        totalTokens[1] += result[3][1]
+        with metrics.timer('setData'):
+            setCodes(page, setList, result)
+    return totalTokens
+
+def extractPages(pageDict, pbar, filename):
+    # 1st Pass of every page in {Key: Page} at once on the run queue (See scheduler.py) instead of one after the
+    # other, speakers and notes it translates don't hold up the rest of the file. Returns {Key: searchCodes response}.
+    responseList = scheduler.mapPages(extractPage, {f'{filename} [{key}]': page for key, page in pageDict.items()}, \
+                                      pbar, filename)
+    return dict(zip(pageDict, responseList))
+
+def extractPage(page, pbar, filename):
+    with metrics.timer('extract'):
+        return searchCodes(page, pbar, filename)
+
+async def translateJobs(jobList, labelList, filename):
+    return await asyncio.gather(*[translateJob(job, label, filename) for job, label in zip(jobList, labelList)], return_exceptions=True)
+
+async def translateJob(job, label, filename):
+    api.LABEL.set(label)
+    docList, scriptList, textHistory = job
+    totalTokens = [0, 0]
+    docListTL = []
+    scriptListTL = []
+    setData = False
+
+    # 401
+    if len(docList) > 0:
+        response = await translateGPTAsync(docList, textHistory, True, filename)
+        docListTL = response[0]
+        totalTokens[0] += response[1][0]
+        totalTokens[1] += response[1][1]
+        if len(docListTL) != len(docList):
+            with LOCK:
+                if filename not in MISMATCH:
+                    MISMATCH.append(filename)
+        else:
+            setData = True
+
+    # 122
+    if len(scriptList) > 0:
+        response = await translateGPTAsync(scriptList, textHistory, True, filename)
+        scriptListTL = response[0]
+        totalTokens[0] += response[1][0]
+        totalTokens[1] += response[1][1]
+        if len(scriptListTL) != len(scriptList):
+            with LOCK:
+                if filename not in MISMATCH:
+                    MISMATCH.append(filename)
+        else:
+            setData = True
+
+    return [docListTL, scriptListTL, setData, totalTokens]
+
+def setCodes(page, setList, result):
+    # Normal Format
+    if 'list' in page:
+        codeList = page['list']
+
+    # Special Format (Scenario)
+    else:
+        codeList = page
+
+    # Start Pass 2
+    if result[2]:
+        setText(codeList, setList, result[0], result[1])
+
+    # Delete all -1 codes
+    codeListFinal = []
+    for i in range(len(codeList)):
+        if 'code' in codeList[i] and codeList[i]['code'] != -1:
+            codeListFinal.append(codeList[i])
+
+    # Normal Format
+    if 'list' in page:
+        page['list'] = codeListFinal
+
+    # Special Format (Scenario)
+    else:
+        page[:] = codeListFinal
+
+def setText(codeList, setList, docListTL, scriptListTL):
+    # 2nd Pass, every translation goes straight back to the command searchCodes found it on. A list that
+    # came back the wrong length is left alone.
+    docSetList, scriptSetList = setList
+
+    # 401
+    if len(docListTL) == len(docSetList):
+        for translatedText, (index, code, nCase, nametag, speaker, CLFlag, varString) in zip(docListTL, docSetList):
+            # Remove speaker
+            if speaker != '':
+                matchSpeakerList = re.findall(r'^\[?(.+?)\]?\s?[|:]\s?', translatedText)
+                if len(matchSpeakerList) > 0:
+                    newSpeaker = matchSpeakerList[0]
+                    nametag = nametag.replace(speaker, newSpeaker)
+                translatedText = re.sub(r'^\[?(.+?)\]?\s?[|:]\s?', '', translatedText)
+
+            # Textwrap
+            if FIXTEXTWRAP is True:
+                with metrics.timer('textwrap'):
+                    translatedText = textwrap.fill(translatedText, width=WIDTH)
+                if BRFLAG is True:
+                    translatedText = translatedText.replace('\n', '<br>')
+
+            ### Add Var Strings
+            # CL Flag
+            if CLFlag:
+                translatedText = '\\ac ' + translatedText
+                translatedText = translatedText.replace('\n', '\n\\ac ')
+                translatedText = re.sub(r'[\\]+?ac\s+', r'\\ac ', translatedText)
+
+            # Nametag
+            if nCase == 0:
+                translatedText = translatedText + nametag
+            else:
+                translatedText = nametag + translatedText
+
+            # //SE[#]
+            translatedText = varString + translatedText
+
+            # Set Data
+            codeList[index]['parameters'] = [translatedText]
+            codeList[index]['code'] = code
+
+    # 122
+    if len(scriptListTL) == len(scriptSetList):
+        for translatedText, index in zip(scriptListTL, scriptSetList):
+            # Remove characters that may break scripts
+            charList = ['\"', '\\n']
+            for char in charList:
+                translatedText = translatedText.replace(char, '')
+        
+            # Textwrap
+            translatedText = textwrap.fill(translatedText, width=80)
+            translatedText = translatedText.replace('\n', '\\n')
+            translatedText = '\"' + translatedText + '\"'
+
+            # Set
+            codeList[index]['parameters'][4] = translatedText
+
 def searchNames(data, pbar, context):
     totalTokens = [0, 0]
     nameList = []
@@ -456,6 +1003,18 @@ def searchNames(data, pbar, context):
     if 'Skills' in context:
         newContext = 'Reply with only the '+ LANGUAGE +' translation of the RPG skill name'
 
+    # Note tags of every item at once
+    if context in ['Armors', 'Weapons', 'Items']:
+        response = translateNotes(data)
+        totalTokens[0] += response[0]
+        totalTokens[1] += response[1]
+
+    # Action logs of every skill at once
+    if context in ['Skills']:
+        response = translateMessages(data)
+        totalTokens[0] += response[0]
+        totalTokens[1] += response[1]
+
     # Names
     while i < len(data) or filling == True:
         if i < len(data):
@@ -480,42 +1039,6 @@ def searchNames(data, pbar, context):
                 if len(nameList) < BATCHSIZE:
                     nameList.append(data[i]['name'])
                     descriptionList.append(data[i]['description'].replace('\n', ' '))
-                    if '<hint:' in data[i]['note']:
-                        tokensResponse = translateNote(data[i], r'<hint:(.*?)>')
-                        totalTokens[0] += tokensResponse[0]
-                        totalTokens[1] += tokensResponse[1]
-                    if '<SGDescription:' in data[i]['note']:
-                        tokensResponse = translateNote(data[i], r'<SGDescription:(.*?)>')
-                        totalTokens[0] += tokensResponse[0]
-                        totalTokens[1] += tokensResponse[1]
-                    if '<SG説明:' in data[i]['note']:
-                        tokensResponse = translateNote(data[i], r'<SG説明:(.*?)>')
-                        totalTokens[0] += tokensResponse[0]
-                        totalTokens[1] += tokensResponse[1]
-                    if '<SG説明2:' in data[i]['note']:
-                        tokensResponse = translateNote(data[i], r'<SG説明2:(.*?)>')
-                        totalTokens[0] += tokensResponse[0]
-                        totalTokens[1] += tokensResponse[1]
-                    if '<SG説明3:' in data[i]['note']:
-                        tokensResponse = translateNote(data[i], r'<SG説明3:(.*?)>')
-                        totalTokens[0] += tokensResponse[0]
-                        totalTokens[1] += tokensResponse[1]
-                    if '<SG説明4:' in data[i]['note']:
-                        tokensResponse = translateNote(data[i], r'<SG説明4:(.*?)>')
-                        totalTokens[0] += tokensResponse[0]
-                        totalTokens[1] += tokensResponse[1]
-                    if '<SGカテゴリ:' in data[i]['note']:
-                        tokensResponse = translateNote(data[i], r'<SGカテゴリ:(.*?)>')
-                        totalTokens[0] += tokensResponse[0]
-                        totalTokens[1] += tokensResponse[1]
-                    if 'Switch Shop Description' in data[i]['note']:
-                        tokensResponse = translateNote(data[i], r'<Switch Shop Description>\n(.*)\n')
-                        totalTokens[0] += tokensResponse[0]
-                        totalTokens[1] += tokensResponse[1]
-                    if '<MapText:' in data[i]['note']:
-                        tokensResponse = translateNote(data[i], r'<MapText:(.*?)>')
-                        totalTokens[0] += tokensResponse[0]
-                        totalTokens[1] += tokensResponse[1]
                     
                     i += 1
                 else:
@@ -525,26 +1048,6 @@ def searchNames(data, pbar, context):
                     nameList.append(data[i]['name'])
                     descriptionList.append(data[i]['description'].replace('\n', ' '))
                     
-                    # Messages
-                    number = 1
-                    while number < 5:
-                        if f'message{number}' in data[i]:
-                            if len(data[i][f'message{number}']) > 0 and data[i][f'message{number}'][0] in ['は', 'を', 'の', 'に', 'が']:
-                                msgResponse = translateGPT('Taro' + data[i][f'message{number}'], 'reply with only the gender neutral '+ LANGUAGE +' translation of the action log. Always start the sentence with Taro. For example, Translate \'Taroを倒した！\' as \'Taro was defeated!\'', False)
-                                data[i][f'message{number}'] = msgResponse[0].replace('Taro', '')
-                                totalTokens[0] += msgResponse[1][0]
-                                totalTokens[1] += msgResponse[1][1]
-                                number += 1
-
-                            else:
-                                msgResponse = translateGPT(data[i][f'message{number}'], 'reply with only the gender neutral '+ LANGUAGE +' translation', False)
-                                data[i][f'message{number}'] = msgResponse[0]
-                                totalTokens[0] += msgResponse[1][0]
-                                totalTokens[1] += msgResponse[1][1]
-                                number += 1
-                        else:
-                            number += 1
-                    
                     i += 1
                 else:
                     batchFull = True
@@ -681,28 +1184,22 @@ def searchNames(data, pbar, context):
 
     return totalTokens
 
-def searchCodes(page, pbar, jobList, filename):
-    if len(jobList) > 0:
-        docList = jobList[0]
-        scriptList = jobList[1]
-        setData = True
-    else:
-        docList = []
-        scriptList = []
-        setData = False
+def searchCodes(page, pbar, filename):
+    docList = []
+    scriptList = []
+    docSetList = []     # [Command Index, Code, nCase, Nametag, Speaker, CLFlag, varString] for every docList line
+    scriptSetList = []  # Command Index for every scriptList line
     currentGroup = []
     textHistory = []
     match = []
     totalTokens = [0, 0]
     translatedText = ''
     speaker = ''
-    speakerID = None
     nametag = ''
     syncIndex = 0
     CLFlag = False
     maxHistory = MAXHISTORY
     global LOCK
-    global NAMESLIST
     global MISMATCH
     global PBAR
     with LOCK:
@@ -734,7 +1231,6 @@ def searchCodes(page, pbar, jobList, filename):
                 # Save Code and starting index (j)
                 code = codeList[i]['code']
                 j = i
-                endtag = ''
 
                 # Grab String
                 if len(codeList[i]['parameters']) > 0:
@@ -797,6 +1293,7 @@ def searchCodes(page, pbar, jobList, filename):
 
                     # Set Back
                     codeList[i]['parameters'] = [finalJAString]
+                    textIndex = i
 
                     ### \\n<Speaker>
                     nCase = None
@@ -846,7 +1343,6 @@ def searchCodes(page, pbar, jobList, filename):
                             match1 = matchList[0][3]
 
                         # Translate Speaker
-                        speakerID = j
                         response = getSpeaker(match1)
                         speaker = response[0]
                         totalTokens[0] += response[1][0]
@@ -864,6 +1360,12 @@ def searchCodes(page, pbar, jobList, filename):
                             j += 1
                             codeList[j]['parameters'] = [finalJAString]
                             codeList[j]['code'] = code
+
+                            # The dialogue lives on the line after the name now, drop the joined copy
+                            if textIndex != j:
+                                codeList[textIndex]['parameters'] = []
+                                codeList[textIndex]['code'] = -1
+                                textIndex = j
                         else:
                             # Set nametag in string
                             codeList[j]['parameters'] = [fullSpeaker + finalJAString]
@@ -927,72 +1429,20 @@ def searchCodes(page, pbar, jobList, filename):
                             i += 1
                             continue
 
-                    # 1st Passthrough (Grabbing Data)
-                    if setData == False:
-                        if speaker == '' and finalJAString != '':
-                            docList.append(finalJAString)
-                        elif finalJAString != '':
-                            docList.append(f'[{speaker}]: {finalJAString}')
-                        else:
-                            docList.append(speaker)
-                        speaker = ''
-                        match = []
-                        currentGroup = []
-                        syncIndex = i + 1                          
-
-                    # 2nd Passthrough (Setting Data) 
+                    # Grab Data, setText puts the translation straight back at textIndex
+                    if speaker == '' and finalJAString != '':
+                        docList.append(finalJAString)
+                    elif finalJAString != '':
+                        docList.append(f'[{speaker}]: {finalJAString}')
                     else:
-                        # Grab Translated String
-                        if len(docList) > 0:
-                            translatedText = docList[0]
-                            
-                            # Remove speaker
-                            if speaker != '':
-                                matchSpeakerList = re.findall(r'^\[?(.+?)\]?\s?[|:]\s?', translatedText)
-                                if len(matchSpeakerList) > 0:
-                                    newSpeaker = matchSpeakerList[0]
-                                    nametag = nametag.replace(speaker, newSpeaker)
-                                translatedText = re.sub(r'^\[?(.+?)\]?\s?[|:]\s?', '', translatedText)
-
-                            # Textwrap
-                            if FIXTEXTWRAP is True:
-                                translatedText = textwrap.fill(translatedText, width=WIDTH)
-                                if BRFLAG is True:
-                                    translatedText = translatedText.replace('\n', '<br>')   
-
-                            ### Add Var Strings
-                            # CL Flag
-                            if CLFlag:
-                                translatedText = '\\ac ' + translatedText
-                                translatedText = translatedText.replace('\n', '\n\\ac ')
-                                translatedText = re.sub(r'[\\]+?ac\s+', r'\\ac ', translatedText)
-                                CLFlag = False
-
-                            # Nametag
-                            if nCase == 0:
-                                translatedText = translatedText + nametag
-                            else:
-                                translatedText = nametag + translatedText
-                            nametag = ''
-
-                            # Endtag
-                            if endtag != '':
-                                translatedText = translatedText + endtag
-                                endtag = ''
-
-                            # //SE[#]
-                            translatedText = varString + translatedText
-
-                            # Set Data
-                            if speakerID != None:
-                                codeList[speakerID]['parameters'] = [fullSpeaker]
-                            codeList[j]['parameters'] = [translatedText]
-                            codeList[j]['code'] = code
-                            speaker = ''
-                            match = []
-                            currentGroup = []
-                            syncIndex = i + 1
-                            docList.pop(0)                                
+                        docList.append(speaker)
+                    docSetList.append([textIndex, codeList[textIndex]['code'], nCase, nametag, speaker, CLFlag, varString])
+                    speaker = ''
+                    nametag = ''
+                    CLFlag = False
+                    match = []
+                    currentGroup = []
+                    syncIndex = i + 1
 
             ## Event Code: 122 [Set Variables]
             if 'code' in codeList[i] and codeList[i]['code'] == 122 and CODE122 is True:
@@ -1018,30 +1468,8 @@ def searchCodes(page, pbar, jobList, filename):
                     # Remove Textwrap
                     finalJAString = matchedText.group(1).replace('\\n', ' ')
 
-                    # Pass 1
-                    if setData == False:
-                        scriptList.append(finalJAString)
-
-                    # Pass 2
-                    else:  
-                        if len(scriptList) > 0:            
-                            # Grab and Replace
-                            translatedText = scriptList[0]
-                            translatedText = jaString.replace(jaString, translatedText)
-
-                            # Remove characters that may break scripts
-                            charList = ['\"', '\\n']
-                            for char in charList:
-                                translatedText = translatedText.replace(char, '')
-                        
-                            # Textwrap
-                            translatedText = textwrap.fill(translatedText, width=80)
-                            translatedText = translatedText.replace('\n', '\\n')
-                            translatedText = '\"' + translatedText + '\"'
-
-                            # Set
-                            codeList[i]['parameters'][4] = translatedText
-                            scriptList.pop(0)
+                    scriptList.append(finalJAString)
+                    scriptSetList.append(i)
 
             ## Event Code: 357 [Picture Text] [Optional]
             if 'code' in codeList[i] and codeList[i]['code'] == 357 and CODE357 is True:
@@ -1678,56 +2106,6 @@ def searchCodes(page, pbar, jobList, filename):
             else:
                 i += 1
 
-        # End of the line
-        docListTL = []
-        scriptListTL = []
-        setData = False
-        PBAR = pbar
-        
-        # 401
-        if len(docList) > 0:
-            response = translateGPT(docList, textHistory, True)
-            docListTL = response[0]
-            totalTokens[0] += response[1][0]
-            totalTokens[1] += response[1][1]
-            if len(docListTL) != len(docList):
-                with LOCK:
-                    if filename not in MISMATCH:
-                        MISMATCH.append(filename)
-            else:
-                setData = True
-
-        # 122
-        if len(scriptList) > 0:
-            response = translateGPT(scriptList, textHistory, True)
-            scriptListTL = response[0]
-            totalTokens[0] += response[1][0]
-            totalTokens[1] += response[1][1]
-            if len(scriptListTL) != len(scriptList):
-                with LOCK:
-                    if filename not in MISMATCH:
-                        MISMATCH.append(filename)
-            else:
-                setData = True
-
-        # Start Pass 2
-        if setData:
-            searchCodes(page, pbar, [docListTL, scriptListTL], filename)
-
-        # Delete all -1 codes
-        codeListFinal = []
-        for i in range(len(codeList)):
-            if 'code' in codeList[i] and codeList[i]['code'] != -1:
-                codeListFinal.append(codeList[i])
-
-        # Normal Format
-        if 'list' in page:
-            page['list'] = codeListFinal
-
-        # Special Format (Scenario)
-        else:
-            page = codeListFinal
-
     except IndexError as e:
         traceback.print_exc()
         raise Exception(str(e) + 'Failed to translate: ' + oldjaString) from None
@@ -1735,88 +2113,77 @@ def searchCodes(page, pbar, jobList, filename):
         traceback.print_exc()
         raise Exception(str(e) + 'Failed to translate: ' + oldjaString) from None   
 
-    return totalTokens
+    # Batches get translated by the engine, setCodes finishes the page
+    return [totalTokens, [docList, scriptList, textHistory], [docSetList, scriptSetList]]
 
-def searchSS(state, pbar):
+def searchSS(data, pbar):
     totalTokens = [0, 0]
+    stateList = [state for state in data if state is not None]
+
+    # Names and descriptions of every state, one list each
+    requestList = [
+        [[state.get('name') for state in stateList], 'Reply with only the '+ LANGUAGE +' translation of the RPG Skill names.'],
+        [[state['description'].replace('\n', ' ') if isinstance(state.get('description'), str) else None for state in stateList], \
+         'Reply with only the '+ LANGUAGE +' translation of the descriptions.'],
+    ]
+    responseList = translateLists(requestList)
+    for response in responseList:
+        totalTokens[0] += response[1][0]
+        totalTokens[1] += response[1][1]
 
-    # Name
-    nameResponse = translateGPT(state['name'], 'Reply with only the '+ LANGUAGE +' translation of the RPG Skill name.', False) if 'name' in state else ''
-
-    # Description
-    descriptionResponse = translateGPT(state['description'], 'Reply with only the '+ LANGUAGE +' translation of the description.', False) if 'description' in state else ''
+    # Set Data
+    for state, name, description in zip(stateList, responseList[0][0], responseList[1][0]):
+        if 'name' in state and isinstance(name, str):
+            state['name'] = name.replace('\"', '')
+        if 'description' in state and isinstance(description, str):
+            # Textwrap
+            state['description'] = textwrap.fill(description, width=LISTWIDTH).replace('\"', '')
 
     # Messages
-    message1Response = ''
-    message4Response = ''
-    message2Response = ''
-    message3Response = ''
+    response = translateMessages(stateList)
+    totalTokens[0] += response[0]
+    totalTokens[1] += response[1]
+
+    # Notes
+    for state in stateList:
+        if 'help' in state.get('note', ''):
+            response = translateNote(state, r'<help:([^>]*)>')
+            totalTokens[0] += response[0]
+            totalTokens[1] += response[1]
     
-    if 'message1' in state:
-        if len(state['message1']) > 0 and state['message1'][0] in ['は', 'を', 'の', 'に', 'が']:
-            message1Response = translateGPT('Taro' + state['message1'], 'reply with only the gender neutral '+ LANGUAGE +' translation of the action log. Always start the sentence with Taro. For example,\
-Translate \'Taroを倒した！\' as \'Taro was defeated!\'', False)
-        else:
-            message1Response = translateGPT(state['message1'], 'reply with only the gender neutral '+ LANGUAGE +' translation', False)
-
-    if 'message2' in state:
-        if len(state['message2']) > 0 and state['message2'][0] in ['は', 'を', 'の', 'に', 'が']:
-            message2Response = translateGPT('Taro' + state['message2'], 'reply with only the gender neutral '+ LANGUAGE +' translation of the action log. Always start the sentence with Taro. For example,\
-Translate \'Taroを倒した！\' as \'Taro was defeated!\'', False)
-        else:
-            message2Response = translateGPT(state['message2'], 'reply with only the gender neutral '+ LANGUAGE +' translation', False)
-
-    if 'message3' in state:
-        if len(state['message3']) > 0 and state['message3'][0] in ['は', 'を', 'の', 'に', 'が']:
-            message3Response = translateGPT('Taro' + state['message3'], 'reply with only the gender neutral '+ LANGUAGE +' translation of the action log. Always start the sentence with Taro. For example,\
-Translate \'Taroを倒した！\' as \'Taro was defeated!\'', False)
-        else:
-            message3Response = translateGPT(state['message3'], 'reply with only the gender neutral '+ LANGUAGE +' translation', False)
-
-    if 'message4' in state:
-        if len(state['message4']) > 0 and state['message4'][0] in ['は', 'を', 'の', 'に', 'が']:
-            message4Response = translateGPT('Taro' + state['message4'], 'reply with only the gender neutral '+ LANGUAGE +' translation of the action log. Always start the sentence with Taro. For example,\
-Translate \'Taroを倒した！\' as \'Taro was defeated!\'', False)
-        else:
-            message4Response = translateGPT(state['message4'], 'reply with only the gender neutral '+ LANGUAGE +' translation', False)
+    return totalTokens
 
-    # if 'note' in state:
-    if 'help' in state['note']:
-        totalTokens[0] += translateNote(state, r'<help:([^>]*)>')[0]
-        totalTokens[1] += translateNote(state, r'<help:([^>]*)>')[1]
-    
-    # Count totalTokens
-    totalTokens[0] += nameResponse[1][0] if nameResponse != '' else 0
-    totalTokens[1] += nameResponse[1][1] if nameResponse != '' else 0
-    totalTokens[0] += descriptionResponse[1][0] if descriptionResponse != '' else 0
-    totalTokens[1] += descriptionResponse[1][1] if descriptionResponse != '' else 0
-    totalTokens[0] += message1Response[1][0] if message1Response != '' else 0
-    totalTokens[1] += message1Response[1][1] if message1Response != '' else 0
-    totalTokens[0] += message2Response[1][0] if message2Response != '' else 0
-    totalTokens[1] += message2Response[1][1] if message2Response != '' else 0
-    totalTokens[0] += message3Response[1][0] if message3Response != '' else 0
-    totalTokens[1] += message3Response[1][1] if message3Response != '' else 0
-    totalTokens[0] += message4Response[1][0] if message4Response != '' else 0
-    totalTokens[1] += message4Response[1][1] if message4Response != '' else 0
+def translateMessages(recordList):
+    # Action logs (message1-4) of every record, one list for each kind. Lines that start with a particle get
+    # "Taro" in front so GPT has a subject to work with, it's taken back out after.
+    totalTokens = [0, 0]
+    taroList = []
+    plainList = []
+    for record in recordList:
+        if record is None:
+            continue
+        for number in range(1, 5):
+            key = f'message{number}'
+            if isinstance(record.get(key), str) and len(record[key]) > 0:
+                if record[key][0] in ['は', 'を', 'の', 'に', 'が']:
+                    taroList.append([record, key])
+                else:
+                    plainList.append([record, key])
+
+    requestList = [
+        [['Taro' + record[key] for record, key in taroList], 'reply with only the gender neutral '+ LANGUAGE +' translation of the action logs. Always start the sentence with Taro. For example, Translate \'Taroを倒した！\' as \'Taro was defeated!\''],
+        [[record[key] for record, key in plainList], 'reply with only the gender neutral '+ LANGUAGE +' translation'],
+    ]
+    responseList = translateLists(requestList)
+    for response in responseList:
+        totalTokens[0] += response[1][0]
+        totalTokens[1] += response[1][1]
 
     # Set Data
-    if 'name' in state:
-        state['name'] = nameResponse[0].replace('\"', '')
-    if 'description' in state:
-        # Textwrap
-        translatedText = descriptionResponse[0]
-        translatedText = textwrap.fill(translatedText, width=LISTWIDTH)
-        state['description'] = translatedText.replace('\"', '')
-    if 'message1' in state:
-        state['message1'] = message1Response[0].replace('\"', '').replace('Taro', '')
-    if 'message2' in state:
-        state['message2'] = message2Response[0].replace('\"', '').replace('Taro', '')
-    if 'message3' in state:
-        state['message3'] = message3Response[0].replace('\"', '').replace('Taro', '')
-    if 'message4' in state:
-        state['message4'] = message4Response[0].replace('\"', '').replace('Taro', '')
-
-    
+    for (record, key), translatedText in zip(taroList, responseList[0][0]):
+        record[key] = translatedText.replace('\"', '').replace('Taro', '')
+    for (record, key), translatedText in zip(plainList, responseList[1][0]):
+        record[key] = translatedText.replace('\"', '')
     return totalTokens
 
 def searchSystem(data, pbar):
@@ -1830,68 +2197,51 @@ def searchSystem(data, pbar):
     data['gameTitle'] = response[0].strip('.')
     
     
-    # Terms
-    for term in data['terms']:
-        if term != 'messages':
-            termList = data['terms'][term]
-            for i in range(len(termList)):  # Last item is a messages object
-                if termList[i] is not None:
-                    response = translateGPT(termList[i], context, False)
-                    totalTokens[0] += response[1][0]
-                    totalTokens[1] += response[1][1]
-                    termList[i] = response[0].replace('\"', '').strip()
-                    
-
-    # Armor Types
-    for i in range(len(data['armorTypes'])):
-        response = translateGPT(data['armorTypes'][i], 'Reply with only the '+ LANGUAGE +' translation of the armor type', False)
+    # Everything else goes out as one list per category instead of one request per string
+    termList = [term for term in data['terms'] if term != 'messages']
+    messages = data['terms']['messages']
+    requestList = [[data['terms'][term], context] for term in termList]
+    requestList.append([data['armorTypes'], 'Reply with only the '+ LANGUAGE +' translation of the armor types'])
+    requestList.append([data['skillTypes'], 'Reply with only the '+ LANGUAGE +' translation of the skill types'])
+    requestList.append([data['equipTypes'], 'Reply with only the '+ LANGUAGE +' translation of the equipment types. No disclaimers.'])
+    requestList.append([list(messages.values()), 'Reply with only the '+ LANGUAGE +' translation of the battle text.\nTranslate "常時ダッシュ" as "Always Dash"\nTranslate "次の%1まで" as Next %1.'])
+    responseList = translateLists(requestList)
+    for response in responseList:
         totalTokens[0] += response[1][0]
         totalTokens[1] += response[1][1]
-        data['armorTypes'][i] = response[0].replace('\"', '').strip()
-        
 
-    # Skill Types
-    for i in range(len(data['skillTypes'])):
-        response = translateGPT(data['skillTypes'][i], 'Reply with only the '+ LANGUAGE +' translation', False)
-        totalTokens[0] += response[1][0]
-        totalTokens[1] += response[1][1]
-        data['skillTypes'][i] = response[0].replace('\"', '').strip()
-        
-
-    # Equip Types
-    for i in range(len(data['equipTypes'])):
-        response = translateGPT(data['equipTypes'][i], 'Reply with only the '+ LANGUAGE +' translation of the equipment type. No disclaimers.', False)
-        totalTokens[0] += response[1][0]
-        totalTokens[1] += response[1][1]
-        data['equipTypes'][i] = response[0].replace('\"', '').strip()
-        
-
-    # Variables (Optional ususally)
-    # for i in range(len(data['variables'])):
-    #     response = translateGPT(data['variables'][i], 'Reply with only the '+ LANGUAGE +' translation of the title', False)
-    #     totalTokens[0] += response[1][0]
-    #     totalTokens[1] += response[1][1]
-    #     data['variables'][i] = response[0].replace('\"', '').strip()
-    #     
+    # Terms, Armor Types, Skill Types, Equip Types
+    for textList, response in zip([data['terms'][term] for term in termList] + [data['armorTypes'], data['skillTypes'], data['equipTypes']], responseList):
+        textList[:] = [text.replace('\"', '').strip() if isinstance(text, str) else text for text in response[0]]
 
     # Messages
-    messages = (data['terms']['messages'])
-    for key, value in messages.items():
-        response = translateGPT(value, 'Reply with only the '+ LANGUAGE +' translation of the battle text.\nTranslate "常時ダッシュ" as "Always Dash"\nTranslate "次の%1まで" as Next %1.', False)
-        translatedText = response[0]
-
+    for key, translatedText in zip(list(messages.keys()), responseList[-1][0]):
         # Remove characters that may break scripts
         charList = ['.', '\"', '\\n']
         for char in charList:
             translatedText = translatedText.replace(char, '')
-
-        totalTokens[0] += response[1][0]
-        totalTokens[1] += response[1][1]
         messages[key] = translatedText
-        
     
     return totalTokens
 
+def translateLists(requestList):
+    # [[Strings, Context], ...] Every list is sent at once and comes back as [Translations, Tokens] in the same order
+    return engine.run(translateListsAsync(requestList))
+
+async def translateListsAsync(requestList):
+    return await asyncio.gather(*[translateListAsync(textList, context) for textList, context in requestList])
+
+async def translateListAsync(textList, context):
+    # None and empty strings are left alone
+    indexList = [i for i, text in enumerate(textList) if isinstance(text, str) and text.strip() != '']
+    translatedList = list(textList)
+    if len(indexList) == 0:
+        return [translatedList, [0,0]]
+    response = await translateGPTAsync([textList[i] for i in indexList], context, True)
+    for i, translatedText in zip(indexList, response[0]):
+        translatedList[i] = translatedText
+    return [translatedList, response[1]]
+
 # Save some money and enter the character before translation
 def getSpeaker(speaker):
     match speaker:
@@ -1900,147 +2250,38 @@ def getSpeaker(speaker):
         case '':
             return ['', [0,0]]
         case _:
-            # Store Speaker
-            if speaker not in str(NAMESLIST):
-                response = translateGPT(speaker, 'Reply with the '+ LANGUAGE +' translation of the NPC name.', False)
-                response[0] = response[0].title()
-                response[0] = response[0].replace("'S", "'s")
-
-                # Retry if name doesn't translate for some reason
-                if re.search(r'([a-zA-Z？?])', response[0]) == None:
-                    response = translateGPT(speaker, 'Reply with the '+ LANGUAGE +' translation of the NPC name.', False)
-                    response[0] = response[0].title()
-                    response[0] = response[0].replace("'S", "'s")
-
-                speakerList = [speaker, response[0]]
-                NAMESLIST.append(speakerList)
-                return response
-            # Find Speaker
-            else:
-                for i in range(len(NAMESLIST)):
-                    if speaker == NAMESLIST[i][0]:
-                        return [NAMESLIST[i][1],[0,0]]
+            return speakers.getSpeaker(speaker, translateSpeaker, ESTIMATE)
                                
     return [speaker,[0,0]]
 
-def subVars(jaString):
-    jaString = jaString.replace('\u3000', ' ')
-
-    # Nested
-    count = 0
-    nestedList = re.findall(r'[\\]+[\w]+\[[\\]+[\w]+\[[0-9]+\]\]', jaString)
-    nestedList = set(nestedList)
-    if len(nestedList) != 0:
-        for icon in nestedList:
-            jaString = jaString.replace(icon, '[Nested_' + str(count) + ']')
-            count += 1
-
-    # Icons
-    count = 0
-    iconList = re.findall(r'[\\]+[iIkKwWaA]+\[[0-9]+\]', jaString)
-    iconList = set(iconList)
-    if len(iconList) != 0:
-        for icon in iconList:
-            jaString = jaString.replace(icon, '[Ascii_' + str(count) + ']')
-            count += 1
-
-    # Colors
-    count = 0
-    colorList = re.findall(r'[\\]+[cC]\[[0-9]+\]', jaString)
-    colorList = set(colorList)
-    if len(colorList) != 0:
-        for color in colorList:
-            jaString = jaString.replace(color, '[Color_' + str(count) + ']')
-            count += 1
+def translateSpeaker(speaker):
+    response = translateGPT(speaker, 'Reply with the '+ LANGUAGE +' translation of the NPC name.', False)
+    response[0] = response[0].title()
+    response[0] = response[0].replace("'S", "'s")
 
-    # Names
-    count = 0
-    nameList = re.findall(r'[\\]+[nN]\[.+?\]+', jaString)
-    nameList = set(nameList)
-    if len(nameList) != 0:
-        for name in nameList:
-            jaString = jaString.replace(name, '[Noun_' + str(count) + ']')
-            count += 1
-
-    # Variables
-    count = 0
-    varList = re.findall(r'[\\]+[vV]\[[0-9]+\]', jaString)
-    varList = set(varList)
-    if len(varList) != 0:
-        for var in varList:
-            jaString = jaString.replace(var, '[Var_' + str(count) + ']')
-            count += 1
-
-    # Formatting
-    count = 0
-    formatList = re.findall(r'[\\]+[\w]+\[[a-zA-Z0-9\\\[\]\_,\s-]+\]', jaString)
-    formatList = set(formatList)
-    if len(formatList) != 0:
-        for var in formatList:
-            jaString = jaString.replace(var, '[FCode_' + str(count) + ']')
-            count += 1
-
-    # Put all lists in list and return
-    allList = [nestedList, iconList, colorList, nameList, varList, formatList]
-    return [jaString, allList]
+    # Retry if name doesn't translate for some reason
+    if re.search(r'([a-zA-Z？?])', response[0]) == None:
+        response = translateGPT(speaker, 'Reply with the '+ LANGUAGE +' translation of the NPC name.', False)
+        response[0] = response[0].title()
+        response[0] = response[0].replace("'S", "'s")
 
-def resubVars(translatedText, allList):
-    # Fix Spacing and ChatGPT Nonsense
-    matchList = re.findall(r'\[\s?.+?\s?\]', translatedText)
-    if len(matchList) > 0:
-        for match in matchList:
-            text = match.strip()
-            translatedText = translatedText.replace(match, text)
-
-    # Nested
-    count = 0
-    if len(allList[0]) != 0:
-        for var in allList[0]:
-            translatedText = translatedText.replace('[Nested_' + str(count) + ']', var)
-            count += 1
-
-    # Icons
-    count = 0
-    if len(allList[1]) != 0:
-        for var in allList[1]:
-            translatedText = translatedText.replace('[Ascii_' + str(count) + ']', var)
-            count += 1
-
-    # Colors
-    count = 0
-    if len(allList[2]) != 0:
-        for var in allList[2]:
-            translatedText = translatedText.replace('[Color_' + str(count) + ']', var)
-            count += 1
+    return response
 
-    # Names
-    count = 0
-    if len(allList[3]) != 0:
-        for var in allList[3]:
-            translatedText = translatedText.replace('[Noun_' + str(count) + ']', var)
-            count += 1
-
-    # Vars
-    count = 0
-    if len(allList[4]) != 0:
-        for var in allList[4]:
-            translatedText = translatedText.replace('[Var_' + str(count) + ']', var)
-            count += 1
-    
-    # Formatting
-    count = 0
-    if len(allList[5]) != 0:
-        for var in allList[5]:
-            translatedText = translatedText.replace('[FCode_' + str(count) + ']', var)
-            count += 1
+def translateSpeakerList(speakerList):
+    response = translateGPT(speakerList, 'Reply with the '+ LANGUAGE +' translation of the NPC names.', True)
+    nameList = []
+    for name in response[0]:
+        name = name.title().replace("'S", "'s")
 
-    return translatedText
+        # Same check as translateSpeaker, those get retried on their own
+        nameList.append(name if ESTIMATE or re.search(r'([a-zA-Z？?])', name) is not None else None)
+    return [nameList, response[1]]
 
-def batchList(input_list, batch_size):
-    if not isinstance(batch_size, int) or batch_size <= 0:
-        raise ValueError("batch_size must be a positive integer")
-        
-    return [input_list[i:i + batch_size] for i in range(0, len(input_list), batch_size)]
+def subVars(jaString):
+    return codes.subVars(jaString, codes.SQUARE)
+
+def resubVars(translatedText, allList):
+    return codes.resubVars(translatedText, allList, codes.SQUARE)
 
 def createContext(fullPromptFlag, subbedT):
     characters = 'Game Characters:\n\
@@ -2064,7 +2305,7 @@ Output ONLY the {LANGUAGE} translation in the following format: `Translation: <{
     user = f'{subbedT}'
     return characters, system, user
 
-def translateText(characters, system, user, history, penalty):
+async def translateText(characters, system, user, history, penalty):
     # Prompt
     msg = [{"role": "system", "content": system + characters}]
 
@@ -2079,7 +2320,7 @@ def translateText(characters, system, user, history, penalty):
     
     # Content to TL
     msg.append({"role": "user", "content": f'{user}'})
-    response = openai.chat.completions.create(
+    response = await engine.chatCompletion(
         temperature=0,
         frequency_penalty=penalty,
         model=MODEL,
@@ -2136,6 +2377,61 @@ def extractTranslation(translatedTextList, is_list):
         matchList = re.findall(pattern, translatedTextList)
         return matchList[0][0] if matchList else translatedTextList
 
+def extractTranslationDict(translatedText, length):
+    # Same as extractTranslation but keeps track of which line each translation belongs to
+    pattern = r'`?<Line(\d+)>([\\]*.*?[\\]*?)<\/?Line\d+>`?'
+    lineDict = {}
+    for match in re.findall(pattern, translatedText):
+        lineIndex = int(match[0])
+        if lineIndex < length and lineIndex not in lineDict:
+            lineDict[lineIndex] = match[1]
+    return lineDict
+
+async def requestLines(lines, history, fullPromptFlag, penalty):
+    payload = '\n'.join([f'`<Line{i}>{item}</Line{i}>`' for i, item in enumerate(lines)])
+    payload = re.sub(r'(<Line\d+)(><)(\/Line\d+>)', r'\1>Placeholder Text<\3', payload)
+    varResponse = subVars(payload)
+
+    # Nothing to translate, take the lines as they are
+    if not re.search(r'[一-龠ぁ-ゔァ-ヴーａ-ｚＡ-Ｚ０-９]+', varResponse[0]):
+        return [dict(enumerate(lines)), [0, 0]]
+
+    characters, system, user = createContext(fullPromptFlag, varResponse[0])
+    response = await translateText(characters, system, user, history, penalty)
+    translatedText = cleanTranslatedText(response.choices[0].message.content, varResponse)
+    return [extractTranslationDict(translatedText, len(lines)), [response.usage.prompt_tokens, response.usage.completion_tokens]]
+
+async def recoverMismatch(lines, lineDict, history, fullPromptFlag):
+    totalTokens = [0, 0]
+    lineDict = dict(lineDict)
+
+    # Re-request only the missing lines. If a request still comes back short, split it in half until
+    # every line either comes back or is on its own and still fails.
+    pending = [[i for i in range(len(lines)) if i not in lineDict]]
+    failed = []
+    while len(pending) > 0:
+        indexList = pending.pop(0)
+        if len(indexList) == 0:
+            continue
+        response = await requestLines([lines[i] for i in indexList], history, fullPromptFlag, 0.2)
+        totalTokens[0] += response[1][0]
+        totalTokens[1] += response[1][1]
+        for subIndex, translation in response[0].items():
+            lineDict[indexList[subIndex]] = translation
+        remaining = [i for i in indexList if i not in lineDict]
+        if len(remaining) == 0:
+            continue
+        if len(remaining) == 1 and len(indexList) == 1:
+            failed.extend(remaining)
+        elif len(remaining) < len(indexList):
+            pending.append(remaining)
+        else:
+            half = len(remaining) // 2
+            pending.extend([remaining[:half], remaining[half:]])
+
+    # Anything that never came back stays untranslated so the rest of the batch can still be used
+    return [[lineDict.get(i, lines[i]) for i in range(len(lines))], totalTokens, failed]
+
 def countTokens(characters, system, user, history):
     inputTotalTokens = 0
     outputTotalTokens = 0
@@ -2161,20 +2457,39 @@ def combineList(tlist, text):
         return [t for sublist in tlist for t in sublist]
     return tlist[0]
 
-@retry(exceptions=Exception, tries=5, delay=5)
-def translateGPT(text, history, fullPromptFlag):
+def translateGPT(text, history, fullPromptFlag, filename=None):
+    return engine.run(translateGPTAsync(text, history, fullPromptFlag, filename))
+
+async def translateGPTAsync(text, history, fullPromptFlag, filename=None):
     global PBAR
     
     mismatch = False
     totalTokens = [0, 0]
+    kind = batching.getKind(filename)
+
+    # Translation Memory
+    characters, system, user = createContext(fullPromptFlag, '')
+    cacheContext = cache.getContext(MODEL, system, characters, history)
     if isinstance(text, list):
-        tList = batchList(text, BATCHSIZE)
+        cachedList = cache.lookupList(cacheContext, text, subVars)
+        cachedList = journal.lookupList(filename, text, cachedList)
+        cachedList = dedup.lookupList(cacheContext, text, cachedList, subVars)
+        missIndexes = [i for i, cached in enumerate(cachedList) if cached is None]
+        tList = batching.packBatches(cache.getMisses(text, cachedList), MODEL, BATCHSIZE, subVars, kind)
+        if PBAR is not None:
+            PBAR.update(len(text) - sum(len(tItem) for tItem in tList))
     else:
+        cachedText = cache.lookup(cacheContext, text, subVars)
+        if cachedText is not None:
+            return [cachedText, totalTokens]
         tList = [text]
 
+    offset = 0
     for index, tItem in enumerate(tList):
         # Before sending to translation, if we have a list of items, add the formatting
         if isinstance(tItem, list):
+            batchIndexes = missIndexes[offset:offset + len(tItem)]
+            offset += len(tItem)
             payload = '\n'.join([f'`<Line{i}>{item}</Line{i}>`' for i, item in enumerate(tItem)])
             payload = re.sub(r'(<Line\d+)(><)(\/Line\d+>)', r'\1>Placeholder Text<\3', payload)
             varResponse = subVars(payload)
@@ -2200,7 +2515,10 @@ def translateGPT(text, history, fullPromptFlag):
             continue
 
         # Translating
-        response = translateText(characters, system, user, history, 0.02)
+        start = time.time()
+        response = await translateText(characters, system, user, history, 0.02)
+        latency = time.time() - start
+        truncated = response.choices[0].finish_reason == 'length'
         translatedText = response.choices[0].message.content
         totalTokens[0] += response.usage.prompt_tokens
         totalTokens[1] += response.usage.completion_tokens
@@ -2209,21 +2527,22 @@ def translateGPT(text, history, fullPromptFlag):
         translatedText = cleanTranslatedText(translatedText, varResponse)
         if isinstance(tItem, list):
             extractedTranslations = extractTranslation(translatedText, True)
-            tList[index] = extractedTranslations
+            batching.recordBatch(kind, len(tItem) != len(extractedTranslations), latency, truncated)
             if len(tItem) != len(extractedTranslations):
-                # Mismatch. Try Again
-                response = translateText(characters, system, user, history, 0.2)
-                translatedText = response.choices[0].message.content
-                totalTokens[0] += response.usage.prompt_tokens
-                totalTokens[1] += response.usage.completion_tokens
-
-                # Formatting
-                translatedText = cleanTranslatedText(translatedText, varResponse)
-                if isinstance(tItem, list):
-                    extractedTranslations = extractTranslation(translatedText, True)
-                    tList[index] = extractedTranslations
-                    if len(tItem) != len(extractedTranslations):
-                        mismatch = True # Just here for breakpoint
+                # Mismatch. Keep the lines that came back and only retry the missing ones
+                metrics.increment('mismatches')
+                lineDict = extractTranslationDict(translatedText, len(tItem))
+                response = await recoverMismatch(tItem, lineDict, history, fullPromptFlag)
+                extractedTranslations = response[0]
+                totalTokens[0] += response[1][0]
+                totalTokens[1] += response[1][1]
+                if len(response[2]) > 0:
+                    metrics.increment('mismatch_failed_lines', len(response[2]))
+                    mismatch = True # Just here for breakpoint
+                    with LOCK:
+                        if filename is not None and filename not in MISMATCH:
+                            MISMATCH.append(filename)
+            tList[index] = extractedTranslations
 
             # Create History
             with LOCK:
@@ -2233,10 +2552,18 @@ def translateGPT(text, history, fullPromptFlag):
                 history = extractedTranslations[-10:]  # Update history if we have a list
             else:
                 history = text[-10:]
+
+            # Translation Memory
+            if len(tItem) == len(extractedTranslations):
+                cache.storeList(cacheContext, tItem, extractedTranslations, subVars)
+                journal.appendList(filename, text, batchIndexes, extractedTranslations)
         else:
             # Ensure we're passing a single string to extractTranslation
             extractedTranslations = extractTranslation(translatedText, False)
             tList[index] = extractedTranslations
+            cache.store(cacheContext, tItem, extractedTranslations, subVars)
 
     finalList = combineList(tList, text)
+    if isinstance(text, list):
+        finalList = cache.mergeList(cachedList, finalList)
     return [finalList, totalTokens]
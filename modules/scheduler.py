@@ -0,0 +1,70 @@
+# Libraries
+import heapq, itertools, os, threading
+from concurrent.futures import FIRST_EXCEPTION, Future, wait
+from modules import api
+
+# Page Scheduler
+# One run-level queue for every page of every event, troop, common event and scenario. Files push their pages
+# here instead of opening a ThreadPoolExecutor per event and waiting on it before the next one, and the
+# workers always take the biggest page left (From any file) so a giant CommonEvent starts early instead of
+# holding up the end of the run. fileThreads x threads workers, same as before and same as engine.REQUESTS.
+LOCK = threading.Condition()
+QUEUE = []      # Heap of [-Size, Order, Future, Label, Function, Args]
+ORDER = itertools.count()
+WORKERS = []
+
+def getSize(page):
+    # Commands on the page
+    if isinstance(page, dict):
+        return len(page.get('list', []))
+    return len(page) if isinstance(page, list) else 0
+
+def submit(label, function, size, *args):
+    future = Future()
+    with LOCK:
+        heapq.heappush(QUEUE, [-size, next(ORDER), future, label, function, args])
+
+        # Workers start on first use so --file-threads and --threads are already set
+        if len(WORKERS) < int(os.getenv('fileThreads') or 1) * int(os.getenv('threads') or 1):
+            worker = threading.Thread(target=work, daemon=True)
+            worker.start()
+            WORKERS.append(worker)
+        LOCK.notify()
+    return future
+
+def work():
+    while True:
+        with LOCK:
+            while len(QUEUE) == 0:
+                LOCK.wait()
+            future, label, function, args = heapq.heappop(QUEUE)[2:]
+        if not future.set_running_or_notify_cancel():
+            continue
+        api.LABEL.set(label)
+        try:
+            future.set_result(function(*args))
+        except BaseException as e:
+            future.set_exception(e)
+
+def runPages(function, pageDict, *args):
+    # function(page, *args) for every page in {Label: Page}, returns the summed [Input Tokens, Output Tokens].
+    # The label (File [Page]) shows up if a request gets stuck.
+    totalTokens = [0, 0]
+    for response in mapPages(function, pageDict, *args):
+        totalTokens[0] += response[0]
+        totalTokens[1] += response[1]
+    return totalTokens
+
+def mapPages(function, pageDict, *args):
+    # Same as runPages but returns what function returned for every page, in pageDict order. The first error
+    # cancels the pages that haven't started and is raised once the running ones are done.
+    futures = [submit(label, function, getSize(page), page, *args) for label, page in pageDict.items()]
+    pending = wait(futures, return_when=FIRST_EXCEPTION)[1]
+    for future in pending:
+        future.cancel()
+    wait(pending)
+
+    for future in futures:
+        if not future.cancelled() and future.exception() is not None:
+            raise future.exception()
+    return [future.result() for future in futures]
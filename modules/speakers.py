@@ -0,0 +1,98 @@
+# Libraries
+import json, os, threading
+from modules import config
+
+# Speaker Names
+# One table of translated speaker names shared by every thread. When several pages hit a new name at the
+# same time only the first one asks the API, the rest wait for its answer instead of paying for it again.
+# Names are saved to speakers.json (speakers in .env) so a game only pays for each name once, and a bad name
+# can be fixed by hand there. Delete the file when starting a different game.
+SPEAKERFILE = config.getenv('speakers', 'speakers.json')
+LANGUAGE = config.getenv('language')
+LOCK = threading.Lock()
+NAMES = None    # Speaker -> Translation
+PENDING = {}    # Speaker -> Event, names being translated right now
+
+def enabled():
+    return SPEAKERFILE.replace(' ', '') != ''
+
+def load():
+    # Call with LOCK held
+    global NAMES
+    if NAMES is None:
+        NAMES = {}
+        if enabled() and os.path.exists(SPEAKERFILE):
+            with open(SPEAKERFILE, 'r', encoding='utf-8') as f:
+                NAMES = json.load(f).get(LANGUAGE, {})
+    return NAMES
+
+def save():
+    # Call with LOCK held. Other languages in the file are kept. Names that came back untouched (Already
+    # translated, no Japanese) stay in memory so they aren't asked for again but aren't worth keeping on disk.
+    if not enabled():
+        return
+    languageDict = {}
+    if os.path.exists(SPEAKERFILE):
+        with open(SPEAKERFILE, 'r', encoding='utf-8') as f:
+            languageDict = json.load(f)
+    languageDict[LANGUAGE] = {speaker: name for speaker, name in NAMES.items() if name != speaker}
+    with open(SPEAKERFILE + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(languageDict, f, ensure_ascii=False, indent=4)
+    os.replace(SPEAKERFILE + '.tmp', SPEAKERFILE)
+
+def getSpeaker(speaker, translateFunction, estimate=False):
+    # translateFunction(speaker) returns [Translation, [Input Tokens, Output Tokens]] like translateGPT
+    with LOCK:
+        nameDict = load()
+        if speaker in nameDict:
+            return [nameDict[speaker], [0,0]]
+        event = PENDING.get(speaker)
+        if event is None:
+            event = PENDING[speaker] = threading.Event()
+            owner = True
+        else:
+            owner = False
+
+    # Someone else is already translating it
+    if not owner:
+        event.wait()
+        with LOCK:
+            if speaker in NAMES:
+                return [NAMES[speaker], [0,0]]
+
+        # Their request failed, try it ourselves
+        return getSpeaker(speaker, translateFunction, estimate)
+
+    try:
+        response = translateFunction(speaker)
+
+        # Every answer is kept so nobody asks again, estimates aren't real translations so they stay in memory
+        with LOCK:
+            NAMES[speaker] = response[0]
+            if not estimate and response[0] != speaker:
+                save()
+        return response
+    finally:
+        with LOCK:
+            PENDING.pop(speaker, None)
+        event.set()
+
+def addSpeakers(speakerList, translateFunction, estimate=False):
+    # Pre-pass, every name not seen yet is translated together. Returns the tokens used.
+    # translateFunction(list) returns [Translations, Tokens], a translation of None is skipped and that name
+    # gets its own request when it comes up in the dialogue instead.
+    with LOCK:
+        nameDict = load()
+        newList = list(dict.fromkeys(speaker for speaker in speakerList if speaker != '' and speaker not in nameDict))
+    if len(newList) == 0:
+        return [0,0]
+
+    response = translateFunction(newList)
+    if len(response[0]) == len(newList):
+        with LOCK:
+            for speaker, translation in zip(newList, response[0]):
+                if translation is not None:
+                    NAMES[speaker] = translation
+            if not estimate:
+                save()
+    return response[1]
@@ -0,0 +1,44 @@
+# Libraries
+import json, threading
+
+# Run Summary
+# Collects what happened to every file so headless runs (python start.py --engine ...) can print or save a
+# JSON summary at the end instead of someone having to read the progress bars.
+LOCK = threading.Lock()
+ERRORS = {}
+
+def recordError(filename, error):
+    with LOCK:
+        ERRORS[filename] = str(error) or type(error).__name__
+
+def build(engine, mode, resultDict, elapsed, engineModule):
+    fileList = []
+    for filename, result in resultDict.items():
+        if isinstance(result, Exception):
+            fileList.append({'file': filename, 'status': 'fail', 'error': str(result)})
+        elif result == 'Fail' or filename in ERRORS:
+            fileList.append({'file': filename, 'status': 'fail', 'error': ERRORS.get(filename, 'Failed to write file')})
+        else:
+            fileList.append({'file': filename, 'status': 'ok', 'error': None})
+
+    # Tokens and cost if the engine keeps track of them
+    tokens = getattr(engineModule, 'TOKENS', [0, 0])
+    cost = tokens[0] * 0.001 * getattr(engineModule, 'INPUTAPICOST', 0) + tokens[1] * 0.001 * getattr(engineModule, 'OUTPUTAPICOST', 0)
+    return {
+        'engine': engine,
+        'mode': mode,
+        'files': fileList,
+        'failed': sum(1 for item in fileList if item['status'] == 'fail'),
+        'mismatch': list(getattr(engineModule, 'MISMATCH', [])),
+        'tokens': {'input': tokens[0], 'output': tokens[1]},
+        'cost': round(cost, 4),
+        'seconds': round(elapsed, 1),
+    }
+
+def write(summaryDict, path):
+    # '-' prints it to stdout as the last line
+    if path == '-':
+        print(json.dumps(summaryDict, ensure_ascii=False))
+    else:
+        with open(path, 'w', encoding='utf-8') as outFile:
+            json.dump(summaryDict, outFile, ensure_ascii=False, indent=4)
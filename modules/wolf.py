@@ -1,25 +1,15 @@
 # Libraries
-import json, os, re, textwrap, threading, time, traceback, tiktoken, openai
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from pathlib import Path
+import json, os, re, textwrap, threading, time, traceback, tiktoken
 from colorama import Fore
-from dotenv import load_dotenv
-from retry import retry
 from tqdm import tqdm
-
-# Open AI
-load_dotenv()
-if os.getenv('api').replace(' ', '') != '':
-    openai.base_url = os.getenv('api')
-openai.organization = os.getenv('org')
-openai.api_key = os.getenv('key')
+from modules import api, batching, cache, codes, config, metrics, scheduler, speakers, summary
 
 #Globals
 MODEL = os.getenv('model')
 TIMEOUT = int(os.getenv('timeout'))
 LANGUAGE = os.getenv('language').capitalize()
-PROMPT = Path('prompt.txt').read_text(encoding='utf-8')
-VOCAB = Path('vocab.txt').read_text(encoding='utf-8')
+PROMPT = config.PROMPT
+VOCAB = config.VOCAB
 THREADS = int(os.getenv('threads'))
 LOCK = threading.Lock()
 WIDTH = int(os.getenv('width'))
@@ -28,7 +18,6 @@ NOTEWIDTH = int(os.getenv('noteWidth'))
 MAXHISTORY = 10
 ESTIMATE = ''
 TOKENS = [0, 0]
-NAMESLIST = []   # Keep list for consistency
 TERMSLIST = []   # Keep list for consistency
 NAMES = False    # Output a list of all the character names found
 BRFLAG = False   # If the game uses <br> instead
@@ -74,6 +63,48 @@ COLLECTIONFLAG = True
 ARMORFLAG = True
 OTHERFLAG = True
 
+def speakersWOLF(filenameList, estimate):
+    global ESTIMATE
+    ESTIMATE = estimate
+
+    # Find every speaker in the map and common event files and translate the new ones together, see speakers.py
+    speakerList = []
+    for filename in filenameList:
+        with open(os.path.join(config.FILES, filename), 'r', encoding='utf-8-sig') as f:
+            data = json.load(f)
+        if not isinstance(data, dict):
+            continue
+        if isinstance(data.get('events'), list):
+            for event in data['events']:
+                if event is not None:
+                    for page in event['pages']:
+                        if page is not None:
+                            speakerList.extend(findSpeakers(page['list']))
+        elif isinstance(data.get('commands'), list):
+            speakerList.extend(findSpeakers(data['commands']))
+
+    start = time.time()
+    with tqdm(bar_format=BAR_FORMAT, position=POSITION, leave=LEAVE) as pbar:
+        pbar.desc='Speakers'
+        response = speakers.addSpeakers(speakerList, lambda nameList: translateSpeakerList(nameList, pbar), estimate)
+    with LOCK:
+        TOKENS[0] += response[0]
+        TOKENS[1] += response[1]
+    if response != [0,0]:
+        tqdm.write(getResultString(['', response, None], time.time() - start, f'Speakers ({len(set(speakerList))} Names)'))
+
+def findSpeakers(codeList):
+    # Same pattern searchCodes looks for (Name：\n)
+    speakerList = []
+    if CODE101 is not True:
+        return speakerList
+    for command in codeList:
+        if command.get('code') == 101 and len(command.get('stringArgs', [])) > 0:
+            jaString = re.sub(r'^[\\_]+[\w]+\[[a-zA-Z0-9\\\[\]\_,\s-]+\]', '', command['stringArgs'][0])
+            if '：\n' in jaString:
+                speakerList.extend(re.findall(r'(.*)：\n', jaString)[:1])
+    return speakerList
+
 def handleWOLF(filename, estimate):
     global ESTIMATE, TOKENS
     ESTIMATE = estimate
@@ -85,7 +116,7 @@ def handleWOLF(filename, estimate):
     # Translate
     if not estimate:
         try:
-            with open('translated/' + filename, 'w', encoding='utf-8') as outFile:
+            with open(os.path.join(config.TRANSLATED, filename), 'w', encoding='utf-8') as outFile:
                 json.dump(translatedData[0], outFile, ensure_ascii=False, indent=4)
         except Exception:
             traceback.print_exc()
@@ -108,7 +139,7 @@ def handleWOLF(filename, estimate):
         return totalString
 
 def openFiles(filename):
-    with open('files/' + filename, 'r', encoding='utf-8-sig') as f:
+    with open(os.path.join(config.FILES, filename), 'r', encoding='utf-8-sig') as f:
         data = json.load(f)
 
         # Map Files
@@ -150,6 +181,7 @@ def getResultString(translatedData, translationTime, filename):
             raise translatedData[2]
         except Exception as e:
             traceback.print_exc()
+            summary.recordError(filename, e)
             errorString = str(e) + Fore.RED
             return filename + ': ' + totalTokenstring + timeString + Fore.RED + u' \u2717 ' +\
                 errorString + Fore.RESET
@@ -202,21 +234,18 @@ def parseMap(data, filename):
             for page in event['pages']:
                 totalLines += len(page['list'])
     
-    # Thread for each page in file
+    # Every page in the file goes on the run queue at once, see scheduler.py
     with tqdm(bar_format=BAR_FORMAT, position=POSITION, total=totalLines, leave=LEAVE) as pbar:
         pbar.desc=filename
         pbar.total=totalLines
-        with ThreadPoolExecutor(max_workers=THREADS) as executor:
-            for event in events:
-                if event is not None:
-                    futures = [executor.submit(searchCodes, page['list'], pbar, [], filename) for page in event['pages'] if page is not None]
-                    for future in as_completed(futures):
-                        try:
-                            totalTokensFuture = future.result()
-                            totalTokens[0] += totalTokensFuture[0]
-                            totalTokens[1] += totalTokensFuture[1]
-                        except Exception as e:
-                            return [data, totalTokens, e]
+        pageDict = {f'{filename} [{e}:{i}]': page['list'] for e, event in enumerate(events) if event is not None \
+                    for i, page in enumerate(event['pages']) if page is not None}
+        try:
+            response = scheduler.runPages(searchCodes, pageDict, pbar, [], filename)
+            totalTokens[0] += response[0]
+            totalTokens[1] += response[1]
+        except Exception as e:
+            return [data, totalTokens, e]
     return [data, totalTokens, None]
 
 def searchCodes(events, pbar, translatedList, filename):
@@ -229,7 +258,6 @@ def searchCodes(events, pbar, translatedList, filename):
     nametag = ''
     initialJAString = ''
     global LOCK
-    global NAMESLIST
     global MISMATCH
 
     # Calculate Total Length
@@ -540,7 +568,6 @@ def searchDB(events, pbar, jobList, filename):
     initialJAString = ''
     tableList = events
     global LOCK
-    global NAMESLIST
     global MISMATCH
     
     # Calculate Total
@@ -972,141 +999,25 @@ def getSpeaker(speaker, pbar, filename):
         case '':
             return ['', [0,0]]
         case _:
-            # Store Speaker
-            if speaker not in str(NAMESLIST):
-                response = translateGPT(speaker, 'Reply with only the '+ LANGUAGE +' translation of the NPC name.', False, pbar, filename)
-                response[0] = response[0].title()
-                response[0] = response[0].replace("'S", "'s")
-                speakerList = [speaker, response[0]]
-                NAMESLIST.append(speakerList)
-                return response
-            
-            # Find Speaker
-            else:
-                for i in range(len(NAMESLIST)):
-                    if speaker == NAMESLIST[i][0]:
-                        return [NAMESLIST[i][1],[0,0]]
+            return speakers.getSpeaker(speaker, lambda name: translateSpeaker(name, pbar, filename), ESTIMATE)
                                
     return [speaker,[0,0]]
 
-def subVars(jaString):
-    jaString = jaString.replace('\u3000', ' ')
-
-    # Nested
-    count = 0
-    nestedList = re.findall(r'[\\]+[\w]+\[[\\]+[\w]+\[[0-9]+\]\]', jaString)
-    nestedList = set(nestedList)
-    if len(nestedList) != 0:
-        for icon in nestedList:
-            jaString = jaString.replace(icon, '[Nested_' + str(count) + ']')
-            count += 1
-
-    # Icons
-    count = 0
-    iconList = re.findall(r'[\\]+[iIkKwWaA]+\[[0-9]+\]', jaString)
-    iconList = set(iconList)
-    if len(iconList) != 0:
-        for icon in iconList:
-            jaString = jaString.replace(icon, '[Ascii_' + str(count) + ']')
-            count += 1
-
-    # Colors
-    count = 0
-    colorList = re.findall(r'[\\]+[cC]\[[0-9]+\]', jaString)
-    colorList = set(colorList)
-    if len(colorList) != 0:
-        for color in colorList:
-            jaString = jaString.replace(color, '[Color_' + str(count) + ']')
-            count += 1
-
-    # Names
-    count = 0
-    nameList = re.findall(r'[\\]+[nN]\[.+?\]+', jaString)
-    nameList = set(nameList)
-    if len(nameList) != 0:
-        for name in nameList:
-            jaString = jaString.replace(name, '[Noun_' + str(count) + ']')
-            count += 1
-
-    # Variables
-    count = 0
-    varList = re.findall(r'[\\]+[vV]\[[0-9]+\]', jaString)
-    varList = set(varList)
-    if len(varList) != 0:
-        for var in varList:
-            jaString = jaString.replace(var, '[Var_' + str(count) + ']')
-            count += 1
-
-    # Formatting
-    count = 0
-    formatList = re.findall(r'[\\]+[\w]+\[[a-zA-Z0-9\\\[\]\_,\s-]+\]', jaString)
-    formatList = set(formatList)
-    if len(formatList) != 0:
-        for var in formatList:
-            jaString = jaString.replace(var, '[FCode_' + str(count) + ']')
-            count += 1
-
-    # Put all lists in list and return
-    allList = [nestedList, iconList, colorList, nameList, varList, formatList]
-    return [jaString, allList]
+def translateSpeaker(speaker, pbar, filename):
+    response = translateGPT(speaker, 'Reply with only the '+ LANGUAGE +' translation of the NPC name.', False, pbar, filename)
+    response[0] = response[0].title()
+    response[0] = response[0].replace("'S", "'s")
+    return response
 
-def resubVars(translatedText, allList):
-    # Fix Spacing and ChatGPT Nonsense
-    matchList = re.findall(r'\[\s?.+?\s?\]', translatedText)
-    if len(matchList) > 0:
-        for match in matchList:
-            text = match.strip()
-            translatedText = translatedText.replace(match, text)
-
-    # Nested
-    count = 0
-    if len(allList[0]) != 0:
-        for var in allList[0]:
-            translatedText = translatedText.replace('[Nested_' + str(count) + ']', var)
-            count += 1
-
-    # Icons
-    count = 0
-    if len(allList[1]) != 0:
-        for var in allList[1]:
-            translatedText = translatedText.replace('[Ascii_' + str(count) + ']', var)
-            count += 1
-
-    # Colors
-    count = 0
-    if len(allList[2]) != 0:
-        for var in allList[2]:
-            translatedText = translatedText.replace('[Color_' + str(count) + ']', var)
-            count += 1
-
-    # Names
-    count = 0
-    if len(allList[3]) != 0:
-        for var in allList[3]:
-            translatedText = translatedText.replace('[Noun_' + str(count) + ']', var)
-            count += 1
-
-    # Vars
-    count = 0
-    if len(allList[4]) != 0:
-        for var in allList[4]:
-            translatedText = translatedText.replace('[Var_' + str(count) + ']', var)
-            count += 1
-    
-    # Formatting
-    count = 0
-    if len(allList[5]) != 0:
-        for var in allList[5]:
-            translatedText = translatedText.replace('[FCode_' + str(count) + ']', var)
-            count += 1
+def translateSpeakerList(speakerList, pbar):
+    response = translateGPT(speakerList, 'Reply with only the '+ LANGUAGE +' translation of the NPC names.', True, pbar, 'Speakers')
+    return [[name.title().replace("'S", "'s") for name in response[0]], response[1]]
 
-    return translatedText
+def subVars(jaString):
+    return codes.subVars(jaString, codes.SQUARE)
 
-def batchList(input_list, batch_size):
-    if not isinstance(batch_size, int) or batch_size <= 0:
-        raise ValueError("batch_size must be a positive integer")
-        
-    return [input_list[i:i + batch_size] for i in range(0, len(input_list), batch_size)]
+def resubVars(translatedText, allList):
+    return codes.resubVars(translatedText, allList, codes.SQUARE)
 
 def createContext(fullPromptFlag, subbedT):
     characters = 'Game Characters:\n\
@@ -1148,7 +1059,7 @@ def translateText(characters, system, user, history):
     
     # Content to TL
     msg.append({"role": "user", "content": f'{user}'})
-    response = openai.chat.completions.create(
+    response = api.chatCompletion(
         temperature=0.1,
         frequency_penalty=0.1,
         model=MODEL,
@@ -1224,13 +1135,20 @@ def combineList(tlist, text):
         return [t for sublist in tlist for t in sublist]
     return tlist[0]
 
-@retry(exceptions=Exception, tries=5, delay=5)
 def translateGPT(text, history, fullPromptFlag, pbar, filename):
     mismatch = False
     totalTokens = [0, 0]
+
+    # Translation Memory
+    characters, system, user = createContext(fullPromptFlag, '')
+    cacheContext = cache.getContext(MODEL, system, characters, history)
     if isinstance(text, list):
-        tList = batchList(text, BATCHSIZE)
+        cachedList = cache.lookupList(cacheContext, text, subVars)
+        tList = batching.packBatches(cache.getMisses(text, cachedList), MODEL, BATCHSIZE, subVars)
     else:
+        cachedText = cache.lookup(cacheContext, text, subVars)
+        if cachedText is not None:
+            return [cachedText, totalTokens]
         tList = [text]
 
     for index, tItem in enumerate(tList):
@@ -1290,11 +1208,20 @@ def translateGPT(text, history, fullPromptFlag, pbar, filename):
             history = tList[index]  # Update history if we have a list
             pbar.update(len(tList[index]))
 
+
+            # Translation Memory
+            if len(tItem) == len(extractedTranslations):
+                cache.storeList(cacheContext, tItem, extractedTranslations, subVars)
+            else:
+                metrics.increment('mismatches')
         else:
             # Ensure we're passing a single string to extractTranslation
             extractedTranslations = extractTranslation(translatedText, False)
             tList[index] = extractedTranslations
+            cache.store(cacheContext, tItem, extractedTranslations, subVars)
             pbar.update(1)
 
     finalList = combineList(tList, text)
+    if isinstance(text, list):
+        finalList = cache.mergeList(cachedList, finalList)
     return [finalList, totalTokens]
@@ -1,3 +1,4 @@
+import sys
 from modules.main import main
 
-main()
+sys.exit(main())